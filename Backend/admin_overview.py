@@ -0,0 +1,117 @@
+import os
+import time
+import threading
+from datetime import datetime
+
+from db import (
+    employee_read_collection,
+    expenses_read_collection,
+    expense_type_collection,
+    payment_mode_collection,
+    user_groups_read_collection
+)
+
+# Numbers for the admin landing page in a handful of queries instead of five
+# full list endpoints. Expenses are read with one $facet aggregation behind an
+# indexed $match on the month; the small reference collections use
+# countDocuments. The result is memoized for ADMIN_OVERVIEW_TTL_SECONDS per
+# worker, and only one request recomputes it when it expires.
+
+OVERVIEW_TTL_SECONDS = int(os.getenv("ADMIN_OVERVIEW_TTL_SECONDS", "30"))
+TOP_N = 5
+
+_cache = {"at": 0.0, "value": None}
+_lock = threading.Lock()
+
+def _active_counts(collection, field: str) -> dict:
+    """ Missing flags count as active, like the rest of the API treats them """
+    total = collection.count_documents({})
+    inactive = collection.count_documents({field: False})
+    return {"total": total, "active": total - inactive, "inactive": inactive}
+
+def _month_facets(month_start: str, next_month_start: str) -> dict:
+    """ This month's totals, top spenders and spend by type in one aggregation """
+    pipeline = [
+        # Bounded above too: expenses can be dated in a later month
+        {"$match": {"date": {"$gte": month_start, "$lt": next_month_start}}},
+        {"$facet": {
+            "totals": [
+                {"$group": {"_id": None, "count": {"$sum": 1}, "amount": {"$sum": "$amount"}}}
+            ],
+            "topSpenders": [
+                {"$group": {"_id": "$userEmail", "amount": {"$sum": "$amount"}, "count": {"$sum": 1}}},
+                {"$sort": {"amount": -1}},
+                {"$limit": TOP_N}
+            ],
+            "byType": [
+                {"$group": {"_id": "$expenseTypeId", "amount": {"$sum": "$amount"}, "count": {"$sum": 1}}},
+                {"$sort": {"amount": -1}}
+            ],
+        }}
+    ]
+    return next(expenses_read_collection.aggregate(pipeline), {"totals": [], "topSpenders": [], "byType": []})
+
+def build_overview() -> dict:
+    now = datetime.now()
+    month_start = now.strftime("%Y-%m-01")
+    next_month_start = f"{now.year + 1}-01-01" if now.month == 12 else f"{now.year}-{now.month + 1:02d}-01"
+    facets = _month_facets(month_start, next_month_start)
+
+    totals = facets["totals"][0] if facets["totals"] else {"count": 0, "amount": 0}
+    spender_emails = [row["_id"] for row in facets["topSpenders"]]
+    names = {
+        e["Email"]: e.get("EmployeeName")
+        for e in employee_read_collection.find({"Email": {"$in": spender_emails}}, {"Email": 1, "EmployeeName": 1})
+    }
+    type_names = {
+        str(t["_id"]): t.get("ExpenseTypeName")
+        for t in expense_type_collection.find({}, {"ExpenseTypeName": 1})
+    }
+
+    return {
+        "employees": _active_counts(employee_read_collection, "isActive"),
+        "userGroups": _active_counts(user_groups_read_collection, "isActive"),
+        "expenseTypes": _active_counts(expense_type_collection, "IsActive"),
+        "paymentModes": _active_counts(payment_mode_collection, "isActive"),
+        "expensesThisMonth": {
+            "from": month_start,
+            "count": totals["count"],
+            "amount": round(totals["amount"] or 0, 2),
+        },
+        "topSpenders": [
+            {
+                "userEmail": row["_id"],
+                "employeeName": names.get(row["_id"]),
+                "amount": round(row["amount"] or 0, 2),
+                "count": row["count"],
+            }
+            for row in facets["topSpenders"]
+        ],
+        "spendByType": [
+            {
+                "expenseTypeId": row["_id"],
+                "expenseTypeName": type_names.get(row["_id"]),
+                "amount": round(row["amount"] or 0, 2),
+                "count": row["count"],
+            }
+            for row in facets["byType"]
+        ],
+        # Indexed counts over the hot collection
+        "bills": {
+            "missing": expenses_read_collection.count_documents({"billAvailable": False}),
+            "availableWithoutAttachment": expenses_read_collection.count_documents(
+                {"billAvailable": True, "attachments.0": {"$exists": False}}
+            ),
+        },
+        "generatedAt": datetime.utcnow(),
+    }
+
+def get_overview(refresh: bool = False) -> dict:
+    if not refresh and _cache["value"] is not None and time.monotonic() - _cache["at"] < OVERVIEW_TTL_SECONDS:
+        return _cache["value"]
+    with _lock:
+        # Whoever waited on the lock gets the value the first request computed
+        if refresh or _cache["value"] is None or time.monotonic() - _cache["at"] >= OVERVIEW_TTL_SECONDS:
+            _cache["value"] = build_overview()
+            _cache["at"] = time.monotonic()
+        return _cache["value"]
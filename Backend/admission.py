@@ -0,0 +1,225 @@
+import os
+import json
+import math
+import time
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+from pymongo import ReturnDocument
+from starlette.routing import Match
+
+from metrics import ADMISSION_REJECTIONS
+
+# Admission control for the expensive endpoints: bcrypt logins, OTP emails and
+# Drive uploads. Each policy bounds how many requests of that route run at once
+# in this worker (plus a short wait queue) and rate limits them per client IP
+# and, where the body carries one, per email. Excess load is turned away with
+# 429 / 503 + Retry-After before it reaches the endpoint, so cheap routes keep
+# their latency. Buckets live in memory, or in Mongo with RATE_LIMIT_BACKEND=mongo
+# so all workers share them.
+
+# "METHOD /route/template": concurrency, queue (waiters), timeout (s waiting for a slot),
+# per_client / per_email: [requests, per seconds]
+POLICIES = {
+    "POST /employee/login": {
+        "concurrency": 8, "queue": 32, "timeout": 2.0, "per_client": [20, 60], "per_email": [5, 60]
+    },
+    "POST /employee/forgot-password/request": {
+        "concurrency": 4, "queue": 16, "timeout": 2.0, "per_client": [5, 60], "per_email": [3, 600]
+    },
+    "POST /expense/create": {
+        "concurrency": 4, "queue": 16, "timeout": 10.0, "per_client": [60, 60]
+    },
+    "PUT /expense/update/{expense_id}": {
+        "concurrency": 4, "queue": 16, "timeout": 10.0, "per_client": [60, 60]
+    },
+    "POST /uploads": {
+        "concurrency": 4, "queue": 16, "timeout": 10.0, "per_client": [60, 60]
+    },
+    "PATCH /uploads/{upload_id}": {
+        "concurrency": 8, "queue": 32, "timeout": 10.0, "per_client": [600, 60]
+    },
+}
+# e.g. ADMISSION_POLICIES='{"POST /employee/login": {"concurrency": 16}}'
+for _key, _override in json.loads(os.getenv("ADMISSION_POLICIES", "{}")).items():
+    POLICIES.setdefault(_key, {}).update(_override)
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+MAX_MEMORY_BUCKETS = 100000
+MAX_BODY_FOR_EMAIL = 64 * 1024
+
+# ---------------- TOKEN BUCKETS ----------------
+class MemoryBuckets:
+    """ Per worker buckets; oldest keys are dropped past MAX_MEMORY_BUCKETS """
+    def __init__(self):
+        self._buckets = OrderedDict()
+
+    async def take(self, key: str, capacity: float, rate: float):
+        """ Returns seconds to wait before retrying, 0 when the request is allowed """
+        now = time.monotonic()
+        tokens, last = self._buckets.pop(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - last) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > MAX_MEMORY_BUCKETS:
+            self._buckets.popitem(last=False)
+        return 0 if allowed else (1 - tokens) / rate
+
+class MongoBuckets:
+    """ Shared buckets, refilled and consumed in one pipeline update (MongoDB 4.2+) """
+    def __init__(self):
+        from db import rate_limits_collection
+        self.collection = rate_limits_collection
+
+    def _take(self, key: str, capacity: float, rate: float):
+        now = datetime.utcnow()
+        refilled = {"$min": [capacity, {"$add": [
+            {"$ifNull": ["$tokens", capacity]},
+            {"$multiply": [{"$divide": [{"$subtract": [now, {"$ifNull": ["$updatedAt", now]}]}, 1000]}, rate]}
+        ]}]}
+        bucket = self.collection.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "updatedAt": now}},
+                {"$set": {"allowed": {"$gte": ["$tokens", 1]}}},
+                {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", 1]}, "$tokens"]}}},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return 0 if bucket["allowed"] else (1 - bucket["tokens"]) / rate
+
+    async def take(self, key: str, capacity: float, rate: float):
+        try:
+            return await asyncio.to_thread(self._take, key, capacity, rate)
+        except Exception as e:
+            # Rate limiting must not take the API down with it
+            print(f"Rate limit check failed for {key}: {e}")
+            return 0
+
+# ---------------- MIDDLEWARE ----------------
+class _RouteGate:
+    def __init__(self, route, policy: dict):
+        self.route = route
+        self.policy = policy
+        self.slots = asyncio.Semaphore(policy.get("concurrency", 8))
+        self.waiting = 0
+
+async def _send_rejection(send, status: int, retry_after: float, detail: str):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+async def _read_body(receive):
+    chunks, more = [], True
+    while more:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        more = message.get("more_body", False)
+    return b"".join(chunks)
+
+def _replay(body: bytes, receive):
+    """ Hands the already-read body to the app, then falls back to the real channel """
+    pending = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def replay_receive():
+        return pending.pop() if pending else await receive()
+    return replay_receive
+
+def _email_from_body(body: bytes):
+    if len(body) > MAX_BODY_FOR_EMAIL:
+        return None
+    try:
+        email = json.loads(body).get("Email")
+    except (ValueError, AttributeError):
+        return None
+    return email.strip().lower() if isinstance(email, str) else None
+
+class AdmissionMiddleware:
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes          # app.routes, resolved on the first request
+        self.gates = None
+        self.buckets = MongoBuckets() if RATE_LIMIT_BACKEND == "mongo" else MemoryBuckets()
+
+    def _resolve(self):
+        self.gates = []
+        for key, policy in POLICIES.items():
+            method, path = key.split(" ", 1)
+            for route in self.routes:
+                if getattr(route, "path", None) == path and method in getattr(route, "methods", ()):
+                    self.gates.append(_RouteGate(route, policy))
+
+    def _gate_for(self, scope):
+        for gate in self.gates:
+            match, child_scope = gate.route.matches(scope)
+            if match == Match.FULL:
+                return gate
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self.gates is None:
+            self._resolve()
+        gate = self._gate_for(scope)
+        if gate is None:
+            await self.app(scope, receive, send)
+            return
+
+        # Lets metrics label rejected requests with their route
+        scope["route"] = gate.route
+        route_label = gate.route.path
+        policy = gate.policy
+
+        # 1. Rate limits (per client IP, then per email in the JSON body)
+        client = (scope.get("client") or ("unknown",))[0]
+        checks = []
+        if "per_client" in policy:
+            checks.append((f"ip:{client}", policy["per_client"]))
+        if "per_email" in policy:
+            body = await _read_body(receive)
+            receive = _replay(body, receive)
+
+            email = _email_from_body(body)
+            if email:
+                checks.append((f"email:{email}", policy["per_email"]))
+
+        for subject, (limit, per_seconds) in checks:
+            retry_after = await self.buckets.take(f"{route_label}|{subject}", limit, limit / per_seconds)
+            if retry_after:
+                ADMISSION_REJECTIONS.labels(route_label, "rate_limited").inc()
+                await _send_rejection(send, 429, retry_after, "Too many requests, try again later")
+                return
+
+        # 2. Concurrency: wait briefly for a slot, shed when the queue is full
+        if gate.slots.locked() and gate.waiting >= policy.get("queue", 0):
+            ADMISSION_REJECTIONS.labels(route_label, "queue_full").inc()
+            await _send_rejection(send, 503, 1, "Server busy, try again shortly")
+            return
+
+        gate.waiting += 1
+        try:
+            await asyncio.wait_for(gate.slots.acquire(), timeout=policy.get("timeout", 2.0))
+        except asyncio.TimeoutError:
+            ADMISSION_REJECTIONS.labels(route_label, "queue_timeout").inc()
+            await _send_rejection(send, 503, policy.get("timeout", 2.0), "Server busy, try again shortly")
+            return
+        finally:
+            gate.waiting -= 1
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.slots.release()
@@ -0,0 +1,317 @@
+import os
+import sys
+import time
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+
+from db import expenses_read_collection, expense_tombstones_collection, TOMBSTONE_RETENTION
+from archive import read_tiers
+
+# In-memory columnar copy of the expenses for ad-hoc slicing (/analytics/query).
+# Categorical fields are dictionary encoded (int32 codes + value list), so
+# filters are np.isin over codes and group-bys are bincounts over a combined
+# key. The store is loaded once per worker and then refreshed incrementally:
+# documents whose updatedAt moved since the last refresh are re-read and
+# deletes are applied from ExpenseTombstones.
+
+CATEGORICAL_FIELDS = ("userEmail", "expenseTypeId", "paymentMode", "location")
+GROUP_FIELDS = CATEGORICAL_FIELDS + ("month", "billAvailable")
+PERCENTILES = {"p50": 0.50, "p75": 0.75, "p90": 0.90, "p95": 0.95, "p99": 0.99}
+METRICS = ("count", "sum", "avg", "min", "max") + tuple(PERCENTILES)
+
+# Serve queries from data at most this old; older data triggers a refresh first
+MAX_STALENESS = timedelta(seconds=int(os.getenv("ANALYTICS_MAX_STALENESS_SECONDS", "15")))
+# Overlap when re-reading by updatedAt: covers clock differences between app and server
+CLOCK_SKEW = timedelta(minutes=2)
+MAX_RESULT_ROWS = 10000
+
+PROJECTION = {field: 1 for field in CATEGORICAL_FIELDS + ("amount", "date", "billAvailable")}
+
+class _Dictionary:
+    """ value <-> int32 code for one categorical column """
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, value) -> int:
+        value = "" if value is None else str(value)
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def lookup(self, values) -> np.ndarray:
+        """ Codes of the given values; unknown values are skipped """
+        return np.array([self.codes[v] for v in values if v in self.codes], dtype=np.int32)
+
+    def nbytes(self) -> int:
+        return sys.getsizeof(self.values) + sys.getsizeof(self.codes) + sum(sys.getsizeof(v) for v in self.values)
+
+def _month_code(date) -> int:
+    """ 'YYYY-MM-...' -> year * 12 + month - 1, -1 when unparseable """
+    if isinstance(date, datetime):
+        return date.year * 12 + date.month - 1
+    try:
+        return int(date[0:4]) * 12 + int(date[5:7]) - 1
+    except (TypeError, ValueError):
+        return -1
+
+def _month_label(code: int):
+    return f"{code // 12:04d}-{code % 12 + 1:02d}" if code >= 0 else None
+
+class ExpenseColumns:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        capacity = 1024
+        self.size = 0
+        self.amount = np.zeros(capacity, dtype=np.float64)
+        self.month = np.full(capacity, -1, dtype=np.int32)
+        self.bill = np.zeros(capacity, dtype=np.bool_)
+        self.alive = np.zeros(capacity, dtype=np.bool_)
+        self.codes = {field: np.zeros(capacity, dtype=np.int32) for field in CATEGORICAL_FIELDS}
+        self.dicts = {field: _Dictionary() for field in CATEGORICAL_FIELDS}
+        self.row_of = {}
+        self.watermark = None
+        self.loaded_at = None
+        self.refreshed_at = None
+        self.last_refresh = {}
+
+    # ---------------- LOADING ----------------
+    def _columns(self):
+        return [self.amount, self.month, self.bill, self.alive] + list(self.codes.values())
+
+    def _grow(self):
+        capacity = len(self.amount) * 2
+        self.amount = np.resize(self.amount, capacity)
+        self.month = np.resize(self.month, capacity)
+        self.bill = np.resize(self.bill, capacity)
+        self.alive = np.resize(self.alive, capacity)
+        self.alive[self.size:] = False
+        self.codes = {field: np.resize(col, capacity) for field, col in self.codes.items()}
+
+    def _upsert(self, doc: dict):
+        key = str(doc["_id"])
+        row = self.row_of.get(key)
+        if row is None:
+            if self.size == len(self.amount):
+                self._grow()
+            row = self.size
+            self.size += 1
+            self.row_of[key] = row
+        try:
+            self.amount[row] = float(doc.get("amount") or 0)
+        except (TypeError, ValueError):
+            self.amount[row] = 0.0
+        self.month[row] = _month_code(doc.get("date"))
+        self.bill[row] = bool(doc.get("billAvailable"))
+        self.alive[row] = True
+        for field in CATEGORICAL_FIELDS:
+            self.codes[field][row] = self.dicts[field].encode(doc.get(field))
+
+    def _delete(self, expense_id):
+        row = self.row_of.pop(str(expense_id), None)
+        if row is not None:
+            self.alive[row] = False
+
+    def _compact(self):
+        """ Drops deleted rows once they are a quarter of the store """
+        dead = self.size - len(self.row_of)
+        if dead < 1000 or dead * 4 < self.size:
+            return
+        keep = np.nonzero(self.alive[:self.size])[0]
+        new_row = np.full(self.size, -1, dtype=np.int64)
+        new_row[keep] = np.arange(len(keep))
+        self.amount[:len(keep)] = self.amount[keep]
+        self.month[:len(keep)] = self.month[keep]
+        self.bill[:len(keep)] = self.bill[keep]
+        for field, col in self.codes.items():
+            col[:len(keep)] = col[keep]
+        self.alive[:len(keep)] = True
+        self.alive[len(keep):] = False
+        self.row_of = {key: int(new_row[row]) for key, row in self.row_of.items()}
+        self.size = len(keep)
+
+    def refresh(self, full: bool = False) -> dict:
+        with self._lock:
+            start = time.perf_counter()
+            started_at = datetime.utcnow()
+            # Tombstones expire; a store older than that could miss deletes
+            if full or self.watermark is None or started_at - self.loaded_at > TOMBSTONE_RETENTION / 2:
+                self._reset()
+                full = True
+                self.loaded_at = started_at
+
+            since = None if full else self.watermark - CLOCK_SKEW
+            query = {} if full else {"updatedAt": {"$gte": since}}
+            changed = 0
+            # Archived expenses never change, so only a full load reads them
+            for tier in read_tiers() if full else [expenses_read_collection]:
+                for doc in tier.find(query, PROJECTION, batch_size=5000):
+                    self._upsert(doc)
+                    changed += 1
+
+            deleted = 0
+            if not full:
+                for tomb in expense_tombstones_collection.find({"deletedAt": {"$gte": since}}, {"expenseId": 1}):
+                    self._delete(tomb["expenseId"])
+                    deleted += 1
+            self._compact()
+
+            self.watermark = started_at
+            self.refreshed_at = started_at
+            self.last_refresh = {
+                "full": full,
+                "changedDocuments": changed,
+                "tombstonesApplied": deleted,
+                "tookMs": round((time.perf_counter() - start) * 1000, 1),
+                "at": started_at.isoformat(),
+            }
+            return self.last_refresh
+
+    def ensure_fresh(self):
+        if self.refreshed_at is None or datetime.utcnow() - self.refreshed_at > MAX_STALENESS:
+            self.refresh()
+
+    # ---------------- QUERYING ----------------
+    def _filter_mask(self, filters: dict) -> np.ndarray:
+        n = self.size
+        mask = self.alive[:n].copy()
+        for field, wanted in filters.items():
+            if field in CATEGORICAL_FIELDS:
+                values = [wanted] if isinstance(wanted, str) else list(wanted)
+                mask &= np.isin(self.codes[field][:n], self.dicts[field].lookup(values))
+            elif field == "month":
+                if isinstance(wanted, dict):
+                    low = _month_code(wanted.get("from", "0000-01"))
+                    high = _month_code(wanted.get("to", "9999-12"))
+                    if low < 0 or high < 0:
+                        raise ValueError("month filter expects YYYY-MM values")
+                    mask &= (self.month[:n] >= low) & (self.month[:n] <= high)
+                else:
+                    months = [wanted] if isinstance(wanted, str) else list(wanted)
+                    mask &= np.isin(self.month[:n], [_month_code(m) for m in months])
+            elif field == "billAvailable":
+                mask &= self.bill[:n] == bool(wanted)
+            elif field == "amount":
+                if "min" in wanted:
+                    mask &= self.amount[:n] >= float(wanted["min"])
+                if "max" in wanted:
+                    mask &= self.amount[:n] <= float(wanted["max"])
+            else:
+                raise ValueError(f"Unknown filter field: {field}")
+        return mask
+
+    def _group_column(self, field: str, rows: np.ndarray) -> np.ndarray:
+        if field in CATEGORICAL_FIELDS:
+            return self.codes[field][rows]
+        if field == "month":
+            return self.month[rows]
+        return self.bill[rows].astype(np.int32)
+
+    def _group_value(self, field: str, row: int):
+        if field in CATEGORICAL_FIELDS:
+            return self.dicts[field].values[self.codes[field][row]]
+        if field == "month":
+            return _month_label(int(self.month[row]))
+        return bool(self.bill[row])
+
+    def query(self, filters: dict, group_by: list, metrics: list, order_by: str = None, limit: int = 100) -> dict:
+        """ order_by is a requested metric or groupBy field, "-field" for descending """
+        for field in group_by:
+            if field not in GROUP_FIELDS:
+                raise ValueError(f"Cannot group by {field}; use one of {', '.join(GROUP_FIELDS)}")
+        for metric in metrics:
+            if metric not in METRICS:
+                raise ValueError(f"Unknown metric {metric}; use one of {', '.join(METRICS)}")
+        descending = bool(order_by) and order_by.startswith("-")
+        order_field = order_by[1:] if descending else order_by
+        if order_field and order_field not in metrics and order_field not in group_by:
+            raise ValueError("orderBy must be one of the requested metrics or groupBy fields, optionally prefixed with -")
+
+        self.ensure_fresh()
+        start = time.perf_counter()
+        with self._lock:
+            rows = np.nonzero(self._filter_mask(filters))[0]
+            amounts = self.amount[rows]
+
+            # Combined group key, re-densified after every field so it cannot overflow
+            key = np.zeros(len(rows), dtype=np.int64)
+            for field in group_by:
+                _, dense = np.unique(self._group_column(field, rows), return_inverse=True)
+                dense = dense.reshape(-1).astype(np.int64)
+                _, key = np.unique(key * (int(dense.max()) + 1 if len(dense) else 1) + dense, return_inverse=True)
+                key = key.reshape(-1).astype(np.int64)
+            _, first, groups = np.unique(key, return_index=True, return_inverse=True)
+            groups = groups.reshape(-1)
+            group_count = len(first)
+
+            counts = np.bincount(groups, minlength=group_count)
+            sums = np.bincount(groups, weights=amounts, minlength=group_count)
+            result = {"count": counts, "sum": sums}
+            if "avg" in metrics:
+                result["avg"] = sums / np.maximum(counts, 1)
+            if any(m in metrics for m in ("min", "max") + tuple(PERCENTILES)):
+                # Sort by (group, amount): every group becomes a sorted slice
+                order = np.lexsort((amounts, groups))
+                sorted_amounts = amounts[order]
+                starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+                if "min" in metrics:
+                    result["min"] = sorted_amounts[starts] if group_count else np.array([])
+                if "max" in metrics:
+                    result["max"] = sorted_amounts[starts + counts - 1] if group_count else np.array([])
+                for name, q in PERCENTILES.items():
+                    if name in metrics and group_count:
+                        position = starts + q * (counts - 1)
+                        low = np.floor(position).astype(np.int64)
+                        high = np.ceil(position).astype(np.int64)
+                        result[name] = sorted_amounts[low] + (sorted_amounts[high] - sorted_amounts[low]) * (position - low)
+
+            out = []
+            for g in range(group_count):
+                row = int(rows[first[g]])
+                item = {field: self._group_value(field, row) for field in group_by}
+                for metric in metrics:
+                    value = result[metric][g]
+                    item[metric] = int(value) if metric == "count" else round(float(value), 2)
+                out.append(item)
+
+        if order_field:
+            # Groups without a value go last in either direction
+            valued = [item for item in out if item[order_field] is not None]
+            valued.sort(key=lambda item: item[order_field], reverse=descending)
+            out = valued + [item for item in out if item[order_field] is None]
+        return {
+            "rows": out[:min(limit, MAX_RESULT_ROWS)],
+            "groups": len(out),
+            "matchedExpenses": int(len(rows)),
+            "tookMs": round((time.perf_counter() - start) * 1000, 2),
+            "dataAsOf": self.refreshed_at.isoformat() if self.refreshed_at else None,
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            column_bytes = sum(col.nbytes for col in self._columns())
+            dictionary_bytes = sum(d.nbytes() for d in self.dicts.values())
+            index_bytes = sys.getsizeof(self.row_of) + sum(sys.getsizeof(k) for k in self.row_of)
+            return {
+                "rows": self.size,
+                "liveRows": len(self.row_of),
+                "capacity": len(self.amount),
+                "cardinality": {field: len(d.values) for field, d in self.dicts.items()},
+                "memoryBytes": {
+                    "columns": column_bytes,
+                    "dictionaries": dictionary_bytes,
+                    "idIndex": index_bytes,
+                    "total": column_bytes + dictionary_bytes + index_bytes,
+                },
+                "loadedAt": self.loaded_at.isoformat() if self.loaded_at else None,
+                "lastRefresh": self.last_refresh,
+            }
+
+expense_columns = ExpenseColumns()
@@ -0,0 +1,181 @@
+import os
+import time
+from datetime import datetime, date, timedelta
+from pymongo import ReplaceOne, DeleteOne
+
+from db import (
+    db,
+    expenses_collection,
+    expenses_read_collection,
+    expense_tombstones_collection,
+    LazyCollection,
+    READ_ONLY_PREFERENCE
+)
+
+# Hot / cold tiers. Expenses dated more than ARCHIVE_AFTER_DAYS ago are moved
+# out of ExpensesCollection into one collection per year (ExpensesArchive_2023,
+# ...), which keeps the hot collection and its indexes small. Archived
+# expenses are read-only. Readers that accept a date range only touch the
+# archive years the range reaches; without a range they read every tier.
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "730"))
+ARCHIVE_PREFIX = "ExpensesArchive_"
+ARCHIVE_BATCH = 1000
+YEARS_CACHE_SECONDS = 60
+
+_years_cache = {"at": 0.0, "years": []}
+
+# ---------------- TIERS ----------------
+def archive_collection(year: int, for_reads: bool = False) -> LazyCollection:
+    return LazyCollection(f"{ARCHIVE_PREFIX}{year}", READ_ONLY_PREFERENCE if for_reads else None)
+
+def archive_years(refresh: bool = False) -> list:
+    """ Years that have an archive collection (cached briefly) """
+    if refresh or time.monotonic() - _years_cache["at"] > YEARS_CACHE_SECONDS:
+        names = db.list_collection_names(filter={"name": {"$regex": f"^{ARCHIVE_PREFIX}\\d{{4}}$"}})
+        _years_cache["years"] = sorted(int(name[len(ARCHIVE_PREFIX):]) for name in names)
+        _years_cache["at"] = time.monotonic()
+    return _years_cache["years"]
+
+def archive_cutoff() -> str:
+    """ Expenses dated before this day are archived """
+    return (datetime.utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS)).date().isoformat()
+
+def expense_year(value):
+    if isinstance(value, (datetime, date)):
+        return value.year
+    try:
+        return int(value[0:4])
+    except (TypeError, ValueError):
+        return None
+
+def parse_day(value: str, name: str) -> date:
+    try:
+        return date.fromisoformat(value[0:10])
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be YYYY-MM-DD")
+
+def date_range_filter(date_from: str = None, date_to: str = None) -> dict:
+    """ Expense dates are 'YYYY-MM-DDTHH:MM' strings; date_to includes the whole day """
+    bounds = {}
+    if date_from:
+        bounds["$gte"] = parse_day(date_from, "dateFrom").isoformat()
+    if date_to:
+        bounds["$lt"] = (parse_day(date_to, "dateTo") + timedelta(days=1)).isoformat()
+    return {"date": bounds} if bounds else {}
+
+def read_tiers(date_from: str = None, date_to: str = None) -> list:
+    """ Hot collection first, then the archive years the range reaches """
+    year_from = parse_day(date_from, "dateFrom").year if date_from else None
+    year_to = parse_day(date_to, "dateTo").year if date_to else None
+    tiers = [expenses_read_collection]
+    for year in archive_years():
+        if (year_from is None or year >= year_from) and (year_to is None or year <= year_to):
+            tiers.append(archive_collection(year, for_reads=True))
+    return tiers
+
+def find_across_tiers(query: dict, projection=None, date_from: str = None, date_to: str = None):
+    """
+    Streams matching expenses from every tier in range. An expense caught
+    mid-move can be in two tiers; the hot copy wins.
+    """
+    seen = set()
+    for tier in read_tiers(date_from, date_to):
+        for doc in tier.find(query, projection):
+            if doc["_id"] not in seen:
+                seen.add(doc["_id"])
+                yield doc
+
+def find_archived(expense_id):
+    for year in archive_years():
+        doc = archive_collection(year).find_one({"_id": expense_id}, {"_id": 1})
+        if doc:
+            return year
+    return None
+
+# ---------------- ARCHIVAL JOB ----------------
+def ensure_archive_indexes(year: int):
+    """ Archives serve the same list / search queries as the hot collection """
+    from search_utils import TEXT_SEARCH_WEIGHTS
+
+    collection = archive_collection(year)
+    collection.create_index(
+        [(field, "text") for field in TEXT_SEARCH_WEIGHTS],
+        name="expense_text_search",
+        weights=TEXT_SEARCH_WEIGHTS,
+        default_language="none"
+    )
+    collection.create_index("userEmail")
+    collection.create_index("date")
+    collection.create_index("carNumberNorm")
+    collection.create_index("carNumberGrams")
+    collection.create_index("attachments.id")
+
+def archive_old_expenses(batch_size: int = ARCHIVE_BATCH) -> dict:
+    """
+    Copies old expenses to their year's archive, then deletes them from the hot
+    collection if they did not change in between. Safe to re-run after a crash:
+    copies are upserts and a half-moved expense is read from the hot tier.
+    """
+    cutoff = archive_cutoff()
+    cutoff_dt = datetime.fromisoformat(cutoff)
+    query = {"$or": [
+        {"date": {"$gte": "1900", "$lt": cutoff}},          # 'YYYY-MM-DD...' strings
+        {"date": {"$type": "date", "$lt": cutoff_dt}},
+    ]}
+
+    moved, kept, years = 0, 0, set()
+    indexed = set()
+    last_id = None
+    while True:
+        page_query = query if last_id is None else {"$and": [query, {"_id": {"$gt": last_id}}]}
+        batch = list(expenses_collection.find(page_query).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+
+        by_year = {}
+        for doc in batch:
+            by_year.setdefault(expense_year(doc.get("date")), []).append(doc)
+
+        for year, docs in by_year.items():
+            if year not in indexed:
+                ensure_archive_indexes(year)
+                indexed.add(year)
+            archive_collection(year).bulk_write(
+                [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in docs], ordered=False
+            )
+            years.add(year)
+
+        # Only remove what is unchanged since it was copied
+        result = expenses_collection.bulk_write(
+            [DeleteOne({"_id": doc["_id"], "updatedAt": doc.get("updatedAt")}) for doc in batch], ordered=False
+        )
+        moved += result.deleted_count
+        if result.deleted_count < len(batch):
+            # Edited meanwhile: drop the stale copies, the next run archives them again.
+            # Deleted meanwhile: drop the copies for good.
+            batch_ids = [doc["_id"] for doc in batch]
+            still_hot = {doc["_id"] for doc in expenses_collection.find({"_id": {"$in": batch_ids}}, {"_id": 1})}
+            deleted = {tomb["expenseId"] for tomb in expense_tombstones_collection.find(
+                {"expenseId": {"$in": batch_ids}}, {"expenseId": 1}
+            )}
+            for year, docs in by_year.items():
+                stale = [doc["_id"] for doc in docs if doc["_id"] in still_hot or doc["_id"] in deleted]
+                if stale:
+                    archive_collection(year).delete_many({"_id": {"$in": stale}})
+            kept += len(still_hot)
+
+    archive_years(refresh=True)
+    result = {"cutoff": cutoff, "archived": moved, "changedDuringMove": kept, "years": sorted(years)}
+    print(f"[archive] {result}")
+    return result
+
+def archive_status() -> dict:
+    tiers = [{"tier": "hot", "collection": expenses_collection.name,
+              "expenses": expenses_read_collection.estimated_document_count()}]
+    for year in archive_years(refresh=True):
+        collection = archive_collection(year, for_reads=True)
+        tiers.append({"tier": str(year), "collection": collection.name,
+                      "expenses": collection.estimated_document_count()})
+    return {"archiveAfterDays": ARCHIVE_AFTER_DAYS, "cutoff": archive_cutoff(), "tiers": tiers}
@@ -0,0 +1,129 @@
+import os
+import io
+import time
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+# Optional compaction of attachments before they go to Drive
+# (ATTACHMENT_PROCESSING=1). Phone photos are downscaled to
+# ATTACHMENT_MAX_DIMENSION, re-encoded as JPEG and stripped of EXIF / GPS
+# metadata (multi-page images are left alone); PDFs get compressed object
+# streams and are linearized. It runs in a process pool so request threads
+# and the event loop are not held by Pillow / qpdf. Anything that fails or
+# does not get smaller is uploaded as is.
+
+PROCESSING_ENABLED = os.getenv("ATTACHMENT_PROCESSING", "0") == "1"
+KEEP_ORIGINAL = os.getenv("ATTACHMENT_KEEP_ORIGINAL", "0") == "1"
+MAX_DIMENSION = int(os.getenv("ATTACHMENT_MAX_DIMENSION", "2048"))
+JPEG_QUALITY = int(os.getenv("ATTACHMENT_JPEG_QUALITY", "80"))
+PROCESS_WORKERS = int(os.getenv("ATTACHMENT_PROCESS_WORKERS", "2"))
+# Bigger files are uploaded untouched rather than held in a worker
+MAX_PROCESS_BYTES = 50 * 1024 * 1024
+
+IMAGE_TYPES = {"image/jpeg", "image/jpg", "image/png", "image/webp", "image/bmp", "image/tiff"}
+PDF_TYPES = {"application/pdf"}
+
+_pool = None
+_pool_pid = None
+
+# ---------------- WORKERS (run in the pool) ----------------
+def _process_image(content: bytes):
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(content)) as image:
+        # Multi-page TIFF scans (and animations) would keep only their first frame as a JPEG
+        if getattr(image, "n_frames", 1) > 1:
+            return None, None, None
+        # JPEG decoders can scale down while decoding, much cheaper for 12 MP photos
+        image.draft("RGB", (MAX_DIMENSION, MAX_DIMENSION))
+        # Orientation lives in the EXIF that is about to be dropped
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((MAX_DIMENSION, MAX_DIMENSION), Image.LANCZOS)
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            flattened = Image.new("RGB", image.size, (255, 255, 255))
+            flattened.paste(image, mask=image.split()[-1])
+            image = flattened
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        out = io.BytesIO()
+        image.save(out, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return out.getvalue(), "image/jpeg", ".jpg"
+
+def _process_pdf(content: bytes):
+    import pikepdf
+
+    with pikepdf.open(io.BytesIO(content)) as pdf:
+        pdf.remove_unreferenced_resources()
+        # Like the EXIF of images: drop the document info and XMP metadata
+        if "/Metadata" in pdf.Root:
+            del pdf.Root.Metadata
+        if "/Info" in pdf.trailer:
+            del pdf.trailer.Info
+        out = io.BytesIO()
+        pdf.save(
+            out,
+            linearize=True,
+            compress_streams=True,
+            object_stream_mode=pikepdf.ObjectStreamMode.generate,
+            recompress_flate=True
+        )
+    return out.getvalue(), "application/pdf", ".pdf"
+
+def process_attachment(content: bytes, content_type: str, filename: str) -> dict:
+    """ Returns the bytes to store plus a report; the original comes back when nothing was gained """
+    start = time.perf_counter()
+    content_type = (content_type or "").lower()
+    result = {"content": content, "contentType": content_type, "filename": filename, "action": "unchanged"}
+    try:
+        if content_type in IMAGE_TYPES:
+            processed, new_type, extension = _process_image(content)
+        elif content_type in PDF_TYPES:
+            processed, new_type, extension = _process_pdf(content)
+        else:
+            processed = None
+
+        if processed is not None and len(processed) < len(content):
+            base = os.path.splitext(filename or "attachment")[0]
+            result.update(content=processed, contentType=new_type, filename=base + extension, action="compacted")
+        elif processed is not None:
+            result["action"] = "kept_smaller_original"
+    except Exception as e:
+        result["action"] = f"failed: {type(e).__name__}: {e}"
+
+    result["report"] = {
+        "action": result["action"],
+        "originalBytes": len(content),
+        "storedBytes": len(result["content"]),
+        "bytesSaved": len(content) - len(result["content"]),
+        "tookMs": round((time.perf_counter() - start) * 1000, 1),
+    }
+    return result
+
+# ---------------- API ----------------
+def _get_pool():
+    """ One pool per worker process, created after fork """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = ProcessPoolExecutor(max_workers=PROCESS_WORKERS)
+        _pool_pid = os.getpid()
+    return _pool
+
+def should_process(content: bytes, content_type: str) -> bool:
+    content_type = (content_type or "").lower()
+    return (
+        PROCESSING_ENABLED
+        and len(content) <= MAX_PROCESS_BYTES
+        and (content_type in IMAGE_TYPES or content_type in PDF_TYPES)
+    )
+
+async def compact_attachment(content: bytes, content_type: str, filename: str) -> dict:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(), process_attachment, content, content_type, filename)
+
+def shutdown_processing_pool():
+    global _pool
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
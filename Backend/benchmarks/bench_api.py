@@ -0,0 +1,468 @@
+"""
+Offline benchmark of the API hot paths.
+
+Starts the app in-process (uvicorn on a background thread) against mongomock
+or a local mongod, with Google Drive replaced by an in-memory attachment
+store, seeds synthetic data and measures throughput and p50/p95/p99 for:
+
+    POST   /employee/login
+    POST   /expense/create          (with attachments)
+    GET    /expense/all
+    GET    /expense/user/{email}
+    GET    /expense/attachment/{id}
+    DELETE /expense/delete
+
+Results go to stdout and, with --output, to a JSON file that can be diffed
+against an earlier run (--compare) to catch regressions.
+
+    python benchmarks/bench_api.py --expenses 5000 --output api.json
+    python benchmarks/bench_api.py --mongo mongodb://localhost:27017 --clients 16
+    python benchmarks/bench_api.py --compare api.json --max-regression 0.2
+
+With --drive-root the real Drive code path is used against a fake Drive
+server (benchmarks/fake_drive.py) instead of the in-memory store:
+
+    python benchmarks/fake_drive.py --port 8770 --latency-ms 30 &
+    python benchmarks/bench_api.py --drive-root http://127.0.0.1:8770/
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, BACKEND_DIR)
+
+BENCH_PASSWORD = "bench-password"
+PAYMENT_MODES = ["Cash", "UPI", "Card", "Bank Transfer"]
+LOCATIONS = ["Pune", "Mumbai", "Nashik", "Nagpur", "Satara"]
+# Every request comes from 127.0.0.1 and reuses a few emails, so the admission
+# rate limits would turn most of it away with 429. Lift them (the concurrency
+# gates stay); a run that still sees a 429 fails instead of reporting it.
+UNLIMITED = [1_000_000, 1]
+BENCH_ADMISSION_POLICIES = {
+    "POST /employee/login": {"per_client": UNLIMITED, "per_email": UNLIMITED},
+    "POST /expense/create": {"per_client": UNLIMITED},
+}
+
+# ---------------- FAKE ATTACHMENT BACKEND ----------------
+class FakeAttachmentStore:
+    """ In-memory stand-in for gdrive_utils with optional per-call latency """
+    def __init__(self, latency_ms=0.0):
+        self.files = {}
+        self.latency = latency_ms / 1000
+        self.lock = threading.Lock()
+
+    def put(self, filename, content, mime_type):
+        file_id = uuid.uuid4().hex
+        with self.lock:
+            self.files[file_id] = (filename, mime_type, content)
+        return {
+            "id": file_id,
+            "filename": filename,
+            "viewLink": f"https://drive.invalid/{file_id}/view",
+            "downloadLink": f"https://drive.invalid/{file_id}",
+            "size": len(content),
+            "mimeType": mime_type,
+            "md5Checksum": hashlib.md5(content).hexdigest(),
+            "uploadedAt": datetime.now()
+        }
+
+    async def upload_file_to_drive(self, file):
+        content = await file.read()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.put(file.filename, content, file.content_type)
+
+    def delete_file_from_drive(self, file_id):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            return self.files.pop(file_id, None) is not None
+
+    def delete_attachment_files(self, att):
+        return self.delete_file_from_drive(att["id"] if isinstance(att, dict) else att)
+
+    def stream_file_content(self, file_id, attachment=None):
+        if self.latency:
+            time.sleep(self.latency)
+        entry = self.files.get(file_id)
+        if entry is None:
+            return None, None, None, None
+        filename, mime_type, content = entry
+
+        def iterfile():
+            for i in range(0, len(content), 65536):
+                yield content[i:i + 65536]
+
+        return iterfile, filename, mime_type, len(content)
+
+class FakeDriveSeeder:
+    """ Seeds attachments through the app's Drive client (used with --drive-root) """
+    def put(self, filename, content, mime_type):
+        import io
+        from googleapiclient.http import MediaIoBaseUpload
+        from db import get_drive_service
+
+        media = MediaIoBaseUpload(io.BytesIO(content), mimetype=mime_type, resumable=True)
+        created = get_drive_service().files().create(
+            body={"name": filename}, media_body=media, fields="id, name, webViewLink, webContentLink, md5Checksum"
+        ).execute()
+        return {
+            "id": created["id"],
+            "filename": created["name"],
+            "viewLink": created.get("webViewLink"),
+            "downloadLink": created.get("webContentLink"),
+            "size": len(content),
+            "mimeType": mime_type,
+            "md5Checksum": created.get("md5Checksum"),
+            "uploadedAt": datetime.now()
+        }
+
+# ---------------- APP ----------------
+def load_app(args, store):
+    """ Imports main with Mongo / Drive swapped out; must run before anything imports db """
+    os.environ["MONGO_DB_NAME"] = args.db
+    os.environ.setdefault("MAILEROO_API_KEY", "benchmark")
+    os.environ.setdefault("ADMISSION_POLICIES", json.dumps(BENCH_ADMISSION_POLICIES))
+    if args.mongo == "mongomock":
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+    else:
+        os.environ["MONGO_URI"] = args.mongo
+
+    if args.drive_root:
+        os.environ["DRIVE_API_ROOT"] = args.drive_root
+
+    os.chdir(BACKEND_DIR)
+    import main
+    import routes.expense as expense_routes
+
+    if args.drive_root:
+        return main.app
+    expense_routes.upload_file_to_drive = store.upload_file_to_drive
+    expense_routes.delete_attachment_files = store.delete_attachment_files
+    expense_routes.stream_file_content = store.stream_file_content
+    return main.app
+
+def start_server(app, port):
+    import uvicorn
+
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 60
+    while not server.started:
+        if time.time() > deadline or not thread.is_alive():
+            raise RuntimeError("server did not start")
+        time.sleep(0.05)
+    return server, thread
+
+# ---------------- SEED ----------------
+def seed(args, store):
+    from passlib.context import CryptContext
+    from db import (
+        get_db,
+        employee_collection,
+        expense_type_collection,
+        payment_mode_collection,
+        user_groups_collection,
+        expenses_collection
+    )
+    from search_utils import search_fields
+
+    if args.mongo != "mongomock":
+        get_db().client.drop_database(args.db)
+
+    rng = random.Random(args.seed)
+    password_hash = CryptContext(schemes=["bcrypt"]).hash(BENCH_PASSWORD)
+    emails = [f"bench.user{i}@rataagroup.com" for i in range(args.employees)]
+
+    employee_collection.insert_many([
+        {
+            "EmployeeID": f"RATAA{i + 1:04d}",
+            "EmployeeName": f"Bench User {i}",
+            "Email": email,
+            "MobileNO": f"{9000000000 + i}",
+            "Password": password_hash,
+            "isActive": True,
+            "CreatedAt": datetime.now(),
+        }
+        for i, email in enumerate(emails)
+    ])
+    type_ids = [str(x) for x in expense_type_collection.insert_many([
+        {"ExpenseTypeName": f"Type {i}", "Description": "", "IsActive": True, "CreatedAt": datetime.now()}
+        for i in range(args.expense_types)
+    ]).inserted_ids]
+    payment_mode_collection.insert_many([
+        {"paymentModeName": name, "isActive": True, "createdAt": datetime.now()} for name in PAYMENT_MODES
+    ])
+    user_groups_collection.insert_many([
+        {
+            "groupId": f"GRP{i + 1:03d}",
+            "groupName": f"Group {i}",
+            "description": "",
+            "users": emails[i::args.groups],
+            "isActive": True,
+            "createdAt": datetime.now(),
+            "updatedAt": datetime.now()
+        }
+        for i in range(args.groups)
+    ])
+
+    attachment = os.urandom(args.attachment_kb * 1024)
+    start = datetime(2024, 1, 1)
+    file_ids = []
+    batch = []
+    for i in range(args.expenses):
+        attachments = [
+            store.put(f"receipt-{i}-{j}.jpg", attachment, "image/jpeg")
+            for j in range(args.attachments)
+        ]
+        file_ids.extend(a["id"] for a in attachments)
+        car = f"MH{rng.randint(1, 50):02d}AB{rng.randint(1000, 9999)}" if rng.random() < 0.3 else ""
+        doc = {
+            "expenseTypeId": rng.choice(type_ids),
+            "title": f"Bench expense {i}",
+            "date": (start + timedelta(days=rng.randint(0, 700))).strftime("%Y-%m-%dT10:00"),
+            "amount": round(rng.uniform(10, 5000), 2),
+            "paymentMode": rng.choice(PAYMENT_MODES),
+            "billAvailable": rng.random() < 0.8,
+            "userEmail": rng.choice(emails),
+            "description": "",
+            "carNumber": car,
+            "serviceType": "",
+            "location": rng.choice(LOCATIONS),
+            "equipmentName": "",
+            "equipmentType": "",
+            "attachments": attachments,
+            "createdAt": datetime.now(),
+            "updatedAt": datetime.now(),
+        }
+        doc.update(search_fields(car))
+        batch.append(doc)
+        if len(batch) == 1000:
+            expenses_collection.insert_many(batch)
+            batch = []
+    if batch:
+        expenses_collection.insert_many(batch)
+
+    expense_ids = [str(d["_id"]) for d in expenses_collection.find({}, {"_id": 1})]
+    return {"emails": emails, "typeIds": type_ids, "fileIds": file_ids, "expenseIds": expense_ids}
+
+# ---------------- SCENARIOS ----------------
+def run_scenario(name, make_request, total, clients):
+    """ Sends `total` requests from `clients` threads; make_request(session, i) -> response """
+    latencies, errors, rate_limited = [], [0], [0]
+    lock = threading.Lock()
+    counter = iter(range(total))
+    local_sessions = threading.local()
+
+    def worker():
+        session = getattr(local_sessions, "session", None)
+        if session is None:
+            session = local_sessions.session = requests.Session()
+        samples = []
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            start = time.perf_counter()
+            try:
+                response = make_request(session, i)
+                ok = response.status_code < 400
+                if response.status_code == 429:
+                    with lock:
+                        rate_limited[0] += 1
+                response.content  # drain streaming bodies
+            except requests.RequestException:
+                ok = False
+            samples.append((time.perf_counter() - start) * 1000)
+            if not ok:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(samples)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        for future in [pool.submit(worker) for _ in range(clients)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+    if rate_limited[0]:
+        raise SystemExit(f"FAIL: {name} was rate limited ({rate_limited[0]}/{total} got 429); "
+                         f"the numbers would measure the limiter, check ADMISSION_POLICIES")
+
+    latencies.sort()
+
+    def pct(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 2) if latencies else 0.0
+
+    return {
+        "endpoint": name,
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+    }
+
+def build_scenarios(base_url, data, args):
+    rng = random.Random(args.seed + 1)
+    attachment = os.urandom(args.attachment_kb * 1024)
+    created_ids = []
+    created_lock = threading.Lock()
+
+    def login(session, i):
+        return session.post(base_url + "/employee/login",
+                            json={"Email": rng.choice(data["emails"]), "Password": BENCH_PASSWORD})
+
+    def create(session, i):
+        response = session.post(
+            base_url + "/expense/create",
+            data={
+                "expenseTypeId": rng.choice(data["typeIds"]),
+                "title": f"Bench create {i}",
+                "date": "2025-06-15T10:00",
+                "amount": str(round(rng.uniform(10, 5000), 2)),
+                "paymentMode": rng.choice(PAYMENT_MODES),
+                "billAvailable": "true",
+                "userEmail": rng.choice(data["emails"]),
+                "location": rng.choice(LOCATIONS),
+            },
+            files=[("attachments", (f"receipt-{i}-{j}.jpg", attachment, "image/jpeg"))
+                   for j in range(args.attachments)]
+        )
+        if response.ok:
+            with created_lock:
+                created_ids.append(response.json()["expense_id"])
+        return response
+
+    def list_all(session, i):
+        return session.get(base_url + "/expense/all")
+
+    def by_user(session, i):
+        return session.get(base_url + f"/expense/user/{rng.choice(data['emails'])}")
+
+    def download(session, i):
+        return session.get(base_url + f"/expense/attachment/{rng.choice(data['fileIds'])}")
+
+    # Delete what the create scenario added first, then seeded expenses
+    delete_pool = []
+
+    def delete(session, i):
+        with created_lock:
+            if not delete_pool:
+                delete_pool.extend(data["expenseIds"])
+                delete_pool.extend(created_ids)
+            expense_id = delete_pool.pop()
+        return session.delete(base_url + "/expense/delete", json={"expenseIds": [expense_id]})
+
+    scenarios = [
+        ("login", login, args.requests),
+        ("create", create, args.requests),
+        ("all", list_all, max(1, args.requests // 10)),
+        ("user", by_user, args.requests),
+        ("download", download, args.requests if data["fileIds"] else 0),
+        ("delete", delete, min(args.requests, len(data["expenseIds"]))),
+    ]
+    return [s for s in scenarios if not args.only or s[0] in args.only]
+
+# ---------------- COMPARE ----------------
+def compare(results, baseline_path, max_regression):
+    with open(baseline_path) as f:
+        baseline = {r["endpoint"]: r for r in json.load(f)["results"]}
+
+    regressions = []
+    print(f"\n{'endpoint':<10} {'p95 before':>12} {'p95 now':>10} {'change':>8}")
+    for result in results:
+        before = baseline.get(result["endpoint"])
+        if not before or not before["p95_ms"]:
+            continue
+        change = (result["p95_ms"] - before["p95_ms"]) / before["p95_ms"]
+        print(f"{result['endpoint']:<10} {before['p95_ms']:>10.2f}ms {result['p95_ms']:>8.2f}ms {change:>+7.0%}")
+        if change > max_regression:
+            regressions.append(result["endpoint"])
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo", default="mongomock", help="'mongomock' or a MongoDB URI")
+    parser.add_argument("--db", default="ExpenseDB_bench", help="Database name (dropped before seeding)")
+    parser.add_argument("--employees", type=int, default=50)
+    parser.add_argument("--groups", type=int, default=5)
+    parser.add_argument("--expense-types", type=int, default=10)
+    parser.add_argument("--expenses", type=int, default=2000)
+    parser.add_argument("--attachments", type=int, default=2, help="Attachments per expense")
+    parser.add_argument("--attachment-kb", type=int, default=256)
+    parser.add_argument("--drive-root", help="Use the Drive code path against this fake Drive server URL")
+    parser.add_argument("--backend-latency-ms", type=float, default=0.0, help="Added to every fake Drive call")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--only", nargs="+", help="Run only these endpoints")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="Earlier --output file to compare p95 against")
+    parser.add_argument("--max-regression", type=float, default=0.25, help="Allowed p95 increase with --compare")
+    args = parser.parse_args()
+
+    store = FakeDriveSeeder() if args.drive_root else FakeAttachmentStore(args.backend_latency_ms)
+    app = load_app(args, store)
+    server, thread = start_server(app, args.port)
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        seed_start = time.perf_counter()
+        data = seed(args, store)
+        print(f"Seeded {args.employees} employees, {args.expenses} expenses, "
+              f"{len(data['fileIds'])} attachments in {time.perf_counter() - seed_start:.1f}s")
+
+        results = []
+        for name, make_request, total in build_scenarios(base_url, data, args):
+            if total <= 0:
+                continue
+            if name not in ("create", "delete"):
+                run_scenario(name, make_request, min(args.warmup, total), args.clients)
+            stats = run_scenario(name, make_request, total, args.clients)
+            results.append(stats)
+            print(f"{name:<10} {stats['rps']:>8} req/s  p50={stats['p50_ms']:.1f}ms "
+                  f"p95={stats['p95_ms']:.1f}ms p99={stats['p99_ms']:.1f}ms errors={stats['errors']}")
+    finally:
+        server.should_exit = True
+        thread.join(timeout=30)
+
+    output = {
+        "python": sys.version.split()[0],
+        "startedAt": datetime.now().isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.max_regression)
+        if regressions:
+            print(f"\nFAIL: p95 regressed by more than {args.max_regression:.0%} for {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
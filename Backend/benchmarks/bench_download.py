@@ -0,0 +1,175 @@
+"""
+Time to first byte of GET /expense/attachment/{id}.
+
+Runs the app in-process against mongomock (or a local mongod) and an
+in-process fake Drive (benchmarks/fake_drive.py) with added latency, and
+compares two kinds of attachments:
+
+    stored   attachment entries with filename / mimeType / size, as written by
+             current uploads: the download goes straight to Drive's media URL
+    lookup   legacy plain-id attachments: Drive's files.get is asked for the
+             name and type first, which is what every download used to do
+
+The difference is one Drive round trip per download.
+
+    python benchmarks/bench_download.py --latency-ms 40 --requests 200
+    python benchmarks/bench_download.py --mongo mongodb://localhost:27017 --output download.json
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# ---------------- SETUP ----------------
+def start_uvicorn(app, port):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 60
+    while not server.started:
+        if time.time() > deadline or not thread.is_alive():
+            raise RuntimeError("server did not start")
+        time.sleep(0.05)
+    return server
+
+def load_app(args):
+    """ Imports main pointed at the fake Drive; must run before anything imports db """
+    os.environ["MONGO_DB_NAME"] = args.db
+    os.environ["DRIVE_API_ROOT"] = f"http://127.0.0.1:{args.drive_port}/"
+    os.environ.setdefault("MAILEROO_API_KEY", "benchmark")
+    if args.mongo == "mongomock":
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+    else:
+        os.environ["MONGO_URI"] = args.mongo
+
+    os.chdir(BACKEND_DIR)
+    import main
+    return main.app
+
+def seed(args):
+    """ The same files twice: once as stored attachment entries, once as legacy plain ids """
+    from gdrive_utils import _create_drive_file
+    from db import get_db, expenses_collection
+
+    if args.mongo != "mongomock":
+        get_db().client.drop_database(args.db)
+
+    content = os.urandom(args.attachment_kb * 1024)
+    stored, legacy = [], []
+    for i in range(args.files):
+        for target in (stored, legacy):
+            created = _create_drive_file(content, f"receipt-{i}.jpg", "image/jpeg")
+            target.append(created["id"])
+
+    expenses_collection.insert_many([
+        {
+            "title": "Bench download (stored)",
+            "date": "2025-06-15T10:00",
+            "userEmail": "bench.user@rataagroup.com",
+            "attachments": [
+                {"id": file_id, "filename": f"receipt-{i}.jpg", "size": len(content), "mimeType": "image/jpeg"}
+                for i, file_id in enumerate(stored)
+            ],
+            "updatedAt": datetime.utcnow(),
+        },
+        {
+            "title": "Bench download (legacy)",
+            "date": "2025-06-15T10:00",
+            "userEmail": "bench.user@rataagroup.com",
+            "attachments": legacy,
+            "updatedAt": datetime.utcnow(),
+        },
+    ])
+    return {"stored": stored, "lookup": legacy}
+
+# ---------------- MEASURE ----------------
+def measure(base_url, file_ids, total):
+    session = requests.Session()
+    ttfb, full, errors = [], [], 0
+    for i in range(total):
+        start = time.perf_counter()
+        response = session.get(f"{base_url}/expense/attachment/{file_ids[i % len(file_ids)]}", stream=True)
+        first = response.raw.read(1)
+        ttfb.append((time.perf_counter() - start) * 1000)
+        response.content  # drain
+        full.append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 400 or not first:
+            errors += 1
+
+    def pct(samples, p):
+        samples = sorted(samples)
+        return round(samples[min(len(samples) - 1, int(len(samples) * p))], 2)
+
+    return {
+        "requests": total,
+        "errors": errors,
+        "ttfb_p50_ms": pct(ttfb, 0.50),
+        "ttfb_p95_ms": pct(ttfb, 0.95),
+        "full_p50_ms": pct(full, 0.50),
+        "full_p95_ms": pct(full, 0.95),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo", default="mongomock", help="'mongomock' or a MongoDB URI")
+    parser.add_argument("--db", default="ExpenseDB_bench", help="Database name (dropped before seeding)")
+    parser.add_argument("--latency-ms", type=float, default=40.0, help="Fake Drive latency per request")
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--attachment-kb", type=int, default=256)
+    parser.add_argument("--requests", type=int, default=200, help="Downloads per kind")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8768)
+    parser.add_argument("--drive-port", type=int, default=8771)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    import fake_drive
+
+    drive_server = start_uvicorn(fake_drive.app, args.drive_port)
+    app = load_app(args)
+    server = start_uvicorn(app, args.port)
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        files = seed(args)
+        # Latency only for the measured downloads, not for seeding
+        fake_drive.config.latency_ms = args.latency_ms
+        results = {}
+        for kind, file_ids in files.items():
+            measure(base_url, file_ids, args.warmup)
+            results[kind] = measure(base_url, file_ids, args.requests)
+            stats = results[kind]
+            print(f"{kind:<8} ttfb p50={stats['ttfb_p50_ms']:.1f}ms p95={stats['ttfb_p95_ms']:.1f}ms  "
+                  f"full p50={stats['full_p50_ms']:.1f}ms p95={stats['full_p95_ms']:.1f}ms errors={stats['errors']}")
+    finally:
+        server.should_exit = True
+        drive_server.should_exit = True
+
+    saved = results["lookup"]["ttfb_p50_ms"] - results["stored"]["ttfb_p50_ms"]
+    print(f"\nStored metadata saves {saved:.1f}ms p50 time to first byte "
+          f"({saved / results['lookup']['ttfb_p50_ms']:.0%})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "python": sys.version.split()[0],
+                "startedAt": datetime.now().isoformat(),
+                "config": {k: v for k, v in vars(args).items() if k != "output"},
+                "results": results,
+            }, f, indent=2)
+
+if __name__ == "__main__":
+    main()
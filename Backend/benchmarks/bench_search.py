@@ -0,0 +1,115 @@
+"""
+Benchmark for GET /expense/search.
+
+Seeds synthetic expenses into a separate database and times the same queries
+the endpoint runs. Needs a real mongod ($text is not supported by mongomock).
+
+    python benchmarks/bench_search.py --count 1000000 --runs 200
+"""
+import argparse
+import os
+import random
+import statistics
+import string
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from pymongo import MongoClient
+from search_utils import TEXT_SEARCH_WEIGHTS, search_fields
+
+VENDORS = ["Shell", "Indian Oil", "HP Petrol", "Bosch Service", "Tata Motors", "Apollo Tyres",
+           "Reliance", "Bharat Petroleum", "Mahindra Service", "Croma", "Hotel Sagar", "Uber"]
+LOCATIONS = ["Pune", "Mumbai", "Nashik", "Nagpur", "Kolhapur", "Satara", "Aurangabad", "Solapur"]
+EQUIPMENT = ["Generator", "Compressor", "Drill", "Welding Machine", "Excavator", "Pump", "Laptop"]
+STATES = ["MH", "KA", "GJ", "MP", "TN"]
+
+def random_car_number():
+    return (f"{random.choice(STATES)}{random.randint(1, 50):02d}"
+            f"{''.join(random.choices(string.ascii_uppercase, k=2))}{random.randint(1, 9999):04d}")
+
+def synthetic_expense(i):
+    car = random_car_number() if random.random() < 0.6 else ""
+    doc = {
+        "expenseTypeId": "000000000000000000000000",
+        "title": f"{random.choice(VENDORS)} bill #{i}",
+        "date": (datetime(2023, 1, 1) + timedelta(days=random.randint(0, 900))).strftime("%Y-%m-%dT%H:%M"),
+        "amount": round(random.uniform(50, 50000), 2),
+        "paymentMode": "Cash",
+        "billAvailable": random.random() < 0.8,
+        "userEmail": f"user{random.randint(1, 500)}@rataagroup.com",
+        "description": f"Paid at {random.choice(VENDORS)} for {random.choice(EQUIPMENT).lower()}",
+        "carNumber": car,
+        "location": random.choice(LOCATIONS),
+        "equipmentName": random.choice(EQUIPMENT) if random.random() < 0.4 else "",
+        "equipmentType": random.choice(["Electrical", "Mechanical", "IT", ""]),
+        "attachments": [],
+        "createdAt": datetime.now(),
+        "updatedAt": datetime.now(),
+    }
+    doc.update(search_fields(car))
+    return doc
+
+def seed(collection, count, batch=10000):
+    existing = collection.estimated_document_count()
+    if existing >= count:
+        print(f"Using existing {existing} documents")
+        return
+    print(f"Seeding {count - existing} expenses...")
+    for start in range(existing, count, batch):
+        collection.insert_many([synthetic_expense(i) for i in range(start, min(start + batch, count))], ordered=False)
+
+def ensure_indexes(collection):
+    collection.create_index(
+        [(field, "text") for field in TEXT_SEARCH_WEIGHTS],
+        name="expense_text_search",
+        weights=TEXT_SEARCH_WEIGHTS,
+        default_language="none"
+    )
+    collection.create_index("carNumberNorm")
+    collection.create_index("carNumberGrams")
+
+def time_query(label, fn, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{label:<28} p50={statistics.median(timings):7.2f}ms  p95={p95:7.2f}ms  max={timings[-1]:7.2f}ms")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uri", default=os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default="ExpenseDB_bench")
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--runs", type=int, default=100)
+    args = parser.parse_args()
+
+    collection = MongoClient(args.uri)[args.db]["ExpensesCollection"]
+    seed(collection, args.count)
+    ensure_indexes(collection)
+
+    # The endpoint reads through db's collections (hot, read-routed and the
+    # archive tiers), so point db at the benchmark database before importing it
+    os.environ["MONGO_URI"] = args.uri
+    os.environ["MONGO_DB_NAME"] = args.db
+    from routes import expense
+
+    def search(**params):
+        # Called directly, so every parameter needs a value instead of its Query default
+        return lambda: expense.search_expenses(**{
+            "q": None, "carNumber": None, "fuzzy": False, "userEmail": None,
+            "dateFrom": None, "dateTo": None, "page": 1, "pageSize": 20, **params
+        })
+
+    time_query("text: vendor", search(q="Apollo"), args.runs)
+    time_query("text: vendor + location", search(q="Bosch Nashik"), args.runs)
+    time_query("carNumber prefix", search(carNumber="MH12"), args.runs)
+    time_query("carNumber fuzzy", lambda: search(carNumber=random_car_number(), fuzzy=True)(), args.runs)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Cold start benchmark for CI.
+
+Imports main.py in fresh interpreters with -X importtime and reports the
+median total import time plus the slowest modules. With --serve it also
+starts the app with uvicorn and measures time until the first request is
+answered, together with the per-step timings from GET /startup-timings.
+
+    python benchmarks/bench_startup.py --runs 5 --top 15 --output startup.json
+    python benchmarks/bench_startup.py --budget-ms 800   # exit 1 if slower
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+def run_importtime(env):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr[-2000:])
+
+    modules = {}
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = {
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+                "depth": len(indent) // 2,
+            }
+    return modules
+
+def measure_serve(env, port):
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while True:
+            try:
+                if requests.get(f"http://127.0.0.1:{port}/", timeout=0.5).ok:
+                    break
+            except requests.RequestException:
+                if time.perf_counter() - start > 120:
+                    raise RuntimeError("server did not start")
+                time.sleep(0.05)
+        first_response_ms = (time.perf_counter() - start) * 1000
+        timings = requests.get(f"http://127.0.0.1:{port}/startup-timings", timeout=5).json()
+        return {"first_response_ms": round(first_response_ms, 1), "lifespan_steps_ms": timings}
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--serve", action="store_true", help="Also measure time to first response")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--budget-ms", type=float, help="Fail if the median import time exceeds this")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("MAILEROO_API_KEY", "benchmark")
+
+    runs = [run_importtime(env) for _ in range(args.runs)]
+    totals = [run["main"]["cumulative_ms"] for run in runs]
+    median_total = statistics.median(totals)
+
+    # Median per module across runs, slowest first
+    names = set().union(*runs)
+    breakdown = []
+    for name in names:
+        samples = [run[name] for run in runs if name in run]
+        breakdown.append({
+            "module": name,
+            "cumulative_ms": round(statistics.median(s["cumulative_ms"] for s in samples), 2),
+            "self_ms": round(statistics.median(s["self_ms"] for s in samples), 2),
+        })
+    top_cumulative = sorted(breakdown, key=lambda m: m["cumulative_ms"], reverse=True)[:args.top]
+    top_self = sorted(breakdown, key=lambda m: m["self_ms"], reverse=True)[:args.top]
+
+    result = {
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "import_main_ms": {"median": round(median_total, 1), "min": round(min(totals), 1), "max": round(max(totals), 1)},
+        "top_cumulative": top_cumulative,
+        "top_self": top_self,
+    }
+
+    print(f"import main: median {median_total:.1f} ms (min {min(totals):.1f}, max {max(totals):.1f}) over {args.runs} runs")
+    print(f"\n{'module':<45} {'cumulative':>12} {'self':>10}")
+    for m in top_cumulative:
+        print(f"{m['module']:<45} {m['cumulative_ms']:>10.1f}ms {m['self_ms']:>8.1f}ms")
+
+    if args.serve:
+        result["serve"] = measure_serve(env, args.port)
+        print(f"\ntime to first response: {result['serve']['first_response_ms']} ms")
+        print(f"lifespan steps (ms): {result['serve']['lifespan_steps_ms']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.budget_ms is not None and median_total > args.budget_ms:
+        print(f"\nFAIL: import time {median_total:.1f} ms exceeds budget {args.budget_ms} ms")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
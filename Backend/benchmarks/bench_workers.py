@@ -0,0 +1,171 @@
+"""
+Throughput of the production server (serve.py) as the worker count grows.
+
+Seeds a benchmark database, starts `python serve.py --workers N` for every N
+given, and hammers GET /expense/all and POST /employee/login from client
+threads. Needs a reachable mongod; uses MONGO_DB_NAME=ExpenseDB_bench so the
+real data is never touched.
+
+    python benchmarks/bench_workers.py --workers 1 2 4 --duration 20 --clients 32
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import requests
+from passlib.context import CryptContext
+from pymongo import MongoClient
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+BENCH_EMAIL = "bench.user@rataagroup.com"
+BENCH_PASSWORD = "bench-password"
+# All clients share 127.0.0.1 and one email, so the login rate limits would turn
+# most of them away with 429. Lift them (the concurrency gates stay); a run that
+# still sees a 429 fails instead of reporting it.
+UNLIMITED = [1_000_000, 1]
+BENCH_ADMISSION_POLICIES = {
+    "POST /employee/login": {"per_client": UNLIMITED, "per_email": UNLIMITED},
+}
+
+def seed(uri, db_name, expenses):
+    db = MongoClient(uri)[db_name]
+    if not db["Employees"].find_one({"Email": BENCH_EMAIL}):
+        db["Employees"].insert_one({
+            "EmployeeID": "RATAA9999",
+            "EmployeeName": "Bench User",
+            "Email": BENCH_EMAIL,
+            "MobileNO": "0000000000",
+            "Password": CryptContext(schemes=["bcrypt"]).hash(BENCH_PASSWORD),
+            "isActive": True,
+            "CreatedAt": datetime.now(),
+        })
+    missing = expenses - db["ExpensesCollection"].estimated_document_count()
+    if missing > 0:
+        db["ExpensesCollection"].insert_many([
+            {
+                "expenseTypeId": "000000000000000000000000",
+                "title": f"Bench expense {i}",
+                "date": f"2024-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}T10:00",
+                "amount": round(random.uniform(10, 5000), 2),
+                "paymentMode": "Cash",
+                "billAvailable": True,
+                "userEmail": BENCH_EMAIL,
+                "attachments": [],
+                "createdAt": datetime.now(),
+                "updatedAt": datetime.now(),
+            }
+            for i in range(missing)
+        ])
+
+def wait_until_up(base_url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(base_url + "/", timeout=1).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("server did not start")
+
+def hammer(base_url, endpoint, clients, duration):
+    latencies, errors, rate_limited = [], [0], [0]
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def client():
+        session = requests.Session()
+        local = []
+        while time.time() < stop_at:
+            start = time.perf_counter()
+            try:
+                if endpoint == "login":
+                    r = session.post(base_url + "/employee/login",
+                                     json={"Email": BENCH_EMAIL, "Password": BENCH_PASSWORD})
+                else:
+                    r = session.get(base_url + "/expense/all")
+                ok = r.status_code == 200
+                if r.status_code == 429:
+                    with lock:
+                        rate_limited[0] += 1
+            except requests.RequestException:
+                ok = False
+            local.append((time.perf_counter() - start) * 1000)
+            if not ok:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if rate_limited[0]:
+        raise SystemExit(f"FAIL: {endpoint} was rate limited ({rate_limited[0]} got 429); "
+                         f"the numbers would measure the limiter, check ADMISSION_POLICIES")
+
+    latencies.sort()
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] if latencies else 0.0
+
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": round(len(latencies) / duration, 1),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=int, default=15)
+    parser.add_argument("--expenses", type=int, default=2000)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--uri", default=os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default="ExpenseDB_bench")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    seed(args.uri, args.db, args.expenses)
+    base_url = f"http://127.0.0.1:{args.port}"
+    env = dict(os.environ, MONGO_URI=args.uri, MONGO_DB_NAME=args.db, ACCESS_LOG="/dev/null")
+    env.setdefault("MAILEROO_API_KEY", "benchmark")
+    env.setdefault("ADMISSION_POLICIES", json.dumps(BENCH_ADMISSION_POLICIES))
+
+    results = []
+    for workers in args.workers:
+        server = subprocess.Popen(
+            [sys.executable, "serve.py", "--workers", str(workers), "--bind", f"127.0.0.1:{args.port}"],
+            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            wait_until_up(base_url)
+            for endpoint in ("list", "login"):
+                hammer(base_url, endpoint, args.clients, 2)  # warm-up
+                stats = hammer(base_url, endpoint, args.clients, args.duration)
+                stats.update({"workers": workers, "endpoint": endpoint})
+                results.append(stats)
+                print(f"workers={workers:<3} {endpoint:<6} {stats['rps']:>8} req/s  "
+                      f"p50={stats['p50_ms']:.1f}ms p95={stats['p95_ms']:.1f}ms errors={stats['errors']}")
+        finally:
+            server.terminate()
+            server.wait(timeout=60)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
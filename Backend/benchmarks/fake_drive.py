@@ -0,0 +1,242 @@
+"""
+Local stand-in for the parts of the Google Drive v3 API the backend uses,
+for offline load testing of uploads and downloads.
+
+    POST   /upload/drive/v3/files?uploadType=resumable   start a resumable session
+    PUT    /upload/drive/v3/files?upload_id=...          upload (chunks, Content-Range)
+    POST   /upload/drive/v3/files?uploadType=media       simple upload
+    GET    /drive/v3/files/{id}                          metadata (honours `fields`)
+    GET    /drive/v3/files/{id}?alt=media                content, with Range support
+    DELETE /drive/v3/files/{id}
+    GET    /drive/v3/about?fields=storageQuota           quota accounting
+
+Files live in memory. Latency, bandwidth and error injection are configurable:
+
+    python benchmarks/fake_drive.py --port 8770 --latency-ms 40 --jitter-ms 20 \\
+        --bandwidth-kbps 4096 --error-rate 0.01 --quota-mb 15360
+
+Point the backend at it with DRIVE_API_ROOT=http://127.0.0.1:8770/ (db.py then
+builds the Drive client with anonymous credentials, no token.json needed).
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import re
+import uuid
+from datetime import datetime, timezone
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CONTENT_RANGE = re.compile(r"bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)")
+RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+STREAM_CHUNK = 64 * 1024
+
+class FakeDriveConfig:
+    latency_ms = 0.0
+    jitter_ms = 0.0
+    bandwidth_kbps = 0.0       # 0 = unlimited
+    error_rate = 0.0
+    error_status = 503
+    quota_bytes = 15 * 1024 ** 3
+
+config = FakeDriveConfig()
+files = {}       # id -> {"meta": {...}, "content": bytes}
+sessions = {}    # upload_id -> {"meta": {...}, "fields": str, "total": int | None, "data": bytearray}
+usage = {"bytes": 0}
+
+app = FastAPI(title="Fake Google Drive v3")
+
+# ---------------- HELPERS ----------------
+def drive_error(status: int, reason: str, message: str):
+    return JSONResponse(status_code=status, content={
+        "error": {"code": status, "message": message, "errors": [{"domain": "global", "reason": reason, "message": message}]}
+    })
+
+def select_fields(resource: dict, fields: str):
+    """ Top-level `fields` selection; nested selectors are returned whole """
+    if not fields or fields == "*":
+        return resource
+    names = {f.split("(")[0].split("/")[0].strip() for f in fields.split(",")}
+    return {k: v for k, v in resource.items() if k in names}
+
+async def throttle(nbytes: int):
+    if config.bandwidth_kbps > 0:
+        await asyncio.sleep(nbytes / (config.bandwidth_kbps * 1024))
+
+@app.middleware("http")
+async def inject_faults(request: Request, call_next):
+    delay = config.latency_ms + random.uniform(0, config.jitter_ms)
+    if delay:
+        await asyncio.sleep(delay / 1000)
+    if config.error_rate and random.random() < config.error_rate:
+        return drive_error(config.error_status, "backendError", "Injected failure")
+    return await call_next(request)
+
+async def read_body(request: Request) -> bytes:
+    body = bytearray()
+    async for chunk in request.stream():
+        body.extend(chunk)
+        await throttle(len(chunk))
+    return bytes(body)
+
+def store_file(meta: dict, content: bytes):
+    if usage["bytes"] + len(content) > config.quota_bytes:
+        return None
+    file_id = uuid.uuid4().hex
+    now = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+    resource = {
+        "kind": "drive#file",
+        "id": file_id,
+        "name": meta.get("name") or "Untitled",
+        "mimeType": meta.get("mimeType") or "application/octet-stream",
+        "parents": meta.get("parents", []),
+        "size": str(len(content)),
+        "md5Checksum": hashlib.md5(content).hexdigest(),
+        "createdTime": now,
+        "modifiedTime": now,
+        "webViewLink": f"https://drive.google.com/file/d/{file_id}/view",
+        "webContentLink": f"https://drive.google.com/uc?id={file_id}&export=download",
+    }
+    files[file_id] = {"meta": resource, "content": content}
+    usage["bytes"] += len(content)
+    return resource
+
+def quota_exceeded():
+    return drive_error(403, "storageQuotaExceeded", "The user's Drive storage quota has been exceeded.")
+
+# ---------------- UPLOAD ----------------
+@app.post("/upload/drive/v3/files")
+async def start_upload(request: Request, uploadType: str = "media", fields: str = ""):
+    if uploadType == "resumable":
+        meta = await request.json() if int(request.headers.get("content-length") or 0) else {}
+        meta.setdefault("mimeType", request.headers.get("x-upload-content-type"))
+        total = request.headers.get("x-upload-content-length")
+        if total and usage["bytes"] + int(total) > config.quota_bytes:
+            return quota_exceeded()
+
+        upload_id = uuid.uuid4().hex
+        sessions[upload_id] = {"meta": meta, "fields": fields, "total": int(total) if total else None, "data": bytearray()}
+        location = f"{request.base_url}upload/drive/v3/files?uploadType=resumable&upload_id={upload_id}"
+        return Response(status_code=200, headers={"Location": location})
+
+    if uploadType == "media":
+        content = await read_body(request)
+        resource = store_file({"mimeType": request.headers.get("content-type")}, content)
+        return JSONResponse(select_fields(resource, fields)) if resource else quota_exceeded()
+
+    return drive_error(400, "badRequest", f"uploadType={uploadType} is not supported by the fake server")
+
+@app.put("/upload/drive/v3/files")
+async def upload_chunk(request: Request, upload_id: str):
+    session = sessions.get(upload_id)
+    if session is None:
+        return drive_error(404, "notFound", "Upload session not found or expired.")
+
+    body = await read_body(request)
+    match = CONTENT_RANGE.fullmatch(request.headers.get("content-range", f"bytes */{len(body)}").strip())
+    if not match:
+        return drive_error(400, "badContentRange", "Invalid Content-Range header.")
+    first, last, total = match.groups()
+
+    if first is not None:
+        if int(first) != len(session["data"]):
+            # Out of order chunk: tell the client where we are, like Drive does
+            return _incomplete(session)
+        session["data"].extend(body[:int(last) - int(first) + 1])
+    if total != "*":
+        session["total"] = int(total)
+
+    if session["total"] is None or len(session["data"]) < session["total"]:
+        return _incomplete(session)
+
+    del sessions[upload_id]
+    resource = store_file(session["meta"], bytes(session["data"]))
+    return JSONResponse(select_fields(resource, session["fields"])) if resource else quota_exceeded()
+
+def _incomplete(session):
+    received = len(session["data"])
+    headers = {"Range": f"bytes=0-{received - 1}"} if received else {}
+    return Response(status_code=308, headers=headers)
+
+# ---------------- FILES ----------------
+@app.get("/drive/v3/files/{file_id}")
+async def get_file(file_id: str, request: Request, alt: str = "json", fields: str = ""):
+    entry = files.get(file_id)
+    if entry is None:
+        return drive_error(404, "notFound", f"File not found: {file_id}.")
+    if alt != "media":
+        return select_fields(entry["meta"], fields)
+
+    content = entry["content"]
+    start, end, status = 0, len(content) - 1, 200
+    match = RANGE.fullmatch(request.headers.get("range", "").strip())
+    if match and any(match.groups()):
+        first, last = match.groups()
+        if first:
+            start, end = int(first), min(int(last), end) if last else end
+        else:
+            start = max(0, len(content) - int(last))
+        if start > end:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{len(content)}"})
+        status = 206
+
+    async def body():
+        for offset in range(start, end + 1, STREAM_CHUNK):
+            chunk = content[offset:min(offset + STREAM_CHUNK, end + 1)]
+            await throttle(len(chunk))
+            yield chunk
+
+    headers = {"Content-Length": str(end - start + 1), "Accept-Ranges": "bytes"}
+    if status == 206:
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(content)}"
+    return StreamingResponse(body(), status_code=status, media_type=entry["meta"]["mimeType"], headers=headers)
+
+@app.delete("/drive/v3/files/{file_id}")
+async def delete_file(file_id: str):
+    entry = files.pop(file_id, None)
+    if entry is None:
+        return drive_error(404, "notFound", f"File not found: {file_id}.")
+    usage["bytes"] -= len(entry["content"])
+    return Response(status_code=204)
+
+@app.get("/drive/v3/about")
+async def about(fields: str = ""):
+    resource = {
+        "kind": "drive#about",
+        "storageQuota": {
+            "limit": str(config.quota_bytes),
+            "usage": str(usage["bytes"]),
+            "usageInDrive": str(usage["bytes"]),
+            "usageInDriveTrash": "0",
+        },
+    }
+    return select_fields(resource, fields)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8770)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Added to every request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Random extra latency, uniform 0..N")
+    parser.add_argument("--bandwidth-kbps", type=float, default=0.0, help="Per-request upload/download rate, 0 = unlimited")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--quota-mb", type=float, default=15 * 1024)
+    args = parser.parse_args()
+
+    config.latency_ms = args.latency_ms
+    config.jitter_ms = args.jitter_ms
+    config.bandwidth_kbps = args.bandwidth_kbps
+    config.error_rate = args.error_rate
+    config.error_status = args.error_status
+    config.quota_bytes = int(args.quota_mb * 1024 * 1024)
+
+    import uvicorn
+    # Google keeps connections open for a long time; a short keep-alive would
+    # break pipelined uploads on reused httplib2 connections
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", timeout_keep_alive=120)
+
+if __name__ == "__main__":
+    main()
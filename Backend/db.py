@@ -1,32 +1,356 @@
 # Backend/db.py
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne, ReadPreference
 import os
+import threading
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI")
+MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "ExpenseDB")
 
-client = MongoClient(MONGO_URI)
-db = client["ExpenseDB"]
+def _int_env(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
 
-employee_collection = db["Employees"]
-expense_type_collection = db["ExpenseTypes"]
-expenses_collection = db["ExpensesCollection"]
-payment_mode_collection = db["PaymentModeCollection"]
-user_groups_collection = db["UserGroupsCollection"]
+# Pool / timeout settings, overridable per deployment
+MONGO_CLIENT_OPTIONS = {
+    "maxPoolSize": _int_env("MONGO_MAX_POOL_SIZE", 50),
+    "minPoolSize": _int_env("MONGO_MIN_POOL_SIZE", 0),
+    "maxIdleTimeMS": _int_env("MONGO_MAX_IDLE_TIME_MS", 60000),
+    "maxConnecting": _int_env("MONGO_MAX_CONNECTING", 2),
+    "serverSelectionTimeoutMS": _int_env("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+    "connectTimeoutMS": _int_env("MONGO_CONNECT_TIMEOUT_MS", 5000),
+    "socketTimeoutMS": _int_env("MONGO_SOCKET_TIMEOUT_MS", 30000),
+}
+
+# Where read-only list / report endpoints read from. secondaryPreferred keeps
+# heavy scans off the primary that serves login and writes; on a standalone
+# server it simply reads from the primary.
+READ_ONLY_PREFERENCE = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}[os.getenv("MONGO_READ_ONLY_PREFERENCE", "secondaryPreferred")]
+
+# Clients are created per process on first use (or up front in the app
+# lifespan), never at import. MongoClient and the Drive HTTP client are not
+# fork-safe, so a client inherited from a preloading master is replaced.
+_client = None
+_client_pid = None
+_init_lock = threading.Lock()
+
+def get_client() -> MongoClient:
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _init_lock:
+            if _client is None or _client_pid != os.getpid():
+                from pool_monitor import pool_monitor
+                from metrics import mongo_command_metrics
+
+                _client = MongoClient(
+                    MONGO_URI,
+                    event_listeners=[pool_monitor, mongo_command_metrics],
+                    **MONGO_CLIENT_OPTIONS
+                )
+                _client_pid = os.getpid()
+    return _client
+
+def get_db():
+    return get_client()[MONGO_DB_NAME]
+
+_transactions = {"pid": None, "supported": False}
+
+def transactions_supported() -> bool:
+    """ Replica sets and sharded clusters run multi-document transactions, standalone servers do not """
+    if _transactions["pid"] != os.getpid():
+        try:
+            hello = get_client().admin.command("hello")
+            supported = "setName" in hello or hello.get("msg") == "isdbgrid"
+        except Exception:
+            supported = False
+        _transactions.update(pid=os.getpid(), supported=supported)
+    return _transactions["supported"]
+
+def run_in_transaction(fn):
+    """
+    Runs fn(session) in a transaction (retried on transient errors) when the
+    deployment supports them, else fn(None) as plain sequential writes.
+    """
+    if not transactions_supported():
+        return fn(None)
+    with get_client().start_session() as session:
+        return session.with_transaction(fn)
+
+class LazyDatabase:
+    """ Stands in for the Database so modules can keep `from db import db` """
+    def __getattr__(self, attr):
+        return getattr(get_db(), attr)
+
+    def __getitem__(self, name):
+        return get_db()[name]
+
+class LazyCollection:
+    """ Resolves to this process' collection on every use """
+    def __init__(self, name: str, read_preference=None):
+        self.name = name
+        self.read_preference = read_preference
+
+    def __getattr__(self, attr):
+        collection = get_db()[self.name]
+        if self.read_preference is not None:
+            collection = collection.with_options(read_preference=self.read_preference)
+        return getattr(collection, attr)
+
+    def for_reads(self):
+        """ Same collection routed with READ_ONLY_PREFERENCE, for list / report reads """
+        return LazyCollection(self.name, READ_ONLY_PREFERENCE)
+
+db = LazyDatabase()
+
+employee_collection = LazyCollection("Employees")
+expense_type_collection = LazyCollection("ExpenseTypes")
+expenses_collection = LazyCollection("ExpensesCollection")
+payment_mode_collection = LazyCollection("PaymentModeCollection")
+user_groups_collection = LazyCollection("UserGroupsCollection")
+report_jobs_collection = LazyCollection("ReportJobs")
+storage_usage_collection = LazyCollection("StorageUsage")
+storage_snapshots_collection = LazyCollection("StorageSnapshots")
+scheduler_locks_collection = LazyCollection("SchedulerLocks")
+job_runs_collection = LazyCollection("JobRuns")
+email_outbox_collection = LazyCollection("EmailOutbox")
+rate_limits_collection = LazyCollection("RateLimits")
+idempotency_keys_collection = LazyCollection("IdempotencyKeys")
+expense_tombstones_collection = LazyCollection("ExpenseTombstones")
+expense_signatures_collection = LazyCollection("ExpenseSignatures")
+duplicate_flags_collection = LazyCollection("DuplicateFlags")
+upload_sessions_collection = LazyCollection("UploadSessions")
+user_summaries_collection = LazyCollection("UserExpenseSummaries")
+
+# How long deletes stay visible to incremental readers (analytics refresh)
+TOMBSTONE_RETENTION = timedelta(days=_int_env("TOMBSTONE_RETENTION_DAYS", 30))
+
+# Read-only views for list / report endpoints (may be served by a secondary)
+expenses_read_collection = expenses_collection.for_reads()
+employee_read_collection = employee_collection.for_reads()
+user_groups_read_collection = user_groups_collection.for_reads()
 
 # --- NEW GOOGLE DRIVE SETUP (OAuth2) ---
 TOKEN_FILE = "token.json"
-drive_service = None
-creds = None
+# Send Drive calls to another server (e.g. benchmarks/fake_drive.py) instead of Google
+DRIVE_API_ROOT = os.getenv("DRIVE_API_ROOT")
+_drive_service = None
+_creds = None
+_drive_pid = None
+
+def get_drive():
+    """ Returns (drive_service, creds) for this process, (None, None) without a token """
+    global _drive_service, _creds, _drive_pid
+    if _drive_pid == os.getpid():
+        return _drive_service, _creds
+
+    with _init_lock:
+        if _drive_pid == os.getpid():
+            return _drive_service, _creds
+
+        service, creds = None, None
+        if DRIVE_API_ROOT:
+            service, creds = _build_drive_for_root(DRIVE_API_ROOT)
+            print(f"✅ Google Drive pointed at {DRIVE_API_ROOT}")
+        elif os.path.exists(TOKEN_FILE):
+            try:
+                from google.oauth2.credentials import Credentials
+                from googleapiclient.discovery import build
+
+                creds = Credentials.from_authorized_user_file(TOKEN_FILE)
+                # Bundled discovery document: no network fetch at startup
+                service = build('drive', 'v3', credentials=creds, static_discovery=True, cache_discovery=False)
+                print("✅ Google Drive Connected via OAuth2")
+            except Exception as e:
+                print(f"❌ Failed to load Google Drive Token: {e}")
+        _drive_service, _creds, _drive_pid = service, creds, os.getpid()
+    return _drive_service, _creds
+
+def _build_drive_for_root(root_url: str):
+    """ Drive client with anonymous credentials against a non-Google endpoint """
+    import json
+    from google.auth.credentials import AnonymousCredentials
+    from googleapiclient.discovery import build_from_document
+    from googleapiclient.discovery_cache import get_static_doc
+
+    # Rewriting rootUrl also moves the media upload path (rootUrl + "upload/...")
+    document = json.loads(get_static_doc("drive", "v3"))
+    document["rootUrl"] = root_url.rstrip("/") + "/"
+    creds = AnonymousCredentials()
+    return build_from_document(document, credentials=creds), creds
+
+_drive_local = threading.local()
+
+def drive_http():
+    """ httplib2 is not thread-safe: pass execute(http=drive_http()) so each thread uses its own connection """
+    creds = get_creds()
+    http = getattr(_drive_local, "http", None)
+    if http is None or _drive_local.pid != os.getpid() or http.credentials is not creds:
+        import httplib2
+        from google_auth_httplib2 import AuthorizedHttp
+
+        base = httplib2.Http(timeout=60)
+        # Drive answers resumable upload chunks with 308, which is not a redirect
+        base.redirect_codes = base.redirect_codes - {308}
+        http = AuthorizedHttp(creds, http=base)
+        _drive_local.http, _drive_local.pid = http, os.getpid()
+    return http
+
+def drive_session():
+    """ Per-thread requests.Session for direct downloads, so connections to Drive are reused """
+    session = getattr(_drive_local, "session", None)
+    if session is None or _drive_local.session_pid != os.getpid():
+        import requests
+
+        session = requests.Session()
+        _drive_local.session, _drive_local.session_pid = session, os.getpid()
+    return session
+
+# Access tokens are refreshed this long before they expire, off the request path
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+_refresh_stop = threading.Event()
+_refresher = None
+
+def _refresh_token_loop():
+    from google.auth.transport.requests import Request
+
+    while not _refresh_stop.is_set():
+        creds = get_creds()
+        wait = 300
+        if creds is not None and getattr(creds, "refresh_token", None):
+            try:
+                if creds.expiry is None or creds.expiry - datetime.utcnow() < TOKEN_REFRESH_MARGIN:
+                    creds.refresh(Request())
+                if creds.expiry is not None:
+                    wait = (creds.expiry - datetime.utcnow() - TOKEN_REFRESH_MARGIN).total_seconds()
+            except Exception as e:
+                print(f"❌ Drive token refresh failed, retrying: {e}")
+                wait = 30
+        _refresh_stop.wait(min(max(wait, 5), 300))
+
+def start_token_refresher():
+    """ Keeps this worker's Drive token fresh (from the app lifespan) """
+    global _refresher
+    if _refresher is not None and _refresher.is_alive():
+        return
+    _refresh_stop.clear()
+    _refresher = threading.Thread(target=_refresh_token_loop, daemon=True, name="drive-token-refresh")
+    _refresher.start()
+
+def stop_token_refresher():
+    _refresh_stop.set()
+
+def drive_api_url(path: str) -> str:
+    """ Absolute URL for direct (non client library) Drive requests """
+    return (DRIVE_API_ROOT or "https://www.googleapis.com/").rstrip("/") + "/drive/v3/" + path
+
+def drive_upload_url(path: str) -> str:
+    """ Absolute URL for direct Drive media upload requests """
+    return (DRIVE_API_ROOT or "https://www.googleapis.com/").rstrip("/") + "/upload/drive/v3/" + path
+
+def get_drive_service():
+    return get_drive()[0]
+
+def get_creds():
+    return get_drive()[1]
+
+def close_clients():
+    global _client, _client_pid
+    if _client is not None and _client_pid == os.getpid():
+        _client.close()
+    _client, _client_pid = None, None
+
+def ensure_indexes():
+    """ Creates the indexes the API relies on. Safe to call on every startup. """
+    from search_utils import TEXT_SEARCH_WEIGHTS
+
+    try:
+        expenses_collection.create_index(
+            [(field, "text") for field in TEXT_SEARCH_WEIGHTS],
+            name="expense_text_search",
+            weights=TEXT_SEARCH_WEIGHTS,
+            default_language="none"
+        )
+        expenses_collection.create_index("carNumberNorm")
+        expenses_collection.create_index("carNumberGrams")
+        expenses_collection.create_index("userEmail")
+        # Downloads read the stored name / type / size of an attachment by its Drive id
+        expenses_collection.create_index("attachments.id")
+        # Latest expense of a user (summary repair after edits / deletes)
+        expenses_collection.create_index([("userEmail", 1), ("date", -1), ("_id", -1)])
+        expenses_collection.create_index([("date", 1), ("updatedAt", -1)])
+        # Admin overview: bills still missing
+        expenses_collection.create_index("billAvailable")
+        # Delta sync cursors: (updatedAt, _id), optionally per user
+        expenses_collection.create_index([("updatedAt", 1), ("_id", 1)])
+        expenses_collection.create_index([("userEmail", 1), ("updatedAt", 1), ("_id", 1)])
+        report_jobs_collection.create_index("cacheKey", unique=True)
+        storage_usage_collection.create_index([("scope", 1), ("bytes", -1)])
+        job_runs_collection.create_index([("job", 1), ("startedAt", -1)])
+        job_runs_collection.create_index("finishedAt", expireAfterSeconds=90 * 24 * 3600)
+        email_outbox_collection.create_index("idempotencyKey", unique=True)
+        email_outbox_collection.create_index([("status", 1), ("nextAttemptAt", 1)])
+        # Every status expires (bodies may hold OTPs); see email_outbox.OUTBOX_RETENTION
+        email_outbox_collection.create_index("expiresAt", expireAfterSeconds=0)
+        rate_limits_collection.create_index("updatedAt", expireAfterSeconds=3600)
+        idempotency_keys_collection.create_index("expiresAt", expireAfterSeconds=0)
+        expense_tombstones_collection.create_index(
+            "deletedAt", expireAfterSeconds=int(TOMBSTONE_RETENTION.total_seconds())
+        )
+        expense_tombstones_collection.create_index([("userEmail", 1), ("deletedAt", 1), ("_id", 1)])
+        expense_tombstones_collection.create_index("expenseId")
+        expense_signatures_collection.create_index([("userEmail", 1), ("amountBucket", 1), ("day", 1)])
+        expense_signatures_collection.create_index([("userEmail", 1), ("titleBands", 1), ("day", 1)])
+        expense_signatures_collection.create_index("attachmentChecksums")
+        duplicate_flags_collection.create_index([("status", 1), ("score", -1)])
+        duplicate_flags_collection.create_index("expenseIds")
+        # Deliberately not a TTL index: expire_upload_sessions deletes the sessions itself
+        # so it can remove the Drive files they left behind
+        upload_sessions_collection.create_index("expiresAt")
+    except Exception as e:
+        print(f"❌ Failed to create indexes: {e}")
+
+    # Daily storage snapshots: a time-series collection where the server supports it
+    try:
+        if "StorageSnapshots" not in db.list_collection_names():
+            try:
+                db.create_collection(
+                    "StorageSnapshots",
+                    timeseries={"timeField": "ts", "metaField": "source", "granularity": "hours"}
+                )
+            except Exception:
+                db.create_collection("StorageSnapshots")
+        storage_snapshots_collection.create_index("ts")
+    except Exception as e:
+        print(f"❌ Failed to create indexes: {e}")
+
+def backfill_search_fields(batch_size: int = 1000):
+    """ Adds carNumberNorm / carNumberGrams to expenses created before search existed """
+    from search_utils import search_fields
 
-if os.path.exists(TOKEN_FILE):
     try:
-        creds = Credentials.from_authorized_user_file(TOKEN_FILE) # <--- Assign to global variable
-        drive_service = build('drive', 'v3', credentials=creds)
-        print("✅ Google Drive Connected via OAuth2")
+        ops = []
+        cursor = expenses_collection.find(
+            {"carNumberNorm": {"$exists": False}},
+            {"carNumber": 1}
+        )
+        for exp in cursor:
+            ops.append(UpdateOne(
+                {"_id": exp["_id"]},
+                {"$set": search_fields(exp.get("carNumber", ""))}
+            ))
+            if len(ops) >= batch_size:
+                expenses_collection.bulk_write(ops, ordered=False)
+                ops = []
+        if ops:
+            expenses_collection.bulk_write(ops, ordered=False)
     except Exception as e:
-        print(f"❌ Failed to load Google Drive Token: {e}")
\ No newline at end of file
+        print(f"❌ Failed to backfill search fields: {e}")
@@ -0,0 +1,267 @@
+import os
+import re
+import math
+import hashlib
+from datetime import datetime, date as date_type, timedelta
+from pymongo import UpdateOne
+
+from db import expenses_read_collection, expense_signatures_collection, duplicate_flags_collection, job_runs_collection
+
+# Duplicate claim detection without comparing every pair. Each expense gets a
+# signature document with blocking keys: (userEmail, amount bucket, day), the
+# MinHash bands of its normalized title and the checksums of its attachments.
+# Candidates for an expense are the union of three indexed lookups:
+#   1. same user, amount within tolerance, date within the window
+#   2. same user, a shared title band, date within the window
+#   3. any expense sharing an attachment checksum (the same receipt)
+# Candidates are scored and pairs above FLAG_SCORE land in DuplicateFlags.
+
+AMOUNT_TOLERANCE = float(os.getenv("DUPLICATE_AMOUNT_TOLERANCE", "0.01"))   # relative
+DATE_WINDOW_DAYS = int(os.getenv("DUPLICATE_DATE_WINDOW_DAYS", "7"))
+FLAG_SCORE = float(os.getenv("DUPLICATE_FLAG_SCORE", "0.75"))
+MAX_CANDIDATES = 50
+
+# 5 bands x 4 rows: titles with shingle Jaccard ~0.67 share a band half the time,
+# ~0.85 nearly always
+MINHASH_BANDS = 5
+MINHASH_ROWS = 4
+SHINGLE_SIZE = 3
+_PRIME = (1 << 61) - 1
+_PERMUTATIONS = [
+    (int.from_bytes(hashlib.sha1(f"a{i}".encode()).digest()[:8], "big") % _PRIME | 1,
+     int.from_bytes(hashlib.sha1(f"b{i}".encode()).digest()[:8], "big") % _PRIME)
+    for i in range(MINHASH_BANDS * MINHASH_ROWS)
+]
+
+# ---------------- SIGNATURES ----------------
+def normalize_title(title: str) -> str:
+    """ 'Fuel - Pune trip (Jan)' -> 'fuel pune trip jan' """
+    return " ".join(re.findall(r"[a-z0-9]+", (title or "").lower()))
+
+def title_shingles(normalized: str) -> set:
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+def title_bands(normalized: str) -> list:
+    """ MinHash signature split into bands; two titles sharing a band are candidates """
+    shingles = title_shingles(normalized)
+    if not shingles:
+        return []
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big") for s in shingles]
+    minhash = [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+    return [
+        f"{band}:" + hashlib.blake2b(
+            str(minhash[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS]).encode(), digest_size=8
+        ).hexdigest()
+        for band in range(MINHASH_BANDS)
+    ]
+
+def amount_bucket(amount) -> int:
+    """
+    Logarithmic buckets one tolerance wide: amounts within the tolerance are in
+    the same or a neighbouring bucket. -1 for zero / missing amounts.
+    """
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        return -1
+    if amount <= 0:
+        return -1
+    return int(math.floor(math.log(amount) / math.log1p(AMOUNT_TOLERANCE)))
+
+def day_number(value):
+    """ Expense dates are stored as 'YYYY-MM-DD...' strings (or datetimes) """
+    if isinstance(value, (datetime, date_type)):
+        return value.toordinal()
+    try:
+        return date_type(int(value[0:4]), int(value[5:7]), int(value[8:10])).toordinal()
+    except (TypeError, ValueError):
+        return None
+
+def attachment_checksums(expense: dict) -> list:
+    return sorted({
+        att["md5Checksum"] for att in expense.get("attachments") or []
+        if isinstance(att, dict) and att.get("md5Checksum")
+    })
+
+def build_signature(expense: dict) -> dict:
+    normalized = normalize_title(expense.get("title"))
+    return {
+        "_id": expense["_id"],
+        "userEmail": expense.get("userEmail"),
+        "amount": expense.get("amount"),
+        "amountBucket": amount_bucket(expense.get("amount")),
+        "day": day_number(expense.get("date")),
+        "expenseTypeId": expense.get("expenseTypeId"),
+        "titleNorm": normalized,
+        "titleBands": title_bands(normalized),
+        "attachmentChecksums": attachment_checksums(expense),
+        "updatedAt": datetime.utcnow(),
+    }
+
+# ---------------- MATCHING ----------------
+def _candidates(sig: dict, newer_only: bool = False) -> list:
+    """ Union of the three blocking lookups, without the expense itself """
+    own_id = {"$gt": sig["_id"]} if newer_only else {"$ne": sig["_id"]}
+    lookups = []
+    if sig["day"] is not None:
+        window = {"$gte": sig["day"] - DATE_WINDOW_DAYS, "$lte": sig["day"] + DATE_WINDOW_DAYS}
+        if sig["amountBucket"] >= 0:
+            bucket = sig["amountBucket"]
+            lookups.append({
+                "userEmail": sig["userEmail"],
+                "amountBucket": {"$in": [bucket - 1, bucket, bucket + 1]},
+                "day": window,
+            })
+        if sig["titleBands"]:
+            lookups.append({"userEmail": sig["userEmail"], "titleBands": {"$in": sig["titleBands"]}, "day": window})
+    if sig["attachmentChecksums"]:
+        lookups.append({"attachmentChecksums": {"$in": sig["attachmentChecksums"]}})
+
+    found = {}
+    for lookup in lookups:
+        lookup["_id"] = own_id
+        for candidate in expense_signatures_collection.find(lookup).limit(MAX_CANDIDATES):
+            found[candidate["_id"]] = candidate
+    return list(found.values())
+
+def _jaccard(a: str, b: str) -> float:
+    sa, sb = title_shingles(a), title_shingles(b)
+    if not sa or not sb:
+        return 0.0
+    return len(sa & sb) / len(sa | sb)
+
+def score_pair(a: dict, b: dict):
+    """ 0..1 likelihood that two signatures are the same claim, with the reasons """
+    reasons = []
+    shared_receipts = set(a["attachmentChecksums"]) & set(b["attachmentChecksums"])
+    if shared_receipts:
+        reasons.append("same_receipt")
+
+    try:
+        amount_a, amount_b = float(a["amount"]), float(b["amount"])
+        difference = abs(amount_a - amount_b) / max(amount_a, amount_b, 1e-9)
+    except (TypeError, ValueError):
+        difference = 1.0
+    amount_score = 1.0 if difference <= AMOUNT_TOLERANCE else 0.5 if difference <= 0.1 else 0.0
+    if amount_score == 1.0:
+        reasons.append("same_amount")
+
+    if a["day"] is not None and b["day"] is not None and abs(a["day"] - b["day"]) <= DATE_WINDOW_DAYS:
+        days_apart = abs(a["day"] - b["day"])
+        date_score = 1 - days_apart / (DATE_WINDOW_DAYS + 1)
+        reasons.append("same_day" if days_apart == 0 else f"{days_apart}_days_apart")
+    else:
+        date_score = 0.0
+
+    title_score = _jaccard(a["titleNorm"], b["titleNorm"])
+    if title_score >= 0.6:
+        reasons.append("similar_title")
+
+    score = 0.35 * amount_score + 0.25 * date_score + 0.4 * title_score
+    if a["userEmail"] != b["userEmail"]:
+        score *= 0.5
+    if shared_receipts:
+        score = 1.0
+    return round(score, 3), reasons
+
+def pair_id(a, b) -> str:
+    return ":".join(sorted([str(a), str(b)]))
+
+def _flag_ops(sig: dict, candidates: list) -> dict:
+    """ pair id -> upsert for every candidate scoring at least FLAG_SCORE """
+    now = datetime.utcnow()
+    ops = {}
+    for candidate in candidates:
+        score, reasons = score_pair(sig, candidate)
+        if score < FLAG_SCORE:
+            continue
+        key = pair_id(sig["_id"], candidate["_id"])
+        ops[key] = UpdateOne(
+            {"_id": key},
+            {
+                "$set": {
+                    "expenseIds": sorted([str(sig["_id"]), str(candidate["_id"])]),
+                    "userEmails": sorted({sig["userEmail"], candidate["userEmail"]} - {None}),
+                    "score": score,
+                    "reasons": reasons,
+                    "updatedAt": now,
+                },
+                # A reviewer's decision sticks when the pair is detected again
+                "$setOnInsert": {"status": "open", "detectedAt": now},
+            },
+            upsert=True
+        )
+    return ops
+
+# ---------------- ENTRY POINTS ----------------
+def check_expense(expense: dict) -> list:
+    """
+    Refreshes the expense's signature and flags after a create / update.
+    Returns the ids of the expenses it now looks like a duplicate of.
+    """
+    sig = build_signature(expense)
+    expense_signatures_collection.replace_one({"_id": sig["_id"]}, sig, upsert=True)
+
+    ops = _flag_ops(sig, _candidates(sig))
+    flagged = list(ops)
+    # Open pairs the edit no longer supports are withdrawn
+    duplicate_flags_collection.delete_many({
+        "expenseIds": str(sig["_id"]), "status": "open", "_id": {"$nin": flagged}
+    })
+    if ops:
+        duplicate_flags_collection.bulk_write(list(ops.values()), ordered=False)
+    return [other for key in flagged for other in key.split(":") if other != str(sig["_id"])]
+
+def check_expense_safely(expense: dict) -> list:
+    """ Detection must never fail the write it runs after """
+    try:
+        return check_expense(expense)
+    except Exception as e:
+        print(f"Duplicate check failed for {expense.get('_id')}: {e}")
+        return []
+
+def forget_expense(expense_id):
+    expense_signatures_collection.delete_one({"_id": expense_id})
+    duplicate_flags_collection.delete_many({"expenseIds": str(expense_id), "status": "open"})
+
+def _last_sweep_start():
+    run = job_runs_collection.find_one({"job": "duplicate_sweep", "status": "success"}, sort=[("startedAt", -1)])
+    return run["startedAt"] if run else None
+
+def sweep(full: bool = False, batch_size: int = 1000) -> dict:
+    """
+    Batch pass: (re)builds signatures, then flags pairs. After the first full
+    pass only expenses updated since the last successful sweep are checked.
+    """
+    since = None if full else _last_sweep_start()
+    full = since is None
+    query = {} if full else {"updatedAt": {"$gte": since - timedelta(minutes=5)}}
+
+    # 1. Signatures first, so pass 2 sees every counterpart
+    checked_ids, ops = [], []
+    for expense in expenses_read_collection.find(query, {"title": 1, "userEmail": 1, "amount": 1, "date": 1,
+                                                        "expenseTypeId": 1, "attachments": 1}).sort("_id", 1):
+        sig = build_signature(expense)
+        ops.append(UpdateOne({"_id": sig["_id"]}, {"$set": sig}, upsert=True))
+        checked_ids.append(sig["_id"])
+        if len(ops) >= batch_size:
+            expense_signatures_collection.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        expense_signatures_collection.bulk_write(ops, ordered=False)
+
+    # 2. Pairs. A full pass only looks "forward" (newer _id), so each pair is scored once
+    flagged = 0
+    for start in range(0, len(checked_ids), batch_size):
+        ops = []
+        for sig in expense_signatures_collection.find({"_id": {"$in": checked_ids[start:start + batch_size]}}):
+            ops.extend(_flag_ops(sig, _candidates(sig, newer_only=full)).values())
+        if ops:
+            duplicate_flags_collection.bulk_write(ops, ordered=False)
+            flagged += len(ops)
+
+    result = {"full": full, "checkedExpenses": len(checked_ids), "flaggedPairs": flagged}
+    print(f"[duplicates] Sweep finished: {result}")
+    return result
@@ -0,0 +1,163 @@
+import os
+import random
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from db import email_outbox_collection
+from mail_utils import SENDER, MAILEROO_POOL_SIZE, get_maileroo_client, email_address
+
+# Emails are written to the EmailOutbox collection and sent by a background
+# sender in every worker. A message is claimed with a short lease, so two
+# workers never send it twice, and a crashed send is picked up again once the
+# lease runs out. Failures are retried with exponential backoff. Bodies can
+# carry OTPs, so they are dropped once a message is sent or given up on, and
+# every message expires OUTBOX_RETENTION after it was queued, whatever its status.
+
+MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "6"))
+RETRY_BASE = timedelta(seconds=int(os.getenv("EMAIL_RETRY_BASE_SECONDS", "10")))
+RETRY_MAX = timedelta(minutes=30)
+SEND_LEASE = timedelta(minutes=2)
+OUTBOX_RETENTION = timedelta(days=int(os.getenv("EMAIL_OUTBOX_RETENTION_DAYS", "30")))
+POLL_SECONDS = 5
+
+_wakeup = threading.Event()
+_stop = threading.Event()
+_sender_thread = None
+_sender_pid = None
+
+def reference_id_for(idempotency_key: str) -> str:
+    """ Maileroo reference ids are 24 hex chars; derive it so retries reuse it """
+    return hashlib.sha1(idempotency_key.encode()).hexdigest()[:24]
+
+def enqueue_email(to, subject: str, plain: str = None, html: str = None, idempotency_key: str = None) -> dict:
+    """
+    Stores the email for the background sender and returns the outbox document.
+    Enqueuing the same idempotency_key again returns the existing message.
+    """
+    recipients = [to] if isinstance(to, str) else list(to)
+    if idempotency_key is None:
+        idempotency_key = hashlib.sha1(f"{recipients}|{subject}|{plain}|{html}".encode()).hexdigest()
+
+    now = datetime.utcnow()
+    message = {
+        "idempotencyKey": idempotency_key,
+        "referenceId": reference_id_for(idempotency_key),
+        "from": {"address": SENDER[0], "displayName": SENDER[1]},
+        "to": recipients,
+        "subject": subject,
+        "plain": plain,
+        "html": html,
+        "status": "pending",
+        "attempts": 0,
+        "nextAttemptAt": now,
+        "createdAt": now,
+        "expiresAt": now + OUTBOX_RETENTION,
+    }
+    try:
+        message["_id"] = email_outbox_collection.insert_one(message).inserted_id
+    except DuplicateKeyError:
+        return email_outbox_collection.find_one({"idempotencyKey": idempotency_key})
+
+    _wakeup.set()
+    return message
+
+def _claim():
+    now = datetime.utcnow()
+    return email_outbox_collection.find_one_and_update(
+        {"$or": [
+            {"status": "pending", "nextAttemptAt": {"$lte": now}},
+            {"status": "sending", "leaseUntil": {"$lt": now}},
+        ]},
+        {"$set": {"status": "sending", "leaseUntil": now + SEND_LEASE}, "$inc": {"attempts": 1}},
+        sort=[("nextAttemptAt", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+def _backoff(attempts: int) -> timedelta:
+    delay = min(RETRY_BASE * (2 ** (attempts - 1)), RETRY_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+def _send(message: dict):
+    try:
+        get_maileroo_client().send_basic_email({
+            "from": email_address(message["from"]["address"], message["from"].get("displayName")),
+            "to": [email_address(address) for address in message["to"]],
+            "subject": message["subject"],
+            "plain": message.get("plain"),
+            "html": message.get("html"),
+            "reference_id": message["referenceId"],
+        })
+    except Exception as e:
+        # Invalid messages (ValueError from the SDK) will never succeed
+        give_up = isinstance(e, ValueError) or message["attempts"] >= MAX_ATTEMPTS
+        update = {"status": "failed"} if give_up else {
+            "status": "pending",
+            "nextAttemptAt": datetime.utcnow() + _backoff(message["attempts"]),
+        }
+        update["lastError"] = str(e)
+        unset = {"leaseUntil": "", "plain": "", "html": ""} if give_up else {"leaseUntil": ""}
+        email_outbox_collection.update_one({"_id": message["_id"]}, {"$set": update, "$unset": unset})
+        print(f"[outbox] Sending '{message['subject']}' failed (attempt {message['attempts']}): {e}")
+        return
+
+    email_outbox_collection.update_one(
+        {"_id": message["_id"]},
+        {"$set": {"status": "sent", "sentAt": datetime.utcnow()}, "$unset": {"leaseUntil": "", "lastError": "", "plain": "", "html": ""}}
+    )
+
+def _run_sender():
+    slots = threading.BoundedSemaphore(MAILEROO_POOL_SIZE)
+    with ThreadPoolExecutor(max_workers=MAILEROO_POOL_SIZE, thread_name_prefix="email-send") as pool:
+        while not _stop.is_set():
+            # Only claim what can be sent right away; the rest stays visible to other workers
+            slots.acquire()
+            try:
+                message = _claim()
+            except Exception as e:
+                print(f"[outbox] Could not read the outbox: {e}")
+                message = None
+            if message is None:
+                slots.release()
+                _wakeup.wait(POLL_SECONDS)
+                _wakeup.clear()
+                continue
+
+            def send_and_release(message=message):
+                try:
+                    _send(message)
+                finally:
+                    slots.release()
+
+            pool.submit(send_and_release)
+
+def start_outbox_sender():
+    """ Starts this worker's sender thread (from the app lifespan) """
+    global _sender_thread, _sender_pid
+    if _sender_pid == os.getpid() and _sender_thread.is_alive():
+        return
+    _stop.clear()
+    _sender_thread = threading.Thread(target=_run_sender, daemon=True, name="email-outbox")
+    _sender_thread.start()
+    _sender_pid = os.getpid()
+
+def stop_outbox_sender():
+    _stop.set()
+    _wakeup.set()
+    if _sender_thread is not None and _sender_pid == os.getpid():
+        _sender_thread.join(timeout=10)
+
+def outbox_status() -> dict:
+    counts = {
+        row["_id"]: row["count"]
+        for row in email_outbox_collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}])
+    }
+    failed = list(email_outbox_collection.find(
+        {"status": "failed"}, {"subject": 1, "to": 1, "attempts": 1, "lastError": 1, "createdAt": 1}
+    ).sort("createdAt", -1).limit(20))
+    for message in failed:
+        message["_id"] = str(message["_id"])
+    return {"counts": counts, "recentFailures": failed}
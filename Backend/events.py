@@ -0,0 +1,258 @@
+import os
+import json
+import uuid
+import asyncio
+import threading
+from collections import deque
+from pymongo.errors import PyMongoError
+
+from db import get_db
+
+# Live change events for /events/stream (Server-Sent Events).
+# With a replica set every worker tails one Mongo change stream, so a client
+# sees writes made by any worker and event ids are resume tokens that are the
+# same everywhere. Without change streams (standalone server, local dev) the
+# routes publish their own writes to an in-process bus instead; clients then
+# only see writes handled by the worker they are connected to.
+#
+# Each worker keeps the last EVENTS_REPLAY_BUFFER events, so a reconnect with
+# Last-Event-ID continues where it stopped. A subscriber whose queue fills up
+# is disconnected and catches up from the buffer on reconnect; when its last
+# id is no longer buffered it gets a `reset` event and should refetch.
+
+EVENTS_SOURCE = os.getenv("EVENTS_SOURCE", "auto")            # auto | changestream | memory
+REPLAY_BUFFER = int(os.getenv("EVENTS_REPLAY_BUFFER", "1000"))
+SUBSCRIBER_QUEUE = int(os.getenv("EVENTS_SUBSCRIBER_QUEUE", "256"))
+MAX_SUBSCRIBERS = int(os.getenv("EVENTS_MAX_SUBSCRIBERS", "500"))
+HEARTBEAT_SECONDS = 15
+
+# Mongo collection -> name used in events
+WATCHED_COLLECTIONS = {
+    "ExpensesCollection": "expenses",
+    "ExpenseTypes": "expenseTypes",
+    "PaymentModeCollection": "paymentModes",
+    "UserGroupsCollection": "userGroups",
+    # Expense deletes are read from their tombstones, which carry the userEmail
+    "ExpenseTombstones": "expenses",
+}
+EVENT_COLLECTIONS = sorted(set(WATCHED_COLLECTIONS.values()))
+
+# ---------------- BUS ----------------
+class Subscriber:
+    def __init__(self, loop, collections: set, user_email: str = None):
+        self.loop = loop
+        self.collections = collections
+        self.user_email = user_email
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE)
+        self.overflowed = False
+
+    def matches(self, event: dict) -> bool:
+        if event["collection"] not in self.collections:
+            return False
+        if self.user_email and event["collection"] == "expenses":
+            return event.get("userEmail") == self.user_email
+        return True
+
+    def offer(self, event: dict):
+        """ Called from any thread; the queue is only touched on the subscriber's loop """
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event: dict):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too slow: stop feeding it, the stream ends once the queue drains
+            self.overflowed = True
+
+class EventBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=REPLAY_BUFFER)
+        self._subscribers = set()
+        self._seq = 0
+        self._boot = uuid.uuid4().hex[:8]
+
+    def publish(self, event: dict):
+        with self._lock:
+            if "id" not in event:
+                self._seq += 1
+                event["id"] = f"{self._boot}.{self._seq}"
+            self._recent.append(event)
+            for subscriber in self._subscribers:
+                if subscriber.matches(event):
+                    try:
+                        subscriber.offer(event)
+                    except RuntimeError:
+                        # Its event loop is gone; unsubscribe will follow
+                        pass
+
+    def subscribe(self, subscriber: Subscriber, last_event_id: str = None):
+        """
+        Registers the subscriber and returns the buffered events it missed,
+        or None when last_event_id is no longer buffered.
+        Done under the lock so nothing falls between replay and live events.
+        """
+        with self._lock:
+            if len(self._subscribers) >= MAX_SUBSCRIBERS:
+                raise OverflowError("Too many event subscribers")
+            self._subscribers.add(subscriber)
+            if not last_event_id:
+                return []
+            for position, event in enumerate(self._recent):
+                if event["id"] == last_event_id:
+                    return [e for e in list(self._recent)[position + 1:] if subscriber.matches(e)]
+            return None
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "buffered": len(self._recent),
+                "lastEventId": self._recent[-1]["id"] if self._recent else None,
+            }
+
+bus = EventBus()
+
+# ---------------- SOURCES ----------------
+_mode = "memory"
+_stop = threading.Event()
+_watcher = None
+
+def _plain(document):
+    if document is None:
+        return None
+    return json.loads(json.dumps(document, default=str))
+
+def publish_change(collection: str, op: str, doc_id, document: dict = None, changes: dict = None, user_email: str = None):
+    """
+    Called by the routes after a write. Ignored while the change stream is the
+    source, since the same write will arrive from there.
+    op: insert | update | delete
+    """
+    if _mode != "memory":
+        return
+    bus.publish({
+        "collection": collection,
+        "op": op,
+        "documentId": str(doc_id),
+        "userEmail": user_email,
+        "document": _plain(document),
+        "changes": _plain(changes),
+    })
+
+def _event_from_change(change: dict):
+    source = change["ns"]["coll"]
+    op = change["operationType"]
+    collection = WATCHED_COLLECTIONS[source]
+    document = change.get("fullDocument")
+
+    if source == "ExpenseTombstones":
+        if op != "insert":
+            return None       # TTL expiry
+        return {
+            "id": change["_id"]["_data"],
+            "collection": collection,
+            "op": "delete",
+            "documentId": str(document["expenseId"]),
+            "userEmail": document.get("userEmail"),
+            "document": None,
+            "changes": None,
+        }
+    if source == "ExpensesCollection" and op == "delete":
+        return None           # reported through the tombstone
+
+    return {
+        "id": change["_id"]["_data"],
+        "collection": collection,
+        "op": "insert" if op == "insert" else "delete" if op == "delete" else "update",
+        "documentId": str(change["documentKey"]["_id"]),
+        "userEmail": document.get("userEmail") if document else None,
+        "document": _plain(document),
+        "changes": _plain(change.get("updateDescription", {}).get("updatedFields")),
+    }
+
+def _pipeline():
+    return [{"$match": {
+        "ns.coll": {"$in": list(WATCHED_COLLECTIONS)},
+        "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+    }}]
+
+def _watch(resume_after):
+    """ Tails the change stream, reopening it from the last token after errors """
+    while not _stop.is_set():
+        try:
+            with get_db().watch(_pipeline(), full_document="updateLookup", resume_after=resume_after,
+                                max_await_time_ms=1000) as stream:
+                while not _stop.is_set():
+                    change = stream.try_next()
+                    if change is None:
+                        continue
+                    resume_after = change["_id"]
+                    event = _event_from_change(change)
+                    if event:
+                        bus.publish(event)
+        except PyMongoError as e:
+            print(f"[events] Change stream interrupted, reopening: {e}")
+            _stop.wait(2)
+
+def start_event_source():
+    """ Picks change streams when the server supports them (from the app lifespan) """
+    global _mode, _watcher
+    if EVENTS_SOURCE == "memory" or (_watcher is not None and _watcher.is_alive()):
+        return
+    try:
+        with get_db().watch(_pipeline(), max_await_time_ms=1) as stream:
+            stream.try_next()
+            resume_after = stream.resume_token
+    except Exception as e:
+        if EVENTS_SOURCE == "changestream":
+            print(f"[events] Change streams unavailable, falling back to in-process events: {e}")
+        return
+
+    _mode = "changestream"
+    _stop.clear()
+    _watcher = threading.Thread(target=_watch, args=(resume_after,), daemon=True, name="change-stream")
+    _watcher.start()
+
+def stop_event_source():
+    _stop.set()
+    if _watcher is not None:
+        _watcher.join(timeout=5)
+
+def events_status() -> dict:
+    return {"source": _mode, **bus.status()}
+
+# ---------------- SSE ----------------
+def _format(event: dict) -> str:
+    payload = {k: v for k, v in event.items() if k != "id"}
+    return f"id: {event['id']}\nevent: {event['collection']}.{event['op']}\ndata: {json.dumps(payload)}\n\n"
+
+async def event_stream(subscriber: Subscriber, backlog, is_disconnected):
+    """ Yields SSE frames: replay or reset first, then live events and heartbeats """
+    try:
+        yield "retry: 3000\n\n"
+        if backlog is None:
+            yield f"event: reset\ndata: {json.dumps({'reason': 'Last-Event-ID is too old, refetch'})}\n\n"
+        else:
+            for event in backlog:
+                yield _format(event)
+
+        while True:
+            if subscriber.overflowed and subscriber.queue.empty():
+                break
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), timeout=HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    break
+                yield ": ping\n\n"
+                continue
+            yield _format(event)
+    finally:
+        bus.unsubscribe(subscriber)
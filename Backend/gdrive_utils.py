@@ -1,60 +1,98 @@
 import os
 import io
-import requests
+import asyncio
+from datetime import datetime
 import http.client
-from googleapiclient.http import MediaIoBaseUpload
-from googleapiclient.errors import HttpError
 from fastapi import UploadFile
-from db import drive_service, creds  # <--- IMPORT creds from db.py
+from db import get_drive_service, get_creds, drive_http, drive_session, drive_api_url  # per-process clients from db.py
+from metrics import drive_call, drive_error, drive_bytes, record_attachment_processing
+from attachment_processing import KEEP_ORIGINAL, should_process, compact_attachment
 
 # Your Folder ID
 PARENT_FOLDER_ID = "1SUWfwdjJTunwl0wB-_ohm1OA2AB0UnP8"
 
-async def upload_file_to_drive(file: UploadFile):
-    """
-    Uploads a single file. (This remains unchanged, but we call it differently in expense.py)
-    """
+def _create_drive_file(content: bytes, filename: str, mime_type: str) -> dict:
+    from googleapiclient.http import MediaIoBaseUpload
+
+    drive_service = get_drive_service()
     if not drive_service:
         raise Exception("Google Drive Service not initialized.")
 
     file_metadata = {
-        'name': file.filename,
+        'name': filename,
         'parents': [PARENT_FOLDER_ID] 
     }
-    
-    # Read file into memory
-    content = await file.read()
-    buffer = io.BytesIO(content)
-    
     media = MediaIoBaseUpload(
-        buffer, 
-        mimetype=file.content_type,
+        io.BytesIO(content),
+        mimetype=mime_type,
         resumable=True
     )
     
-    file_drive = drive_service.files().create(
-        body=file_metadata,
-        media_body=media,
-        fields='id, name, webViewLink, webContentLink'
-    ).execute()
-    
-    return {
+    with drive_call("files.create"):
+        file_drive = drive_service.files().create(
+            body=file_metadata,
+            media_body=media,
+            fields='id, name, webViewLink, webContentLink, md5Checksum'
+        ).execute(http=drive_http())
+    drive_bytes("upload", len(content))
+    return file_drive
+
+async def upload_file_to_drive(file: UploadFile):
+    """
+    Uploads a single file. Images / PDFs are compacted first when
+    ATTACHMENT_PROCESSING is on (see attachment_processing.py).
+    """
+    # Read file into memory
+    content = await file.read()
+    filename, mime_type = file.filename, file.content_type
+
+    processing = None
+    if should_process(content, mime_type):
+        processed = await compact_attachment(content, mime_type, filename)
+        processing = processed["report"]
+        record_attachment_processing(mime_type, processing)
+        print(f"[attachments] {filename}: {processing}")
+        if processed["action"] == "compacted":
+            filename, mime_type = processed["filename"], processed["contentType"]
+        stored = processed["content"]
+    else:
+        stored = content
+
+    # In a thread: the Drive client blocks, and gathered uploads should overlap
+    file_drive = await asyncio.to_thread(_create_drive_file, stored, filename, mime_type)
+    metadata = {
         "id": file_drive.get('id'),
         "filename": file_drive.get('name'),
         "viewLink": file_drive.get('webViewLink'),
-        "downloadLink": file_drive.get('webContentLink')
+        "downloadLink": file_drive.get('webContentLink'),
+        # Stored so downloads need no metadata call to Drive
+        "size": len(stored),
+        "mimeType": mime_type,
+        # Same receipt uploaded twice -> same checksum (duplicate detection)
+        "md5Checksum": file_drive.get('md5Checksum'),
+        "uploadedAt": datetime.now()
     }
+    if processing:
+        metadata["processing"] = processing
+        if KEEP_ORIGINAL and processing["action"] == "compacted":
+            original = await asyncio.to_thread(_create_drive_file, content, f"original-{file.filename}", file.content_type)
+            metadata["original"] = {"id": original.get('id'), "filename": original.get('name'), "size": len(content)}
+    return metadata
 
 def delete_file_from_drive(file_id: str):
     """ Robust delete function from previous step """
+    from googleapiclient.errors import HttpError
+
+    drive_service = get_drive_service()
     if not drive_service: return False
     try:
-        drive_service.files().delete(fileId=file_id).execute()
+        with drive_call("files.delete"):
+            drive_service.files().delete(fileId=file_id).execute(http=drive_http())
         return True
     except http.client.IncompleteRead:
         # Check if actually deleted
         try:
-            drive_service.files().get(fileId=file_id).execute()
+            drive_service.files().get(fileId=file_id).execute(http=drive_http())
             return False 
         except HttpError as err:
             if err.resp.status == 404: return True
@@ -65,44 +103,70 @@ def delete_file_from_drive(file_id: str):
     except Exception:
         return False
 
-def stream_file_content(file_id: str):
+def delete_attachment_files(att) -> bool:
+    """ Deletes an attachment and the original kept next to it, if any """
+    if not isinstance(att, dict):
+        return delete_file_from_drive(att)
+    if att.get("original"):
+        delete_file_from_drive(att["original"]["id"])
+    return delete_file_from_drive(att["id"])
+
+def stream_file_content(file_id: str, attachment: dict = None):
     """
-    NEW: Generators that yield file chunks for instant download start.
-    Returns: (generator, filename, mime_type)
+    Generators that yield file chunks for instant download start.
+    attachment: the stored attachment entry; its filename / mimeType / size
+    save the metadata call to Drive (older entries without them still make it).
+    Returns: (generator, filename, mime_type, size)
     """
     try:
-        # 1. Get Metadata (to know filename and type)
-        meta = drive_service.files().get(
-            fileId=file_id, 
-            fields="name, mimeType, size"
-        ).execute()
-        
-        filename = meta.get('name')
-        mime_type = meta.get('mimeType')
+        creds = get_creds()
+
+        # 1. Metadata: stored at upload time, or asked from Drive for older attachments
+        if attachment and attachment.get("mimeType") and attachment.get("size") is not None:
+            filename, mime_type, size = attachment.get("filename"), attachment["mimeType"], attachment["size"]
+        else:
+            with drive_call("files.get"):
+                meta = get_drive_service().files().get(
+                    fileId=file_id,
+                    fields="name, mimeType, size"
+                ).execute(http=drive_http())
+            filename, mime_type = meta.get('name'), meta.get('mimeType')
+            size = int(meta['size']) if meta.get('size') else None
 
         # 2. Prepare the Direct Download URL
-        url = f"https://www.googleapis.com/drive/v3/files/{file_id}?alt=media"
-        
-        # 3. Get the Token (Refresh if needed handled by google-auth)
-        if not creds or not creds.valid:
+        url = drive_api_url(f"files/{file_id}?alt=media")
+
+        # 3. The token is kept fresh by db.start_token_refresher; refresh here only if that fell behind
+        if creds is not None and getattr(creds, "refresh_token", None) and not creds.valid:
             from google.auth.transport.requests import Request
             creds.refresh(Request())
-            
-        headers = {"Authorization": f"Bearer {creds.token}"}
 
-        # 4. Stream the request using 'requests' library
+        # identity: the bytes as stored, so Content-Length matches what is sent
+        headers = {"Authorization": f"Bearer {creds.token}", "Accept-Encoding": "identity"}
+
+        # 4. Stream the request on this thread's pooled session
         # stream=True prevents loading the whole file into RAM
-        response = requests.get(url, headers=headers, stream=True)
-        
+        with drive_call("files.download"):
+            response = drive_session().get(url, headers=headers, stream=True)
+        if response.status_code >= 400:
+            drive_error("files.download")
+            response.close()
+            print(f"Stream Error: Drive answered {response.status_code} for {file_id}")
+            return None, None, None, None
+
         # Define a generator function to yield chunks
         def iterfile():
-            # Chunk size: 64KB (balance between memory usage and speed)
-            for chunk in response.iter_content(chunk_size=65536):
-                if chunk:
-                    yield chunk
+            try:
+                # Chunk size: 64KB (balance between memory usage and speed)
+                for chunk in response.iter_content(chunk_size=65536):
+                    if chunk:
+                        drive_bytes("download", len(chunk))
+                        yield chunk
+            finally:
+                response.close()
 
-        return iterfile, filename, mime_type
+        return iterfile, filename, mime_type, size
 
     except Exception as e:
         print(f"Stream Error: {e}")
-        return None, None, None
\ No newline at end of file
+        return None, None, None, None
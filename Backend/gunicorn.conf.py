@@ -0,0 +1,26 @@
+# Production settings for: gunicorn -c gunicorn.conf.py main:app
+# (python serve.py reads the same environment variables)
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Seconds an idle keep-alive connection is held open
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+# Seconds a worker may spend on a single request before it is restarted
+timeout = int(os.getenv("TIMEOUT", "120"))
+# Seconds in-flight requests get to finish on shutdown / reload
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+
+# Safe because Mongo, Drive and Maileroo clients are created per worker in the
+# app lifespan (see main.lifespan), never in the preloaded master
+preload_app = os.getenv("PRELOAD_APP", "true").lower() == "true"
+
+# Recycle workers now and then to cap slow memory growth
+max_requests = int(os.getenv("MAX_REQUESTS", "2000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "200"))
+
+accesslog = os.getenv("ACCESS_LOG", "-")
+errorlog = "-"
@@ -0,0 +1,107 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from db import idempotency_keys_collection
+
+# Idempotency-Key support for the slow, non-repeatable writes (expense create /
+# update with Drive uploads). The first request with a key claims it; its result
+# is stored and replayed to any retry with the same key. A retry that arrives
+# while the first one is still running waits for its result instead of doing
+# the work again. Keys expire after IDEMPOTENCY_TTL_HOURS.
+
+IDEMPOTENCY_TTL = timedelta(hours=int(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")))
+# A claim older than this is treated as abandoned (worker died) and can be taken over
+IN_PROGRESS_LEASE = timedelta(minutes=5)
+WAIT_FOR_RESULT_SECONDS = 60
+POLL_SECONDS = 0.25
+
+def request_fingerprint(fields: dict, files=()) -> str:
+    """ Identifies the request behind a key; file contents are summarised by name, type and size """
+    payload = {
+        "fields": {k: v for k, v in fields.items() if v is not None},
+        "files": [[f.filename, f.content_type, f.size] for f in files],
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+def _claim(key_id: str, fingerprint: str):
+    """ Returns None when this request now owns the key, else the existing record """
+    now = datetime.utcnow()
+    try:
+        idempotency_keys_collection.insert_one({
+            "_id": key_id,
+            "fingerprint": fingerprint,
+            "status": "in_progress",
+            "leaseUntil": now + IN_PROGRESS_LEASE,
+            "createdAt": now,
+            "expiresAt": now + IDEMPOTENCY_TTL,
+        })
+        return None
+    except DuplicateKeyError:
+        pass
+
+    # Take over an abandoned claim
+    taken = idempotency_keys_collection.find_one_and_update(
+        {"_id": key_id, "status": "in_progress", "fingerprint": fingerprint, "leaseUntil": {"$lt": now}},
+        {"$set": {"leaseUntil": now + IN_PROGRESS_LEASE}},
+        return_document=ReturnDocument.AFTER
+    )
+    if taken:
+        return None
+    return idempotency_keys_collection.find_one({"_id": key_id})
+
+def _replay(record: dict):
+    response = record["response"]
+    if response["status_code"] >= 400:
+        raise HTTPException(status_code=response["status_code"], detail=response["body"])
+    return response["body"]
+
+async def run_idempotent(scope: str, key: str, fingerprint: str, work):
+    """
+    Runs `await work()` once per (scope, key) and returns its result.
+    HTTP 4xx outcomes are stored and replayed too; other failures free the key.
+    """
+    if not key:
+        return await work()
+
+    key_id = f"{scope}:{key}"
+    record = _claim(key_id, fingerprint)
+    deadline = time.monotonic() + WAIT_FOR_RESULT_SECONDS
+    while record is not None:
+        if record["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+        if record["status"] == "done":
+            return _replay(record)
+        if time.monotonic() > deadline:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        await asyncio.sleep(POLL_SECONDS)
+        record = _claim(key_id, fingerprint)
+
+    try:
+        result = await work()
+    except HTTPException as e:
+        if e.status_code >= 500:
+            idempotency_keys_collection.delete_one({"_id": key_id, "status": "in_progress"})
+        else:
+            _store(key_id, e.status_code, e.detail)
+        raise
+    except BaseException:
+        # Nothing durable to replay: let the retry run the request again
+        idempotency_keys_collection.delete_one({"_id": key_id, "status": "in_progress"})
+        raise
+
+    _store(key_id, 200, result)
+    return result
+
+def _store(key_id: str, status_code: int, body):
+    idempotency_keys_collection.update_one(
+        {"_id": key_id},
+        {"$set": {"status": "done", "response": {"status_code": status_code, "body": body}, "finishedAt": datetime.utcnow()},
+         "$unset": {"leaseUntil": ""}}
+    )
@@ -0,0 +1,87 @@
+import os
+import threading
+
+# maileroo and requests are imported on first use to keep startup fast
+
+# Sender used by every outgoing email
+SENDER = ("rataagroup@bfbbc79e67369a72.maileroo.org", "Rataa Group")
+
+# Outbox sender threads share the client, so its connection pool must fit them
+MAILEROO_POOL_SIZE = int(os.getenv("EMAIL_SEND_CONCURRENCY", "4"))
+
+# Maileroo v2 REST API, the same endpoint the maileroo SDK posts to
+MAILEROO_API_URL = os.getenv("MAILEROO_API_URL", "https://smtp.maileroo.com/api/v2/")
+MAX_SUBJECT_LENGTH = 255
+
+_maileroo_client = None
+_maileroo_pid = None
+_lock = threading.Lock()
+
+def get_maileroo_client():
+    """ One client per worker process, created on first use / in the lifespan """
+    global _maileroo_client, _maileroo_pid
+    if _maileroo_pid != os.getpid():
+        with _lock:
+            if _maileroo_pid != os.getpid():
+                _maileroo_client = MailerooSession(os.getenv("MAILEROO_API_KEY"))
+                _maileroo_pid = os.getpid()
+    return _maileroo_client
+
+class MailerooSession:
+    """
+    Sends email over one pooled requests.Session; the SDK's MailerooClient opens
+    a new connection per email. Takes the same message dict as
+    MailerooClient.send_basic_email and raises ValueError for messages that can
+    never be sent, RuntimeError for failed attempts.
+    """
+    def __init__(self, api_key: str, timeout: int = 30):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        if not api_key:
+            raise ValueError("MAILEROO_API_KEY is not set")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=MAILEROO_POOL_SIZE))
+        self.session.headers.update({"Authorization": f"Bearer {api_key}"})
+
+    def send_basic_email(self, data: dict) -> str:
+        import requests
+
+        subject = data.get("subject")
+        if not isinstance(subject, str) or not subject.strip() or len(subject) > MAX_SUBJECT_LENGTH:
+            raise ValueError(f"Subject must be a non-empty string of at most {MAX_SUBJECT_LENGTH} characters")
+        if not data.get("html") and not data.get("plain"):
+            raise ValueError("Either html or plain body is required")
+        if not data.get("to"):
+            raise ValueError("At least one recipient is required")
+        payload = {
+            "from": data["from"].to_dict(),
+            "to": [address.to_dict() for address in data["to"]],
+            "subject": subject,
+            "html": data.get("html"),
+            "plain": data.get("plain"),
+            "reference_id": data["reference_id"],
+        }
+
+        try:
+            response = self.session.post(MAILEROO_API_URL + "emails", json=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise RuntimeError(f"HTTP request failed: {e}") from e
+        try:
+            body = response.json() if response.text else {}
+        except ValueError:
+            raise RuntimeError(f"Maileroo returned a non-JSON response (HTTP {response.status_code})")
+
+        if not isinstance(body, dict) or not body.get("success"):
+            message = body.get("message") if isinstance(body, dict) else None
+            raise RuntimeError(f"Maileroo rejected the email (HTTP {response.status_code}): {message or 'Unknown'}")
+        return body["data"]["reference_id"]
+
+def email_address(address: str, display_name: str = None):
+    from maileroo import EmailAddress
+
+    return EmailAddress(address, display_name)
+
+def sender_address():
+    return email_address(*SENDER)
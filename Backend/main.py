@@ -1,4 +1,8 @@
-from fastapi import FastAPI
+import time
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from routes.employee import router as employee_router
 from routes.employee import router as employee_router
 from routes.expense_type import router as expense_type_router
@@ -7,15 +11,88 @@ from fastapi.middleware.cors import CORSMiddleware
 from routes.payment_mode import router as payment_mode_router
 from routes.user_groups import router as user_group_router
 from routes.db_settings import router as db_settings_router
+from routes.reports import router as reports_router
+from routes.scheduler import router as scheduler_router
+from routes.profiling import router as profiling_router
+from routes.analytics import router as analytics_router
+from routes.duplicates import router as duplicates_router
+from routes.events import router as events_router
+from routes.uploads import router as uploads_router
+from routes.admin import router as admin_router
+from db import (
+    get_client,
+    get_drive,
+    close_clients,
+    ensure_indexes,
+    backfill_search_fields,
+    start_token_refresher,
+    stop_token_refresher
+)
+from mail_utils import get_maileroo_client
+from scheduler import start_scheduler, shutdown_scheduler
+from email_outbox import start_outbox_sender, stop_outbox_sender
+from events import start_event_source, stop_event_source
+from attachment_processing import shutdown_processing_pool
+from routes.reports import shutdown_render_pool
+from metrics import MetricsMiddleware, render_metrics
+from profiler import ProfilingMiddleware
+from admission import AdmissionMiddleware
+
+# Milliseconds spent in each startup step of this worker (GET /startup-timings)
+startup_timings = {}
+
+def _timed(name, fn):
+    start = time.perf_counter()
+    try:
+        fn()
+    finally:
+        startup_timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+def _prepare_database():
+    ensure_indexes()
+    backfill_search_fields()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs in every worker after fork: clients are created here, not at import.
+    # They are independent, so they come up concurrently.
+    start = time.perf_counter()
+    await asyncio.gather(
+        asyncio.to_thread(_timed, "mongo", get_client),
+        asyncio.to_thread(_timed, "drive", get_drive),
+        asyncio.to_thread(_timed, "maileroo", get_maileroo_client),
+    )
+    # Index creation / backfill must not delay serving requests
+    threading.Thread(target=_timed, args=("indexes", _prepare_database), daemon=True).start()
+    _timed("scheduler", start_scheduler)
+    _timed("outbox", start_outbox_sender)
+    _timed("events", start_event_source)
+    _timed("drive_token", start_token_refresher)
+    startup_timings["lifespan"] = round((time.perf_counter() - start) * 1000, 1)
+    print(f"Startup timings (ms): {startup_timings}")
+    yield
+    shutdown_scheduler()
+    stop_outbox_sender()
+    stop_event_source()
+    stop_token_refresher()
+    shutdown_processing_pool()
+    shutdown_render_pool()
+    close_clients()
+
+app = FastAPI(lifespan=lifespan)
+# Inside CORS so 429 / 503 responses still carry the CORS headers
+app.add_middleware(AdmissionMiddleware, routes=app.routes)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],        # 👈 allow all origins
     allow_credentials=False,    # 👈 MUST be False with "*"
     allow_methods=["*"],
     allow_headers=["*"],
+    # Read by browser clients of the resumable upload API
+    expose_headers=["Location", "Upload-Offset", "Upload-Length", "Upload-Complete", "Tus-Resumable"],
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilingMiddleware)
 app.include_router(employee_router)
 app.include_router(employee_router)
 app.include_router(expense_type_router)
@@ -23,11 +100,28 @@ app.include_router(expense)
 app.include_router(payment_mode_router)
 app.include_router(user_group_router)
 app.include_router(db_settings_router)
+app.include_router(reports_router)
+app.include_router(scheduler_router)
+app.include_router(profiling_router)
+app.include_router(analytics_router)
+app.include_router(duplicates_router)
+app.include_router(events_router)
+app.include_router(uploads_router)
+app.include_router(admin_router)
 
 @app.get("/")
 def root():
     return {"message": "Employee Management API is running"}
 
+@app.get("/startup-timings")
+def get_startup_timings():
+    return startup_timings
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, headers={"Content-Type": content_type})
+
 # 👇 THIS IS WHAT MAKES python main.py WORK
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,181 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from prometheus_client import (
+    Counter,
+    Histogram,
+    Gauge,
+    CollectorRegistry,
+    generate_latest,
+    REGISTRY,
+    CONTENT_TYPE_LATEST
+)
+from pymongo import monitoring
+
+# Prometheus metrics for HTTP, Mongo and Drive. Labels are kept to small fixed
+# sets (route templates, known command names) so the series count stays bounded.
+# With several workers set PROMETHEUS_MULTIPROC_DIR so /metrics sums them all.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route template and status",
+    ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route"], buckets=LATENCY_BUCKETS
+)
+HTTP_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests being served",
+    multiprocess_mode="livesum"
+)
+ADMISSION_REJECTIONS = Counter(
+    "admission_rejections_total", "Requests turned away by admission control",
+    ["route", "reason"]
+)
+
+MONGO_COMMAND_LATENCY = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency by collection and command",
+    ["collection", "command"], buckets=LATENCY_BUCKETS
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "mongo_command_failures_total", "Failed MongoDB commands by collection and command",
+    ["collection", "command"]
+)
+
+DRIVE_CALL_LATENCY = Histogram(
+    "drive_api_duration_seconds", "Google Drive API call latency by operation",
+    ["operation"], buckets=LATENCY_BUCKETS
+)
+DRIVE_CALL_ERRORS = Counter(
+    "drive_api_errors_total", "Failed Google Drive API calls by operation",
+    ["operation"]
+)
+DRIVE_BYTES = Counter(
+    "drive_bytes_total", "Bytes moved to / from Google Drive",
+    ["direction"]
+)
+ATTACHMENT_PROCESSING_SECONDS = Histogram(
+    "attachment_processing_seconds", "Image / PDF compaction time per attachment",
+    ["kind", "action"], buckets=LATENCY_BUCKETS
+)
+ATTACHMENT_BYTES_SAVED = Counter(
+    "attachment_bytes_saved_total", "Bytes not uploaded to Drive thanks to compaction",
+    ["kind"]
+)
+
+# ---------------- HTTP ----------------
+class MetricsMiddleware:
+    """ ASGI middleware: latency + status per route template (not raw path) """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        HTTP_IN_PROGRESS.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_PROGRESS.dec()
+            # FastAPI puts the matched route on the scope; unmatched paths share one label
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "GET")
+            HTTP_LATENCY.labels(method, template).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(method, template, str(status["code"])).inc()
+
+# ---------------- MONGO ----------------
+MONGO_COMMANDS = {
+    "find", "getMore", "insert", "update", "delete", "aggregate", "count",
+    "findAndModify", "distinct", "createIndexes", "listCollections", "dbStats",
+    "bulkWrite", "killCursors"
+}
+MAX_IN_FLIGHT = 10000
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """ Per collection / command timings from pymongo command events """
+    def __init__(self):
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _labels(event):
+        command = event.command_name if event.command_name in MONGO_COMMANDS else "other"
+        target = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            target = event.command.get("collection")
+        collection = target if isinstance(target, str) else "-"
+        return collection, command
+
+    def started(self, event):
+        with self._lock:
+            if len(self._in_flight) < MAX_IN_FLIGHT:
+                self._in_flight[(event.request_id, event.connection_id)] = self._labels(event)
+
+    def _finish(self, event):
+        with self._lock:
+            return self._in_flight.pop((event.request_id, event.connection_id), None)
+
+    def succeeded(self, event):
+        labels = self._finish(event)
+        if labels:
+            MONGO_COMMAND_LATENCY.labels(*labels).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        labels = self._finish(event)
+        if labels:
+            MONGO_COMMAND_LATENCY.labels(*labels).observe(event.duration_micros / 1e6)
+            MONGO_COMMAND_FAILURES.labels(*labels).inc()
+
+mongo_command_metrics = MongoCommandMetrics()
+
+# ---------------- DRIVE ----------------
+@contextmanager
+def drive_call(operation: str):
+    """ with drive_call("files.create"): ...execute() """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        DRIVE_CALL_ERRORS.labels(operation).inc()
+        raise
+    finally:
+        DRIVE_CALL_LATENCY.labels(operation).observe(time.perf_counter() - start)
+
+def drive_error(operation: str):
+    """ For calls that report failure through a status code instead of raising """
+    DRIVE_CALL_ERRORS.labels(operation).inc()
+
+def drive_bytes(direction: str, amount: int):
+    DRIVE_BYTES.labels(direction).inc(amount)
+
+def record_attachment_processing(content_type: str, report: dict):
+    kind = "pdf" if content_type == "application/pdf" else "image"
+    action = report["action"] if not report["action"].startswith("failed") else "failed"
+    ATTACHMENT_PROCESSING_SECONDS.labels(kind, action).observe(report["tookMs"] / 1000)
+    if report["bytesSaved"] > 0:
+        ATTACHMENT_BYTES_SAVED.labels(kind).inc(report["bytesSaved"])
+
+# ---------------- EXPOSITION ----------------
+def render_metrics():
+    """ Returns (body, content_type) for GET /metrics """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
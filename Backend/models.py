@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import List, Literal, Optional
+from pydantic import BaseModel, EmailStr, Field
+from typing import Any, Dict, List, Literal, Optional
 from datetime import datetime
 
 # Employee creation
@@ -86,6 +86,14 @@ class ExpenseUpdate(BaseModel):
 
 class ExpenseDeleteRequest(BaseModel):
     expenseIds: List[str]
+
+class DuplicateFlagUpdate(BaseModel):
+    status: Literal["open", "dismissed", "confirmed"]
+
+# Attach a finished resumable upload; version as in expense update
+class UploadAttach(BaseModel):
+    expenseId: str
+    version: Optional[int] = None
     
 class PaymentModeCreate(BaseModel):
     paymentModeName: str
@@ -107,4 +115,12 @@ class UserGroupUpdate(BaseModel):
     groupName: Optional[str]
     description: Optional[str]
     users: Optional[List[str]]
-    isActive: Optional[bool]
\ No newline at end of file
+    isActive: Optional[bool]
+
+# Ad-hoc analytics over the in-memory expense columns
+class AnalyticsQuery(BaseModel):
+    filters: Dict[str, Any] = {}
+    groupBy: List[str] = []
+    metrics: List[str] = ["count", "sum"]
+    orderBy: Optional[str] = None
+    limit: int = Field(100, ge=1, le=10000)  # analytics.MAX_RESULT_ROWS
@@ -0,0 +1,148 @@
+import threading
+import time
+from collections import deque
+from pymongo import monitoring
+from pymongo.common import MAX_POOL_SIZE
+
+# Connection pool telemetry from pymongo's CMAP events. Registered on the
+# MongoClient in db.get_client(); read through GET /db/pool-stats.
+
+WAIT_SAMPLES = 1024
+
+class _AddressStats:
+    def __init__(self):
+        self.max_pool_size = None
+        self.open = 0               # created - closed
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.created = 0
+        self.closed = 0
+        self.closed_reasons = {}
+        self.checkouts = 0
+        self.checkout_failures = {}
+        self.cleared = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.wait_samples = deque(maxlen=WAIT_SAMPLES)
+
+    def snapshot(self, uptime_s: float) -> dict:
+        samples = sorted(self.wait_samples)
+
+        def pct(p):
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))], 3) if samples else 0.0
+
+        return {
+            "maxPoolSize": self.max_pool_size,
+            "openConnections": self.open,
+            "checkedOut": self.checked_out,
+            "peakCheckedOut": self.peak_checked_out,
+            "saturation": round(self.checked_out / self.max_pool_size, 3) if self.max_pool_size else None,
+            "peakSaturation": round(self.peak_checked_out / self.max_pool_size, 3) if self.max_pool_size else None,
+            "checkouts": self.checkouts,
+            "checkoutFailures": self.checkout_failures,
+            "checkoutWaitMs": {
+                "avg": round(self.wait_total_ms / self.checkouts, 3) if self.checkouts else 0.0,
+                "p50": pct(0.50),
+                "p95": pct(0.95),
+                "p99": pct(0.99),
+                "max": round(self.wait_max_ms, 3),
+            },
+            "churn": {
+                "created": self.created,
+                "closed": self.closed,
+                "closedReasons": self.closed_reasons,
+                "createdPerMinute": round(self.created / (uptime_s / 60), 2) if uptime_s else 0.0,
+                "poolCleared": self.cleared,
+            },
+        }
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {}
+        self._started = time.monotonic()
+
+    def _for(self, address) -> _AddressStats:
+        key = f"{address[0]}:{address[1]}" if isinstance(address, tuple) else str(address)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats.setdefault(key, _AddressStats())
+        return stats
+
+    # --- pool lifecycle ---
+    def pool_created(self, event):
+        with self._lock:
+            # The event only lists non-default options: absent means the driver default
+            # (MONGO_MAX_POOL_SIZE=100), an explicit None means unbounded
+            self._for(event.address).max_pool_size = event.options.get("maxPoolSize", MAX_POOL_SIZE)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._for(event.address).cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    # --- connections (churn) ---
+    def connection_created(self, event):
+        with self._lock:
+            stats = self._for(event.address)
+            stats.created += 1
+            stats.open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            stats = self._for(event.address)
+            stats.closed += 1
+            stats.open -= 1
+            stats.closed_reasons[event.reason] = stats.closed_reasons.get(event.reason, 0) + 1
+
+    # --- checkouts (wait time / saturation) ---
+    def connection_check_out_started(self, event):
+        # Checkout happens on the calling thread, so a thread-local start time is enough
+        self._local.started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            failures = self._for(event.address).checkout_failures
+            failures[event.reason] = failures.get(event.reason, 0) + 1
+
+    def connection_checked_out(self, event):
+        started = getattr(self._local, "started", None)
+        wait_ms = (time.perf_counter() - started) * 1000 if started is not None else 0.0
+        with self._lock:
+            stats = self._for(event.address)
+            stats.checkouts += 1
+            stats.checked_out += 1
+            stats.peak_checked_out = max(stats.peak_checked_out, stats.checked_out)
+            stats.wait_total_ms += wait_ms
+            stats.wait_max_ms = max(stats.wait_max_ms, wait_ms)
+            stats.wait_samples.append(wait_ms)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._for(event.address).checked_out -= 1
+
+    def snapshot(self) -> dict:
+        uptime_s = time.monotonic() - self._started
+        with self._lock:
+            return {
+                "uptimeSeconds": round(uptime_s, 1),
+                "servers": {address: stats.snapshot(uptime_s) for address, stats in self._stats.items()},
+            }
+
+    def reset_peaks(self):
+        with self._lock:
+            for stats in self._stats.values():
+                stats.peak_checked_out = stats.checked_out
+                stats.wait_max_ms = 0.0
+                stats.wait_samples.clear()
+
+pool_monitor = PoolMonitor()
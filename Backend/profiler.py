@@ -0,0 +1,214 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import functools
+import threading
+import contextvars
+import concurrent.futures.thread
+from collections import Counter
+from datetime import datetime
+
+# Opt-in per-request profiling. A request is profiled when it carries
+# X-Profile: <PROFILE_ADMIN_TOKEN>, or by random sampling at PROFILE_SAMPLE_RATE.
+# A sampler thread records the stacks of whichever thread is running the
+# matched endpoint, and of worker threads the request handed work to
+# (asyncio.to_thread / run_in_threadpool), and writes them in folded format
+# (flamegraph.pl / speedscope) to PROFILE_DIR, keeping only the newest
+# PROFILE_MAX_FILES profiles.
+# When neither trigger is configured the middleware is a plain pass-through.
+
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+PROFILE_HEADER = b"x-profile"
+PROFILE_ROUTES_PREFIX = "/admin/profiles"  # reading profiles is never profiled itself
+
+# Samples taken while the endpoint is awaiting I/O (not on any thread's stack)
+WAITING_FRAME = "<waiting>"
+
+PROFILE_NAME = re.compile(r"^[\w.-]+\.folded$")
+
+# The sampler of the request being profiled; worker threads run in a copy of its context
+_active_sampler = contextvars.ContextVar("profile_sampler", default=None)
+
+# Code objects of the thread-pool loops that run offloaded calls
+_EXECUTOR_WORKER_CODE = concurrent.futures.thread._WorkItem.run.__code__
+try:
+    from anyio._backends._asyncio import WorkerThread
+    _ANYIO_WORKER_CODE = WorkerThread.run.__code__
+except (ImportError, AttributeError):
+    _ANYIO_WORKER_CODE = None
+
+def _worker_context(frame):
+    """
+    The context a thread-pool worker frame is running its call in: anyio's
+    worker (run_in_threadpool) holds it in a local, asyncio.to_thread wraps
+    the call in partial(context.run, ...). Work submitted without a copied
+    context (a plain executor.submit) cannot be traced back to the request.
+    """
+    code = frame.f_code
+    if code is _ANYIO_WORKER_CODE:
+        return frame.f_locals.get("context")
+    if code is _EXECUTOR_WORKER_CODE:
+        fn = getattr(frame.f_locals.get("self"), "fn", None)
+        if isinstance(fn, functools.partial) and isinstance(getattr(fn.func, "__self__", None), contextvars.Context):
+            return fn.func.__self__
+    return None
+
+class _Sampler(threading.Thread):
+    """ Samples every thread running the endpoint's code or work the request offloaded """
+    def __init__(self, scope):
+        super().__init__(daemon=True, name="profile-sampler")
+        self.scope = scope
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own_ident = threading.get_ident()
+        while not self._stop_event.wait(PROFILE_INTERVAL):
+            endpoint = self.scope.get("endpoint")
+            code = getattr(endpoint, "__code__", None)
+            if code is None:
+                continue  # still routing
+
+            found = False
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                in_request = False
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    if not in_request:
+                        if frame.f_code is code:
+                            in_request = True
+                        else:
+                            context = _worker_context(frame)
+                            in_request = context is not None and context.get(_active_sampler) is self
+                    frame = frame.f_back
+                if in_request:
+                    self.stacks[";".join(reversed(stack))] += 1
+                    found = True
+            if not found:
+                self.stacks[WAITING_FRAME] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _profile_id(scope) -> str:
+    path = re.sub(r"[^\w]+", "_", scope.get("path", "")).strip("_")[:40] or "root"
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{scope.get('method', 'GET')}-{path}-{random.randrange(16 ** 4):04x}"
+
+def _should_profile(scope) -> str:
+    """ Returns the trigger ("header" / "sampled") or None """
+    if scope.get("path", "").startswith(PROFILE_ROUTES_PREFIX):
+        return None
+    if PROFILE_ADMIN_TOKEN:
+        for name, value in scope.get("headers", ()):
+            if name == PROFILE_HEADER and value.decode("latin-1") == PROFILE_ADMIN_TOKEN:
+                return "header"
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return "sampled"
+    return None
+
+def _write_profile(profile_id: str, sampler: _Sampler, meta: dict):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, profile_id)
+    with open(base + ".folded", "w") as f:
+        for stack, count in sampler.stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    with open(base + ".json", "w") as f:
+        json.dump(meta, f)
+
+    # Ring buffer: drop the oldest profiles beyond the limit
+    names = sorted(n for n in os.listdir(PROFILE_DIR) if n.endswith(".folded"))
+    for name in names[:-PROFILE_MAX_FILES]:
+        for ext in (".folded", ".json"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, name[:-len(".folded")] + ext))
+            except FileNotFoundError:
+                pass
+
+# ---------------- MIDDLEWARE ----------------
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.enabled = bool(PROFILE_ADMIN_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+    async def __call__(self, scope, receive, send):
+        trigger = _should_profile(scope) if self.enabled and scope["type"] == "http" else None
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = _profile_id(scope)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message.setdefault("headers", []).append((b"x-profile-id", profile_id.encode()))
+            await send(message)
+
+        sampler = _Sampler(scope)
+        start = time.perf_counter()
+        sampler.start()
+        sampler_token = _active_sampler.set(sampler)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _active_sampler.reset(sampler_token)
+            sampler.stop()
+            route = scope.get("route")
+            meta = {
+                "id": profile_id,
+                "method": scope.get("method"),
+                "path": scope.get("path"),
+                "route": getattr(route, "path", None),
+                "status": status["code"],
+                "durationMs": round((time.perf_counter() - start) * 1000, 1),
+                "samples": sampler.samples,
+                "intervalMs": PROFILE_INTERVAL * 1000,
+                "trigger": trigger,
+                "createdAt": datetime.now().isoformat(),
+            }
+            try:
+                await asyncio.to_thread(_write_profile, profile_id, sampler, meta)
+            except OSError as e:
+                print(f"Could not write profile {profile_id}: {e}")
+
+# ---------------- READING PROFILES ----------------
+def list_profiles() -> list:
+    """ Newest first """
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, name)) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+def profile_path(profile_id: str):
+    name = f"{profile_id}.folded"
+    if not PROFILE_NAME.match(name):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
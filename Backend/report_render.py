@@ -0,0 +1,78 @@
+import io
+
+# Kept free of db imports: these functions run inside a worker process.
+
+COLUMNS = [
+    ("Group", "label"),
+    ("Expenses", "count"),
+    ("Total Amount", "total"),
+    ("Without Bill", "withoutBill"),
+    ("Attachments", "attachments"),
+]
+
+def render_xlsx(report: dict) -> bytes:
+    from openpyxl import Workbook
+    from openpyxl.styles import Font
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = report["month"]
+    ws.append([f"Monthly Expense Report - {report['month']} (by {report['groupBy']})"])
+    ws["A1"].font = Font(bold=True, size=13)
+    ws.append([f"Generated on {report['generatedAt']}"])
+    ws.append([])
+    ws.append([title for title, _ in COLUMNS])
+    for cell in ws[4]:
+        cell.font = Font(bold=True)
+    for row in report["rows"]:
+        ws.append([row[key] for _, key in COLUMNS])
+    ws.append(["Total", report["expenseCount"], report["grandTotal"]])
+    for cell in ws[ws.max_row]:
+        cell.font = Font(bold=True)
+
+    ws.column_dimensions["A"].width = 36
+    for col in "BCDE":
+        ws.column_dimensions[col].width = 16
+
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+def render_pdf(report: dict) -> bytes:
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle, Spacer
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, title=f"Expense Report {report['month']}")
+    styles = getSampleStyleSheet()
+
+    data = [[title for title, _ in COLUMNS]]
+    data += [[row[key] for _, key in COLUMNS] for row in report["rows"]]
+    data.append(["Total", report["expenseCount"], report["grandTotal"], "", ""])
+
+    table = Table(data, repeatRows=1)
+    table.setStyle(TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#2c3e50")),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("FONTNAME", (0, -1), (-1, -1), "Helvetica-Bold"),
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.HexColor("#dddddd")),
+        ("ALIGN", (1, 1), (-1, -1), "RIGHT"),
+    ]))
+
+    doc.build([
+        Paragraph(f"Monthly Expense Report - {report['month']}", styles["Title"]),
+        Paragraph(f"Grouped by {report['groupBy']} &middot; generated {report['generatedAt']}", styles["Normal"]),
+        Spacer(1, 12),
+        table,
+    ])
+    return buffer.getvalue()
+
+def render_report_files(report: dict) -> dict:
+    """ Entry point for the process pool: returns {format: bytes} """
+    return {
+        "xlsx": render_xlsx(report),
+        "pdf": render_pdf(report),
+    }
@@ -0,0 +1,99 @@
+import re
+import hashlib
+from datetime import datetime
+from bson import ObjectId
+
+from db import expense_type_collection, employee_collection
+from archive import read_tiers
+
+GROUP_BY_FIELDS = {
+    "employee": "userEmail",
+    "expenseType": "expenseTypeId",
+    "paymentMode": "paymentMode",
+}
+
+MONTH_PATTERN = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+def month_filter(month: str) -> dict:
+    """ Expense dates are stored as 'YYYY-MM-DDTHH:MM' strings, so a month is a prefix """
+    return {"date": {"$regex": f"^{re.escape(month)}"}}
+
+def month_tiers(month: str) -> list:
+    """ Hot collection, plus the month's archive year if it has one """
+    return read_tiers(f"{month}-01", f"{month}-01")
+
+def data_version(month: str) -> str:
+    """
+    Cheap fingerprint of the month's data: count + latest updatedAt.
+    Any create, update or delete inside the month changes it.
+    """
+    query = month_filter(month)
+    count, latest_ts = 0, None
+    for tier in month_tiers(month):
+        count += tier.count_documents(query)
+        latest = tier.find_one(query, {"updatedAt": 1}, sort=[("updatedAt", -1)])
+        ts = latest.get("updatedAt") if latest else None
+        if isinstance(ts, datetime) and (latest_ts is None or ts > latest_ts):
+            latest_ts = ts
+    return f"{count}:{latest_ts.isoformat() if isinstance(latest_ts, datetime) else latest_ts}"
+
+def report_cache_key(month: str, group_by: str, version: str) -> str:
+    raw = f"monthly|{month}|{group_by}|{version}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+def _group_labels(group_by: str, keys) -> dict:
+    """ Resolve stored ids / emails into readable names for the report """
+    if group_by == "expenseType":
+        ids = [ObjectId(k) for k in keys if ObjectId.is_valid(k)]
+        return {
+            str(t["_id"]): t.get("ExpenseTypeName", str(t["_id"]))
+            for t in expense_type_collection.find({"_id": {"$in": ids}}, {"ExpenseTypeName": 1})
+        }
+    if group_by == "employee":
+        return {
+            e["Email"]: e.get("EmployeeName", e["Email"])
+            for e in employee_collection.find({"Email": {"$in": list(keys)}}, {"Email": 1, "EmployeeName": 1})
+        }
+    return {}
+
+def build_monthly_report(month: str, group_by: str) -> dict:
+    """ Streams the month's expenses and aggregates them per group key """
+    field = GROUP_BY_FIELDS[group_by]
+    groups = {}
+
+    seen = set()
+    cursors = [
+        tier.find(
+            month_filter(month),
+            {field: 1, "amount": 1, "billAvailable": 1, "attachments": 1},
+            batch_size=1000
+        )
+        for tier in month_tiers(month)
+    ]
+    for exp in (exp for cursor in cursors for exp in cursor):
+        # Counted once while an archival run has it in two tiers
+        if exp["_id"] in seen:
+            continue
+        seen.add(exp["_id"])
+        key = exp.get(field) or "Unknown"
+        row = groups.setdefault(key, {"key": key, "count": 0, "total": 0.0, "withoutBill": 0, "attachments": 0})
+        row["count"] += 1
+        row["total"] += float(exp.get("amount") or 0)
+        if not exp.get("billAvailable"):
+            row["withoutBill"] += 1
+        row["attachments"] += len(exp.get("attachments") or [])
+
+    labels = _group_labels(group_by, groups.keys())
+    rows = sorted(groups.values(), key=lambda r: r["total"], reverse=True)
+    for row in rows:
+        row["label"] = labels.get(row["key"], row["key"])
+        row["total"] = round(row["total"], 2)
+
+    return {
+        "month": month,
+        "groupBy": group_by,
+        "generatedAt": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "rows": rows,
+        "grandTotal": round(sum(r["total"] for r in rows), 2),
+        "expenseCount": sum(r["count"] for r in rows),
+    }
@@ -0,0 +1,296 @@
+import os
+import json
+import uuid
+import base64
+import asyncio
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from starlette.requests import ClientDisconnect
+
+from db import upload_sessions_collection, expenses_collection, drive_http, drive_upload_url
+from archive import archive_collection, archive_years
+from metrics import drive_call, drive_error, drive_bytes
+from gdrive_utils import PARENT_FOLDER_ID, delete_file_from_drive
+
+# Resumable attachment uploads, following tus 1.0 (core, creation and
+# termination). A client creates a session with the file's length, sends the
+# bytes with as many PATCH requests as it needs and asks HEAD where to resume
+# after a dropped connection. Nothing is spooled here: every session is backed
+# by a Google Drive resumable session and PATCH bodies are forwarded to it in
+# UPLOAD_CHUNK_BYTES pieces as they arrive. Drive wants every piece but the
+# last to be a multiple of 256 KiB, so the unaligned end of a PATCH (less than
+# 256 KiB) is kept in the session document until the next one.
+
+TUS_VERSION = "1.0.0"
+DRIVE_ALIGNMENT = 256 * 1024
+CHUNK_BYTES = max(1, int(os.getenv("UPLOAD_CHUNK_BYTES", str(8 * DRIVE_ALIGNMENT))) // DRIVE_ALIGNMENT) * DRIVE_ALIGNMENT
+MAX_UPLOAD_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(100 * 1024 * 1024)))
+SESSION_TTL = timedelta(hours=int(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24")))
+# A PATCH owns the session for this long, renewed after every chunk
+LEASE = timedelta(minutes=2)
+FILE_FIELDS = "id,name,mimeType,size,md5Checksum,webViewLink,webContentLink"
+
+class DriveUploadError(Exception):
+    pass
+
+# ---------------- DRIVE RESUMABLE SESSIONS (blocking) ----------------
+def _drive_request(operation: str, url: str, method: str, body=None, headers=None):
+    with drive_call(operation):
+        return drive_http().request(url, method=method, body=body, headers=headers or {})
+
+def start_drive_session(filename: str, mime_type: str, length: int) -> str:
+    """ Returns the session URI the bytes are PUT to """
+    response, content = _drive_request(
+        "files.resumable.start",
+        drive_upload_url(f"files?uploadType=resumable&fields={FILE_FIELDS}"),
+        "POST",
+        json.dumps({"name": filename, "parents": [PARENT_FOLDER_ID]}),
+        {
+            "Content-Type": "application/json; charset=UTF-8",
+            "X-Upload-Content-Type": mime_type,
+            "X-Upload-Content-Length": str(length),
+        }
+    )
+    if response.status != 200 or "location" not in response:
+        drive_error("files.resumable.start")
+        raise DriveUploadError(f"Drive refused the upload session ({response.status}): {content[:200]!r}")
+    return response["location"]
+
+def send_to_drive(url: str, start: int, data: bytes, total: int):
+    """ PUTs data at start; returns (bytes Drive now has, file resource once the upload is complete) """
+    response, content = _drive_request(
+        "files.resumable.chunk",
+        url,
+        "PUT",
+        data,
+        {"Content-Length": str(len(data)), "Content-Range": f"bytes {start}-{start + len(data) - 1}/{total}"}
+    )
+    if response.status in (200, 201):
+        drive_bytes("upload", len(data))
+        return total, json.loads(content)
+    if response.status == 308:
+        # Drive may keep less than it was sent; Range says how much
+        received = response.get("range")
+        acked = int(received.rsplit("-", 1)[1]) + 1 if received else 0
+        drive_bytes("upload", max(0, acked - start))
+        return acked, None
+    drive_error("files.resumable.chunk")
+    raise DriveUploadError(f"Drive rejected the chunk at {start} ({response.status}): {content[:200]!r}")
+
+def cancel_drive_session(url: str):
+    """ Best effort, Drive also forgets unfinished sessions after a week """
+    try:
+        _drive_request("files.resumable.cancel", url, "DELETE")
+    except Exception as e:
+        print(f"[uploads] Could not cancel Drive session: {e}")
+
+# ---------------- SESSIONS ----------------
+def parse_metadata(header: str) -> dict:
+    """ tus Upload-Metadata: comma separated "key base64(value)" pairs """
+    metadata = {}
+    for pair in filter(None, (p.strip() for p in (header or "").split(","))):
+        key, _, value = pair.partition(" ")
+        try:
+            metadata[key] = base64.b64decode(value, validate=True).decode() if value else ""
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Upload-Metadata value for '{key}' is not base64")
+    return metadata
+
+def session_offset(session: dict) -> int:
+    return session["driveOffset"] + len(session["tail"])
+
+def create_session(length: int, metadata: dict) -> dict:
+    if length < 1:
+        raise HTTPException(status_code=400, detail="Upload-Length must be at least 1")
+    if length > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Uploads are limited to {MAX_UPLOAD_BYTES} bytes")
+
+    filename = metadata.get("filename") or "attachment"
+    mime_type = metadata.get("filetype") or "application/octet-stream"
+    try:
+        drive_url = start_drive_session(filename, mime_type, length)
+    except DriveUploadError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+    now = datetime.utcnow()
+    session = {
+        "_id": uuid.uuid4().hex,
+        "filename": filename,
+        "mimeType": mime_type,
+        "length": length,
+        "userEmail": metadata.get("userEmail"),
+        "driveUrl": drive_url,
+        "driveOffset": 0,       # bytes Drive has confirmed
+        "tail": b"",            # received, not yet sent to Drive
+        "file": None,           # Drive file resource once complete
+        "attachedTo": None,
+        "lock": None,
+        "lockedUntil": None,
+        "createdAt": now,
+        "expiresAt": now + SESSION_TTL,
+    }
+    upload_sessions_collection.insert_one(session)
+    return session
+
+def get_session(upload_id: str) -> dict:
+    session = upload_sessions_collection.find_one({"_id": upload_id, "expiresAt": {"$gt": datetime.utcnow()}})
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    return session
+
+def attachment_metadata(session: dict) -> dict:
+    """ Same shape as the attachments upload_file_to_drive returns """
+    file = session["file"]
+    return {
+        "id": file.get("id"),
+        "filename": file.get("name"),
+        "viewLink": file.get("webViewLink"),
+        "downloadLink": file.get("webContentLink"),
+        "size": session["length"],
+        "mimeType": session["mimeType"],
+        "md5Checksum": file.get("md5Checksum"),
+        "uploadedAt": datetime.now()
+    }
+
+# ---------------- PATCH ----------------
+class _ChunkWriter:
+    """ Forwards one PATCH body to Drive, holding at most a chunk in memory """
+    def __init__(self, session: dict, token: str):
+        self.session = session
+        self.token = token
+        self.drive_offset = session["driveOffset"]
+        self.buffer = bytearray(session["tail"])
+        self.file = session["file"]
+
+    @property
+    def offset(self) -> int:
+        return self.drive_offset + len(self.buffer)
+
+    async def flush(self):
+        """ Sends the whole rest when it is the end of the file, else the 256 KiB aligned part """
+        length = self.session["length"]
+        size = len(self.buffer) if self.offset == length else len(self.buffer) // DRIVE_ALIGNMENT * DRIVE_ALIGNMENT
+        if self.file or size == 0:
+            return
+        data = bytes(self.buffer[:size])
+        acked, file = await asyncio.to_thread(send_to_drive, self.session["driveUrl"], self.drive_offset, data, length)
+        if file:
+            self.file = file
+            self.drive_offset = length
+            self.buffer.clear()
+        elif self.drive_offset <= acked <= self.drive_offset + size:
+            del self.buffer[:acked - self.drive_offset]
+            self.drive_offset = acked
+        else:
+            raise DriveUploadError(f"Drive reports {acked} bytes, expected at most {self.drive_offset + size}")
+        self.save(release=False)
+
+    def save(self, release: bool) -> bool:
+        now = datetime.utcnow()
+        if release:
+            # What is not kept is not received: the offset this PATCH reports must match HEAD
+            del self.buffer[DRIVE_ALIGNMENT:]
+        update = {
+            "driveOffset": self.drive_offset,
+            # A failed chunk can leave a big buffer; past one alignment unit the client resends it
+            "tail": bytes(self.buffer[:DRIVE_ALIGNMENT]),
+            "file": self.file,
+            "lock": None if release else self.token,
+            "lockedUntil": None if release else now + LEASE,
+        }
+        result = upload_sessions_collection.update_one({"_id": self.session["_id"], "lock": self.token}, {"$set": update})
+        if result.matched_count == 0 and not release:
+            raise HTTPException(status_code=409, detail="Upload was taken over by another request")
+        return result.matched_count == 1
+
+async def receive_chunks(upload_id: str, offset: int, stream) -> dict:
+    """ Appends a PATCH body at offset; returns the offset and whether the file is complete """
+    token = uuid.uuid4().hex
+    now = datetime.utcnow()
+    session = upload_sessions_collection.find_one_and_update(
+        {"_id": upload_id, "expiresAt": {"$gt": now}, "$or": [{"lockedUntil": None}, {"lockedUntil": {"$lt": now}}]},
+        {"$set": {"lock": token, "lockedUntil": now + LEASE}},
+        return_document=ReturnDocument.AFTER
+    )
+    if session is None:
+        get_session(upload_id)
+        raise HTTPException(status_code=423, detail="Another request is writing to this upload")
+
+    writer = _ChunkWriter(session, token)
+    try:
+        if offset != writer.offset:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Upload is at offset {writer.offset}, not {offset}",
+                headers={"Upload-Offset": str(writer.offset)}
+            )
+        try:
+            async for piece in stream:
+                if writer.offset + len(piece) > session["length"]:
+                    raise HTTPException(status_code=400, detail="Body runs past Upload-Length")
+                writer.buffer.extend(piece)
+                if len(writer.buffer) >= CHUNK_BYTES or writer.offset == session["length"]:
+                    await writer.flush()
+        except ClientDisconnect:
+            # Keep what arrived, the client resumes from HEAD
+            pass
+        await writer.flush()
+    except DriveUploadError as e:
+        print(f"[uploads] {upload_id}: {e}")
+        raise HTTPException(status_code=502, detail="Storage backend failed, resume from the current offset")
+    finally:
+        writer.save(release=True)
+
+    return {"offset": writer.offset, "complete": writer.file is not None}
+
+# ---------------- CLEANUP ----------------
+def _attachment_kept(session: dict) -> bool:
+    """
+    Whether the expense the session was claimed for holds its file. The attach
+    route claims the session before adding the file to the expense, so a crash
+    in between leaves a claimed session whose file nothing refers to.
+    """
+    file_id = session["file"]["id"]
+    holds_file = {"_id": session["attachedTo"], "$or": [{"attachments.id": file_id}, {"attachments": file_id}]}
+    if expenses_collection.find_one(holds_file, {"_id": 1}):
+        return True
+    return any(archive_collection(year).find_one(holds_file, {"_id": 1}) for year in archive_years())
+
+def _discard(session: dict):
+    """ Drops what a session left on Drive, unless its file made it into an expense """
+    if session.get("attachedTo") is not None and _attachment_kept(session):
+        return
+    if session.get("file"):
+        delete_file_from_drive(session["file"]["id"])
+    else:
+        cancel_drive_session(session["driveUrl"])
+
+def terminate_session(upload_id: str):
+    now = datetime.utcnow()
+    session = upload_sessions_collection.find_one_and_delete({
+        "_id": upload_id,
+        "attachedTo": None,
+        "$or": [{"lockedUntil": None}, {"lockedUntil": {"$lt": now}}]
+    })
+    if session is None:
+        existing = get_session(upload_id)
+        if existing.get("attachedTo") is not None:
+            raise HTTPException(status_code=409, detail="Upload is already attached to an expense")
+        raise HTTPException(status_code=423, detail="Another request is writing to this upload")
+    _discard(session)
+
+def expire_upload_sessions() -> dict:
+    """ Scheduled: removes expired sessions and the files they uploaded that no expense holds """
+    removed = 0
+    while True:
+        now = datetime.utcnow()
+        session = upload_sessions_collection.find_one_and_delete({
+            "expiresAt": {"$lt": now},
+            "$or": [{"lockedUntil": None}, {"lockedUntil": {"$lt": now}}]
+        })
+        if session is None:
+            break
+        _discard(session)
+        removed += 1
+    return {"removed": removed}
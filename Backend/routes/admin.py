@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Query
+from admin_overview import get_overview, OVERVIEW_TTL_SECONDS
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["Admin"]
+)
+
+# Counts and top-N lists for the admin landing page (memoized briefly)
+@router.get("/overview")
+def get_admin_overview(refresh: bool = Query(False, description="Recompute instead of serving the memoized result")):
+    return {**get_overview(refresh), "cachedForSeconds": OVERVIEW_TTL_SECONDS}
@@ -0,0 +1,34 @@
+import asyncio
+from fastapi import APIRouter, HTTPException, Query
+
+from models import AnalyticsQuery
+
+router = APIRouter(
+    prefix="/analytics",
+    tags=["Analytics"]
+)
+
+def _columns():
+    # numpy and the column store load on the first analytics request, not at worker startup
+    from analytics import expense_columns
+    return expense_columns
+
+# ---------------- QUERY ----------------
+# e.g. {"filters": {"month": {"from": "2024-01", "to": "2024-06"}, "billAvailable": false},
+#       "groupBy": ["userEmail", "month"], "metrics": ["count", "sum", "p95"], "orderBy": "-sum"}
+@router.post("/query")
+async def analytics_query(body: AnalyticsQuery):
+    try:
+        return await asyncio.to_thread(
+            _columns().query, body.filters, body.groupBy, body.metrics, body.orderBy, body.limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/stats")
+def analytics_stats():
+    return _columns().stats()
+
+@router.post("/refresh")
+def analytics_refresh(full: bool = Query(False)):
+    return _columns().refresh(full=full)
@@ -1,16 +1,21 @@
-from fastapi import APIRouter
-# 1. Import drive_service to talk to Google
-from db import db, drive_service 
-from maileroo import MailerooClient, EmailAddress
-import os
-from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import datetime
+from fastapi import APIRouter, Query
+from bson import ObjectId
+from db import db, expense_type_collection, MONGO_CLIENT_OPTIONS, READ_ONLY_PREFERENCE
+from pool_monitor import pool_monitor
+from storage_accounting import (
+    storage_trends,
+    get_usage,
+    take_storage_snapshot,
+    rebuild_storage_usage
+)
+from email_outbox import enqueue_email, outbox_status
+from archive import archive_old_expenses, archive_status
+from user_summary import check_user_summaries
+from datetime import datetime, timedelta
+from scheduler import register_job
 
 router = APIRouter()
 
-# Initialize Maileroo Client
-maileroo_client = MailerooClient(os.getenv("MAILEROO_API_KEY"))
-
 # Helper to format bytes into readable sizes (MB, GB)
 def format_size(size_bytes):
     if size_bytes == 0:
@@ -23,48 +28,73 @@ def format_size(size_bytes):
         i += 1
     return f"{p:.2f} {size_name[i]}"
 
+def format_days(days):
+    if days is None:
+        return "not growing"
+    if days > 365:
+        return f"{days / 365:.1f} years"
+    return f"{days} days"
+
+def usage_rows(usage, label, names=None):
+    """ HTML rows for the top-N attachment usage table """
+    rows = ""
+    for item in usage:
+        name = (names or {}).get(item["key"]) or item["key"]
+        rows += (
+            f'<tr><td style="padding: 8px; border: 1px solid #ddd;">{label}: {name}</td>'
+            f'<td style="padding: 8px; border: 1px solid #ddd;">{format_size(item["bytes"])} ({item["count"]} files)</td></tr>'
+        )
+    return rows
+
 def send_db_size_email():
     try:
-        # --- 1. GET MONGODB STATS ---
-        db_stats = db.command("dbstats")
-        
-        mongo_storage_bytes = db_stats["storageSize"] # Physical size on disk
-        mongo_limit_bytes = 500 * 1024 * 1024         # 500 MB Limit
-        mongo_usage_percent = (mongo_storage_bytes / mongo_limit_bytes) * 100
-        
+        # --- 1. USAGE FROM THE LATEST DAILY SNAPSHOT ---
+        # dbstats / Drive about() are only called by the daily snapshot job
+        trends = storage_trends()
+        mongo = trends["mongo"]
+        mongo_usage_percent = mongo["percent"]
+
         mongo_details = {
-            "used": format_size(mongo_storage_bytes),
-            "limit": "500.00 MB",
+            "used": format_size(mongo["used"]),
+            "limit": format_size(mongo["limit"]),
             "percent": f"{mongo_usage_percent:.2f}%",
-            "objects": db_stats["objects"],
-            "collections": db_stats["collections"]
+            "objects": mongo["objects"],
+            "collections": mongo["collections"],
+            "growth": f"{format_size(max(mongo['growthBytesPerDay'], 0))}/day",
+            "daysToQuota": format_days(mongo["daysToQuota"])
         }
 
-        # --- 2. GET GOOGLE DRIVE STATS ---
+        # --- 2. GOOGLE DRIVE ---
         drive_details = {
             "used": "0 B", 
             "limit": "15.00 GB", 
-            "percent": "0%"
+            "percent": "0%",
+            "growth": "-",
+            "daysToQuota": "-"
+        }
+        drive_percent = 0
+
+        drive = trends["drive"]
+        if drive:
+            drive_percent = drive["percent"]
+            drive_details = {
+                "used": format_size(drive["used"]),
+                "limit": format_size(drive["limit"]),
+                "percent": f"{drive_percent:.2f}%",
+                "growth": f"{format_size(max(drive['growthBytesPerDay'], 0))}/day",
+                "daysToQuota": format_days(drive["daysToQuota"])
+            }
+
+        # Top attachment consumers from the running totals
+        top_users = get_usage("user", limit=5)
+        top_types = get_usage("expenseType", limit=5)
+        type_names = {
+            str(t["_id"]): t.get("ExpenseTypeName", "")
+            for t in expense_type_collection.find(
+                {"_id": {"$in": [ObjectId(t["key"]) for t in top_types if ObjectId.is_valid(t["key"])]}},
+                {"ExpenseTypeName": 1}
+            )
         }
-        
-        if drive_service:
-            try:
-                # Fetch quota information from Google Drive
-                about = drive_service.about().get(fields="storageQuota").execute()
-                quota = about.get("storageQuota", {})
-                
-                drive_used_bytes = int(quota.get("usage", 0))
-                drive_limit_bytes = int(quota.get("limit", 15 * 1024 * 1024 * 1024)) # Default 15GB if missing
-                
-                drive_percent = (drive_used_bytes / drive_limit_bytes) * 100 if drive_limit_bytes > 0 else 0
-                
-                drive_details = {
-                    "used": format_size(drive_used_bytes),
-                    "limit": format_size(drive_limit_bytes),
-                    "percent": f"{drive_percent:.2f}%"
-                }
-            except Exception as e:
-                print(f"Failed to fetch Drive stats: {e}")
 
         # --- 3. PREPARE EMAIL ---
         subject_date = datetime.now().strftime('%Y-%m-%d')
@@ -74,9 +104,13 @@ def send_db_size_email():
             f"STORAGE REPORT - {subject_date}\n\n"
             f"MONGODB (Database: {db.name})\n"
             f"Used: {mongo_details['used']} / {mongo_details['limit']} ({mongo_details['percent']})\n"
-            f"Collections: {mongo_details['collections']}\n\n"
+            f"Collections: {mongo_details['collections']}\n"
+            f"Growth: {mongo_details['growth']} - quota reached in: {mongo_details['daysToQuota']}\n\n"
             f"GOOGLE DRIVE\n"
             f"Used: {drive_details['used']} / {drive_details['limit']} ({drive_details['percent']})\n"
+            f"Growth: {drive_details['growth']} - quota reached in: {drive_details['daysToQuota']}\n\n"
+            f"TOP USERS BY ATTACHMENT SIZE\n"
+            + "".join(f"{u['key']}: {format_size(u['bytes'])} ({u['count']} files)\n" for u in top_users)
         )
 
         # HTML Body
@@ -107,6 +141,10 @@ def send_db_size_email():
                     <td style="padding: 8px; border: 1px solid #ddd;"><b>Collections</b></td>
                     <td style="padding: 8px; border: 1px solid #ddd;">{mongo_details['collections']}</td>
                 </tr>
+                <tr>
+                    <td style="padding: 8px; border: 1px solid #ddd;"><b>Growth</b></td>
+                    <td style="padding: 8px; border: 1px solid #ddd;">{mongo_details['growth']} (quota in {mongo_details['daysToQuota']})</td>
+                </tr>
             </table>
 
             <h3 style="color: #4285F4;">📁 Google Drive Storage</h3>
@@ -119,11 +157,21 @@ def send_db_size_email():
                     <td style="padding: 8px; border: 1px solid #ddd;"><b>Percentage</b></td>
                     <td style="padding: 8px; border: 1px solid #ddd;">
                          <div style="background-color: #eee; width: 100%; height: 20px; border-radius: 4px;">
-                            <div style="background-color: #4285F4; width: {min(drive_percent, 100) if 'drive_percent' in locals() else 0}%; height: 100%; border-radius: 4px;"></div>
+                            <div style="background-color: #4285F4; width: {min(drive_percent, 100)}%; height: 100%; border-radius: 4px;"></div>
                         </div>
                         {drive_details['percent']}
                     </td>
                 </tr>
+                <tr style="background-color: #f8f9fa;">
+                    <td style="padding: 8px; border: 1px solid #ddd;"><b>Growth</b></td>
+                    <td style="padding: 8px; border: 1px solid #ddd;">{drive_details['growth']} (quota in {drive_details['daysToQuota']})</td>
+                </tr>
+            </table>
+
+            <h3 style="color: #2c3e50;">📎 Top Attachment Usage</h3>
+            <table style="width: 100%; max-width: 500px; border-collapse: collapse;">
+                {usage_rows(top_users, "User")}
+                {usage_rows(top_types, "Expense Type", type_names)}
             </table>
             
             <br>
@@ -132,28 +180,77 @@ def send_db_size_email():
         </html>
         """
 
-        email_data = {
-            "from": EmailAddress("rataagroup@bfbbc79e67369a72.maileroo.org", "Rataa Group"),
-            "to": [EmailAddress("expense.rataagroup@gmail.com")],
-            "subject": f"Storage Alert - {subject_date}",
-            "plain": plain_body,
-            "html": html_body
-        }
-
-        # Send email
-        maileroo_client.send_basic_email(email_data)
-        print(f"[{datetime.now()}] Storage report email sent successfully.")
+        # Same minute = same report; a re-run job or double click is not sent twice
+        enqueue_email(
+            "expense.rataagroup@gmail.com",
+            f"Storage Alert - {subject_date}",
+            plain=plain_body,
+            html=html_body,
+            idempotency_key=f"storage-report:{datetime.now():%Y-%m-%dT%H:%M}"
+        )
+        print(f"[{datetime.now()}] Storage report email queued.")
         
     except Exception as e:
         print(f"[{datetime.now()}] Failed to send storage email: {str(e)}")
+        # Let the scheduler record the run as failed (and the manual route answer 500)
+        raise
 
-# Scheduler to run every 10 days
-scheduler = BackgroundScheduler()
-scheduler.add_job(send_db_size_email, 'interval', days=10, next_run_time=datetime.now())
-scheduler.start()
+# Snapshots daily, report every 10 days. Started from the app lifespan and
+# run by exactly one worker (see scheduler.py).
+register_job("storage_snapshot", take_storage_snapshot, timedelta(days=1))
+register_job("storage_report_email", send_db_size_email, timedelta(days=10), run_on_first_start=False)
+# Moves expenses older than ARCHIVE_AFTER_DAYS into the per-year archives
+register_job("expense_archival", archive_old_expenses, timedelta(days=1), lease=timedelta(minutes=30),
+             run_on_first_start=False)
+# Recomputes the per-user dashboard summaries and repairs drift
+register_job("user_summary_check", check_user_summaries, timedelta(days=1), lease=timedelta(minutes=30),
+             run_on_first_start=False)
 
 # Optional route to trigger manually
 @router.get("/dbsize/email")
 def send_db_size_manual():
     send_db_size_email()
-    return {"message": "DB & Drive storage email sent manually."}
\ No newline at end of file
+    return {"message": "DB & Drive storage email queued."}
+
+# Storage usage from the running totals + snapshots (cheap reads)
+@router.get("/storage/usage")
+def get_storage_usage(
+    scope: str = Query("user", description="user | expenseType | month"),
+    limit: int = Query(20, ge=1, le=500),
+    days: int = Query(30, ge=1, le=365)
+):
+    return {
+        "trends": storage_trends(days),
+        "usage": get_usage(scope, limit)
+    }
+
+# Recompute running totals from the expenses if they ever drift
+@router.post("/storage/rebuild")
+def rebuild_storage():
+    rebuild_storage_usage()
+    return {"message": "Storage usage totals rebuilt", "total": get_usage("total", 1)}
+
+# Connection pool telemetry (checkout wait, saturation, churn) for this worker
+@router.get("/db/pool-stats")
+def get_pool_stats(reset: bool = Query(False, description="Reset peaks and wait samples after reading")):
+    stats = pool_monitor.snapshot()
+    stats["clientOptions"] = MONGO_CLIENT_OPTIONS
+    stats["readOnlyPreference"] = READ_ONLY_PREFERENCE.mongos_mode
+    if reset:
+        pool_monitor.reset_peaks()
+    return stats
+
+# Pending / sent / failed counts of the email outbox and the latest failures
+@router.get("/email/outbox")
+def get_outbox_status():
+    return outbox_status()
+
+# Hot / archive tiers with their sizes and the current archival cutoff
+@router.get("/db/archive")
+def get_archive_status():
+    return archive_status()
+
+# Compares the per-user summaries with the expenses; repair=false only reports
+@router.post("/db/user-summaries/check")
+def run_user_summary_check(repair: bool = Query(True)):
+    return check_user_summaries(repair=repair)
@@ -0,0 +1,58 @@
+from datetime import timedelta
+from fastapi import APIRouter, HTTPException, Query
+from bson import ObjectId
+
+from db import duplicate_flags_collection, expenses_read_collection
+from models import DuplicateFlagUpdate
+from duplicates import sweep
+from scheduler import register_job
+
+router = APIRouter(
+    prefix="/expense/duplicates",
+    tags=["Duplicates"]
+)
+
+# ---------------- FLAGGED PAIRS ----------------
+@router.get("")
+def list_duplicate_flags(
+    status: str = Query("open"),
+    userEmail: str = Query(None),
+    minScore: float = Query(0, ge=0, le=1),
+    page: int = Query(1, ge=1),
+    pageSize: int = Query(20, ge=1, le=100)
+):
+    query = {"status": status, "score": {"$gte": minScore}}
+    if userEmail:
+        query["userEmails"] = userEmail
+
+    total = duplicate_flags_collection.count_documents(query)
+    flags = list(
+        duplicate_flags_collection.find(query)
+        .sort([("score", -1), ("detectedAt", -1)])
+        .skip((page - 1) * pageSize)
+        .limit(pageSize)
+    )
+
+    # Both sides of every pair in one lookup
+    ids = {ObjectId(i) for flag in flags for i in flag["expenseIds"] if ObjectId.is_valid(i)}
+    projection = {"title": 1, "amount": 1, "date": 1, "userEmail": 1, "expenseTypeId": 1, "attachments": 1}
+    expenses = {str(e["_id"]): e for e in expenses_read_collection.find({"_id": {"$in": list(ids)}}, projection)}
+    for flag in flags:
+        flag["expenses"] = []
+        for expense_id in flag["expenseIds"]:
+            expense = expenses.get(expense_id)
+            if expense:
+                expense["_id"] = str(expense["_id"])
+                flag["expenses"].append(expense)
+
+    return {"page": page, "pageSize": pageSize, "total": total, "results": flags}
+
+@router.put("/{pair_id}")
+def review_duplicate_flag(pair_id: str, payload: DuplicateFlagUpdate):
+    result = duplicate_flags_collection.update_one({"_id": pair_id}, {"$set": {"status": payload.status}})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Flag not found")
+    return {"message": "Flag updated", "id": pair_id, "status": payload.status}
+
+# The first sweep is a full pass over every expense: wait one interval rather than run it during startup
+register_job("duplicate_sweep", sweep, timedelta(hours=24), run_on_first_start=False)
@@ -1,17 +1,13 @@
 from fastapi import APIRouter, HTTPException
 from models import EmployeeCreate, EmployeeLogin, ForgotPasswordRequest, ForgotPasswordVerify, EmployeeUpdate, RoleAssignmentRequest
-from db import employee_collection, user_groups_collection
+from db import employee_collection, employee_read_collection, user_groups_collection
 from passlib.context import CryptContext
 import smtplib
 from email.message import EmailMessage
 from datetime import datetime, timedelta
 import random
-from maileroo import MailerooClient, EmailAddress
-import os
 from bson import ObjectId
-
-
-maileroo_client = MailerooClient(os.getenv("MAILEROO_API_KEY"))
+from email_outbox import enqueue_email
 
 router = APIRouter(
     prefix="/employee",
@@ -67,7 +63,7 @@ def add_employee(employee: EmployeeCreate):
 def get_all_employee_details():
 
     employees = list(
-        employee_collection.find(
+        employee_read_collection.find(
             {},
             {
                 "Password": 0,
@@ -193,17 +189,11 @@ def forgot_password_request(data: ForgotPasswordRequest):
         {"$set": {"OTP": otp, "OTPExpiry": expiry}}
     )
 
-    # Prepare Maileroo email data
-    email_data = {
-        "from": EmailAddress(
-            "rataagroup@bfbbc79e67369a72.maileroo.org",
-            "Rataa Group"
-        ),
-        "to": [
-            EmailAddress(data.Email)
-        ],
-        "subject": "Your Password Reset OTP",
-        "plain": f"""
+    # Queued in the outbox; the background sender delivers (and retries) it
+    message = enqueue_email(
+        data.Email,
+        "Your Password Reset OTP",
+        plain=f"""
 Hello,
 
 Your OTP for password reset is: {otp}
@@ -214,7 +204,7 @@ If you did not request this, please ignore this email.
 Regards,
 Rataa Group
         """,
-        "html": f"""
+        html=f"""
 <h2>Password Reset OTP</h2>
 <p>Your OTP for password reset is:</p>
 <h3>{otp}</h3>
@@ -222,20 +212,14 @@ Rataa Group
 <p>If you did not request this, please ignore this email.</p>
 <br />
 <p>Regards,<br /><b>Rataa Group</b></p>
-        """
-    }
-
-    try:
-        reference_id = maileroo_client.send_basic_email(email_data)
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Failed to send OTP email: {str(e)}"
-        )
+        """,
+        # Not the OTP itself: the key is stored and the returned referenceId is derived from it
+        idempotency_key=f"otp:{data.Email}:{expiry.timestamp()}"
+    )
 
     return {
         "message": "OTP sent to email successfully",
-        "referenceId": reference_id
+        "referenceId": message["referenceId"]
     }
 
 # ---------- Step 2: Verify OTP and Reset Password ----------
@@ -266,7 +250,7 @@ def forgot_password_verify(data: ForgotPasswordVerify):
 @router.get("/all")
 def get_all_employees():
     employees = list(
-        employee_collection.find(
+        employee_read_collection.find(
             {"Email": {"$ne": "admin@rataagroup.com"}},  # Exclude admin
             {
                 "Password": 0,
@@ -0,0 +1,43 @@
+import asyncio
+from fastapi import APIRouter, HTTPException, Header, Query, Request
+from fastapi.responses import StreamingResponse
+
+from events import EVENT_COLLECTIONS, Subscriber, bus, event_stream, events_status
+
+router = APIRouter(
+    prefix="/events",
+    tags=["Events"]
+)
+
+# ---------------- LIVE UPDATES ----------------
+# EventSource("/events/stream?collections=expenses&userEmail=a@b.com")
+# Events are named "<collection>.<op>", e.g. expenses.update; data is JSON.
+@router.get("/stream")
+async def stream_events(
+    request: Request,
+    collections: str = Query(",".join(EVENT_COLLECTIONS), description="Comma separated"),
+    userEmail: str = Query(None, description="Only expense events for this user"),
+    lastEventId: str = Query(None, description="For clients that cannot send Last-Event-ID"),
+    last_event_id: str = Header(None)
+):
+    wanted = {name.strip() for name in collections.split(",") if name.strip()}
+    unknown = wanted - set(EVENT_COLLECTIONS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown collections: {', '.join(sorted(unknown))}")
+
+    subscriber = Subscriber(asyncio.get_running_loop(), wanted, userEmail)
+    try:
+        backlog = bus.subscribe(subscriber, last_event_id or lastEventId)
+    except OverflowError:
+        raise HTTPException(status_code=503, detail="Too many live connections, try again later")
+
+    return StreamingResponse(
+        event_stream(subscriber, backlog, request.is_disconnected),
+        media_type="text/event-stream",
+        # No proxy buffering, or events arrive in batches
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/status")
+def get_events_status():
+    return events_status()
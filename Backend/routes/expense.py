@@ -1,20 +1,44 @@
 # Backend/routes/expense.py
 import datetime
 import json
+import re
 import asyncio
 from typing import List, Optional
-from fastapi import APIRouter, File, UploadFile, Form, HTTPException
+from fastapi import APIRouter, File, UploadFile, Form, HTTPException, Query, Header
 from fastapi.responses import StreamingResponse
 from bson import ObjectId
+from pymongo import ReturnDocument
 
 # Imports from your project structure
-from db import expenses_collection, expense_type_collection
+from db import (
+    expenses_collection,
+    expenses_read_collection,
+    expense_type_collection,
+    expense_tombstones_collection,
+    TOMBSTONE_RETENTION,
+    run_in_transaction
+)
 from models import ExpenseDeleteRequest
+from storage_accounting import record_storage_change
+from idempotency import request_fingerprint, run_idempotent
+from duplicates import check_expense_safely, forget_expense
+from events import publish_change
+from user_summary import apply_summary_change, get_user_summary
+from archive import read_tiers, find_across_tiers, date_range_filter, find_archived
+from sync_utils import SETTLE as SYNC_SETTLE, InvalidSyncToken, encode_token, decode_token, after_cursor, next_cursor
+from search_utils import (
+    search_fields,
+    normalize_car_number,
+    car_number_grams,
+    car_number_distance,
+    GRAM_SIZE,
+    max_car_number_distance
+)
 
 # Import the new utils
 from gdrive_utils import (
     upload_file_to_drive, 
-    delete_file_from_drive, 
+    delete_attachment_files,
     stream_file_content  # 👈 Using the streaming function
 )
 
@@ -39,69 +63,298 @@ async def create_expense(
     location: str = Form(""),
     equipmentName: str = Form(""),
     equipmentType: str = Form(""),
-    attachments: List[UploadFile] = File([])
+    attachments: List[UploadFile] = File([]),
+    idempotencyKey: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
-    if not ObjectId.is_valid(expenseTypeId) or not expense_type_collection.find_one({"_id": ObjectId(expenseTypeId)}):
-        raise HTTPException(status_code=400, detail="Invalid expenseTypeId")
-
-    # 🟢 1. PARALLEL UPLOAD LOGIC
-    # We create a list of upload tasks and run them all at once using asyncio.gather
-    upload_tasks = []
-    for file in attachments:
-        upload_tasks.append(upload_file_to_drive(file))
+    fingerprint = request_fingerprint({
+        "expenseTypeId": expenseTypeId, "title": title, "date": date, "amount": amount,
+        "paymentMode": paymentMode, "billAvailable": billAvailable, "userEmail": userEmail,
+        "description": description, "carNumber": carNumber, "serviceType": serviceType,
+        "location": location, "equipmentName": equipmentName, "equipmentType": equipmentType,
+    }, attachments)
+
+    async def work():
+        if not ObjectId.is_valid(expenseTypeId) or not expense_type_collection.find_one({"_id": ObjectId(expenseTypeId)}):
+            raise HTTPException(status_code=400, detail="Invalid expenseTypeId")
+
+        # 🟢 1. PARALLEL UPLOAD LOGIC
+        # We create a list of upload tasks and run them all at once using asyncio.gather
+        upload_tasks = []
+        for file in attachments:
+            upload_tasks.append(upload_file_to_drive(file))
     
-    uploaded_files_metadata = []
-    if upload_tasks:
-        try:
-            # Wait for all uploads to finish in parallel
-            results = await asyncio.gather(*upload_tasks)
-            # Filter out any failed uploads (None)
-            uploaded_files_metadata = [res for res in results if res]
-        except Exception as e:
-            print(f"Parallel upload error: {e}")
-
-    expense_data = {
-        "expenseTypeId": expenseTypeId,
-        "title": title,
-        "date": date,
-        "amount": amount,
-        "paymentMode": paymentMode,
-        "billAvailable": billAvailable,
-        "userEmail": userEmail,
-        "description": description,
-        "carNumber": carNumber,
-        "serviceType": serviceType,
-        "location": location,
-        "equipmentName": equipmentName,
-        "equipmentType": equipmentType,
-        "attachments": uploaded_files_metadata, # Store full object list
-        "createdAt": datetime.datetime.now(),
-        "updatedAt": datetime.datetime.now()
-    }
+        uploaded_files_metadata = []
+        if upload_tasks:
+            try:
+                # Wait for all uploads to finish in parallel
+                results = await asyncio.gather(*upload_tasks)
+                # Filter out any failed uploads (None)
+                uploaded_files_metadata = [res for res in results if res]
+            except Exception as e:
+                print(f"Parallel upload error: {e}")
 
-    result = expenses_collection.insert_one(expense_data)
-    return {"message": "Expense created successfully", "expense_id": str(result.inserted_id)}
+        expense_data = {
+            "expenseTypeId": expenseTypeId,
+            "title": title,
+            "date": date,
+            "amount": amount,
+            "paymentMode": paymentMode,
+            "billAvailable": billAvailable,
+            "userEmail": userEmail,
+            "description": description,
+            "carNumber": carNumber,
+            "serviceType": serviceType,
+            "location": location,
+            "equipmentName": equipmentName,
+            "equipmentType": equipmentType,
+            "attachments": uploaded_files_metadata, # Store full object list
+            "version": 1,
+            "createdAt": datetime.datetime.now(),
+            # UTC, like the $currentDate set by updates: incremental readers compare it
+            "updatedAt": datetime.datetime.utcnow()
+        }
+        expense_data.update(search_fields(carNumber))
+
+        def write(session):
+            # The expense and its owner's summary commit together
+            result = expenses_collection.insert_one(expense_data, session=session)
+            apply_summary_change(None, expense_data, session=session)
+            return result
+
+        result = run_in_transaction(write)
+        record_storage_change(None, expense_data)
+        possible_duplicates = check_expense_safely(expense_data)
+        publish_change("expenses", "insert", result.inserted_id, expense_data, user_email=userEmail)
+        return {
+            "message": "Expense created successfully",
+            "expense_id": str(result.inserted_id),
+            "possibleDuplicates": possible_duplicates
+        }
+
+    return await run_idempotent("expense.create", idempotencyKey, fingerprint, work)
 
 # ---------------- GET ALL EXPENSES ----------------
+def _tier_range(date_from, date_to):
+    """ Date filter plus the tiers (hot + archive years) it reaches """
+    try:
+        return date_range_filter(date_from, date_to), read_tiers(date_from, date_to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/all")
-def get_all_expenses():
-    expenses = list(expenses_collection.find())
+def get_all_expenses(
+    dateFrom: Optional[str] = Query(None, description="YYYY-MM-DD; without it archived years are read too"),
+    dateTo: Optional[str] = Query(None, description="YYYY-MM-DD, inclusive")
+):
+    date_filter, _ = _tier_range(dateFrom, dateTo)
+    expenses = list(find_across_tiers(date_filter, date_from=dateFrom, date_to=dateTo))
     for exp in expenses:
         exp["_id"] = str(exp["_id"])
         if "attachments" not in exp:
             exp["attachments"] = []
     return expenses
 
+# ---------------- SEARCH EXPENSES ----------------
+# Max documents considered when ranking fuzzy car number matches in Python
+FUZZY_CANDIDATE_LIMIT = 500
+
+@router.get("/search")
+def search_expenses(
+    q: Optional[str] = Query(None, description="Free text over title, description, location, car number and equipment"),
+    carNumber: Optional[str] = Query(None, description="Car number prefix (e.g. KA01AB)"),
+    fuzzy: bool = Query(False, description="Tolerate typos in carNumber"),
+    userEmail: Optional[str] = Query(None),
+    dateFrom: Optional[str] = Query(None, description="YYYY-MM-DD; without it archived years are searched too"),
+    dateTo: Optional[str] = Query(None, description="YYYY-MM-DD, inclusive"),
+    page: int = Query(1, ge=1),
+    pageSize: int = Query(20, ge=1, le=100)
+):
+    q = (q or "").strip()
+    car_query = normalize_car_number(carNumber or "")
+
+    if not q and not car_query:
+        raise HTTPException(status_code=400, detail="Provide q or carNumber")
+
+    query, tiers = _tier_range(dateFrom, dateTo)
+    projection = None
+    sort = [("createdAt", -1)]
+
+    if q:
+        query["$text"] = {"$search": q}
+        projection = {"score": {"$meta": "textScore"}}
+        sort = [("score", {"$meta": "textScore"})]
+
+    if userEmail:
+        query["userEmail"] = userEmail
+
+    skip = (page - 1) * pageSize
+    # Fuzzy matching only sees the best FUZZY_CANDIDATE_LIMIT candidates per tier
+    total_is_lower_bound = False
+
+    if car_query and fuzzy:
+        # Candidates come from the trigram multikey index. By the q-gram lemma a
+        # match within max_distance edits shares at least min_shared trigrams,
+        # which prunes most of them before they reach Python.
+        query_grams = car_number_grams(car_query)
+        max_distance = max_car_number_distance(car_query)
+        min_shared = max(1, len(query_grams) - max_distance * GRAM_SIZE)
+
+        query["carNumberGrams"] = {"$in": query_grams}
+        ranking = {
+            "gramOverlap": {"$size": {"$filter": {
+                "input": "$carNumberGrams",
+                "cond": {"$in": ["$$this", query_grams]}
+            }}}
+        }
+        if q:
+            # Carried on the document so tiers can be merged on it in Python
+            ranking["score"] = {"$meta": "textScore"}
+        pipeline = [
+            {"$match": query},
+            {"$addFields": ranking},
+            {"$match": {"gramOverlap": {"$gte": min_shared}}},
+            {"$sort": {"gramOverlap": -1, **({"score": {"$meta": "textScore"}} if q else {"createdAt": -1})}},
+            {"$limit": FUZZY_CANDIDATE_LIMIT}
+        ]
+        candidates = []
+        for tier in tiers:
+            tier_candidates = list(tier.aggregate(pipeline))
+            total_is_lower_bound |= len(tier_candidates) >= FUZZY_CANDIDATE_LIMIT
+            candidates.extend(tier_candidates)
+        if len(tiers) > 1:
+            # Restore the pipeline's order over the merged tiers
+            candidates.sort(key=lambda e: e.get("score", 0) if q else _created_at(e), reverse=True)
+            candidates.sort(key=lambda e: e["gramOverlap"], reverse=True)
+
+        matches = []
+        for exp in candidates:
+            distance = car_number_distance(car_query, exp.get("carNumberNorm", ""))
+            if distance <= max_distance:
+                exp.pop("gramOverlap", None)
+                exp["carNumberDistance"] = distance
+                matches.append(exp)
+
+        # Stable sort keeps overlap / text relevance order within the same distance
+        matches.sort(key=lambda e: e["carNumberDistance"])
+        total = len(matches)
+        expenses = matches[skip:skip + pageSize]
+    else:
+        if car_query:
+            # Anchored regex on an indexed field is an index range scan
+            query["carNumberNorm"] = {"$regex": f"^{re.escape(car_query)}"}
+
+        if len(tiers) == 1:
+            total = expenses_read_collection.count_documents(query)
+            expenses = list(
+                expenses_read_collection.find(query, projection).sort(sort).skip(skip).limit(pageSize)
+            )
+        else:
+            # Top skip + pageSize of every tier, merged in the same order
+            total, merged = 0, []
+            for tier in tiers:
+                total += tier.count_documents(query)
+                merged.extend(tier.find(query, projection).sort(sort).limit(skip + pageSize))
+            merged.sort(key=lambda e: e.get("score", 0) if q else _created_at(e), reverse=True)
+            expenses = merged[skip:skip + pageSize]
+
+    for exp in expenses:
+        exp["_id"] = str(exp["_id"])
+        exp.pop("carNumberGrams", None)
+        if "attachments" not in exp:
+            exp["attachments"] = []
+
+    return {
+        "page": page,
+        "pageSize": pageSize,
+        "total": total,
+        # True when the candidate limit was hit: more expenses may match than total
+        "totalIsLowerBound": total_is_lower_bound,
+        "results": expenses
+    }
+
+def _created_at(expense):
+    created = expense.get("createdAt")
+    return created if isinstance(created, datetime.datetime) else datetime.datetime.min
+
 # ---------------- GET EXPENSE BY userId ----------------
 @router.get("/user/{user_email}")
-def get_expenses_by_user(user_email: str):
-    expenses = list(expenses_collection.find({"userEmail": user_email}))
+def get_expenses_by_user(
+    user_email: str,
+    dateFrom: Optional[str] = Query(None, description="YYYY-MM-DD; without it archived years are read too"),
+    dateTo: Optional[str] = Query(None, description="YYYY-MM-DD, inclusive")
+):
+    date_filter, _ = _tier_range(dateFrom, dateTo)
+    expenses = list(find_across_tiers({"userEmail": user_email, **date_filter}, date_from=dateFrom, date_to=dateTo))
     for exp in expenses:
         exp["_id"] = str(exp["_id"])
         if "attachments" not in exp:
             exp["attachments"] = []
     return expenses
 
+# ---------------- USER SUMMARY (DASHBOARD) ----------------
+# Totals kept up to date by the write paths; no scan of the user's expenses
+@router.get("/user/{user_email}/summary")
+def get_expense_summary_by_user(user_email: str):
+    return get_user_summary(user_email)
+
+# ---------------- CHANGES SINCE (DELTA SYNC) ----------------
+@router.get("/changes")
+def get_expense_changes(
+    since: Optional[str] = Query(None, description="nextToken from the previous call; omit for a full sync"),
+    userEmail: Optional[str] = Query(None),
+    limit: int = Query(500, ge=1, le=5000)
+):
+    now = datetime.datetime.utcnow()
+    if since:
+        try:
+            expenses_cursor, tombstones_cursor = decode_token(since)
+        except InvalidSyncToken as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if tombstones_cursor[0] < now - TOMBSTONE_RETENTION:
+            # Deletes older than the retention are gone, the client must start over
+            raise HTTPException(status_code=410, detail="Sync token expired, do a full sync")
+    else:
+        expenses_cursor = (datetime.datetime.min, None)
+        tombstones_cursor = (now - SYNC_SETTLE, None)
+
+    user_filter = {"userEmail": userEmail} if userEmail else {}
+
+    # Primary reads: a lagging secondary could let the cursor pass unseen writes
+    changed = list(
+        expenses_collection.find({**user_filter, **after_cursor("updatedAt", expenses_cursor)})
+        .sort([("updatedAt", 1), ("_id", 1)])
+        .limit(limit)
+    )
+    tombstones = list(
+        expense_tombstones_collection.find({**user_filter, **after_cursor("deletedAt", tombstones_cursor)})
+        .sort([("deletedAt", 1), ("_id", 1)])
+        .limit(limit)
+    )
+
+    next_token = encode_token(
+        next_cursor("updatedAt", expenses_cursor, changed, len(changed) == limit, now),
+        next_cursor("deletedAt", tombstones_cursor, tombstones, len(tombstones) == limit, now)
+    )
+
+    for exp in changed:
+        exp["_id"] = str(exp["_id"])
+        exp.pop("carNumberGrams", None)
+        if "attachments" not in exp:
+            exp["attachments"] = []
+
+    return {
+        "changed": changed,
+        "deleted": [
+            {"expenseId": str(tomb["expenseId"]), "deletedAt": tomb["deletedAt"]} for tomb in tombstones
+        ],
+        "nextToken": next_token,
+        "hasMore": len(changed) == limit or len(tombstones) == limit
+    }
+
+def _delete_attachments(attachments):
+    for att in attachments:
+        delete_attachment_files(att)
+
 # ---------------- UPDATE EXPENSE ----------------
 @router.put("/update/{expense_id}")
 async def update_expense(
@@ -120,78 +373,142 @@ async def update_expense(
     equipmentName: Optional[str] = Form(None),
     equipmentType: Optional[str] = Form(None),
     keptAttachments: str = Form("[]"), # JSON string
-    newAttachments: List[UploadFile] = File([])
+    version: Optional[int] = Form(None), # version the client edited; 409 if it moved on
+    newAttachments: List[UploadFile] = File([]),
+    idempotencyKey: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
-    if not ObjectId.is_valid(expense_id):
-        raise HTTPException(status_code=400, detail="Invalid expense ID")
-
-    existing_expense = expenses_collection.find_one({"_id": ObjectId(expense_id)})
-    if not existing_expense:
-        raise HTTPException(status_code=404, detail="Expense not found")
-
-    # 1. Standard Fields Update
-    update_data = {}
-    fields_to_update = {
-        "expenseTypeId": expenseTypeId, "title": title, "date": date,
+    fingerprint = request_fingerprint({
+        "expenseId": expense_id, "version": version, "expenseTypeId": expenseTypeId, "title": title, "date": date,
         "amount": amount, "paymentMode": paymentMode, "billAvailable": billAvailable,
         "userEmail": userEmail, "description": description, "carNumber": carNumber,
         "serviceType": serviceType, "location": location, "equipmentName": equipmentName,
-        "equipmentType": equipmentType,
-    }
-    for field, value in fields_to_update.items():
-        if value is not None:
-            update_data[field] = value
+        "equipmentType": equipmentType, "keptAttachments": keptAttachments,
+    }, newAttachments)
 
-    # 2. Handle File Logic (Kept Files)
-    try:
-        kept_raw = json.loads(keptAttachments)
-        kept_ids = []
-        for item in kept_raw:
-            if isinstance(item, dict):
-                kept_ids.append(item.get('id'))
-            else:
-                kept_ids.append(item)
-    except:
-        kept_ids = []
-
-    current_attachments = existing_expense.get("attachments", [])
-    final_attachments = []
-    
-    # A. Delete Removed Files
-    for att in current_attachments:
-        att_id = att['id'] if isinstance(att, dict) else att
-        
-        if att_id in kept_ids:
-            # Keep file
-            if isinstance(att, dict):
-                final_attachments.append(att)
-            else:
-                final_attachments.append({"id": att, "filename": "Legacy File"})
-        else:
-            # Delete file
-            delete_file_from_drive(att_id)
+    async def work():
+        if not ObjectId.is_valid(expense_id):
+            raise HTTPException(status_code=400, detail="Invalid expense ID")
 
-    # 🟢 B. Upload New Files (Parallel)
-    new_upload_tasks = []
-    for file in newAttachments:
-        new_upload_tasks.append(upload_file_to_drive(file))
-    
-    if new_upload_tasks:
+        existing_expense = expenses_collection.find_one({"_id": ObjectId(expense_id)})
+        if not existing_expense:
+            if find_archived(ObjectId(expense_id)):
+                raise HTTPException(status_code=409, detail="Archived expenses are read-only")
+            raise HTTPException(status_code=404, detail="Expense not found")
+
+        current_version = existing_expense.get("version", 0)
+        if version is not None and version != current_version:
+            # Stale client copy: fail before any Drive work
+            raise HTTPException(status_code=409, detail=f"Expense is at version {current_version}, not {version}")
+
+        # 1. Standard Fields Update
+        update_data = {}
+        fields_to_update = {
+            "expenseTypeId": expenseTypeId, "title": title, "date": date,
+            "amount": amount, "paymentMode": paymentMode, "billAvailable": billAvailable,
+            "userEmail": userEmail, "description": description, "carNumber": carNumber,
+            "serviceType": serviceType, "location": location, "equipmentName": equipmentName,
+            "equipmentType": equipmentType,
+        }
+        for field, value in fields_to_update.items():
+            if value is not None:
+                update_data[field] = value
+
+        if carNumber is not None:
+            update_data.update(search_fields(carNumber))
+
+        # 2. Attachment diff: kept ids in, everything else out
         try:
-            new_results = await asyncio.gather(*new_upload_tasks)
-            # Add successful uploads to final list
-            final_attachments.extend([res for res in new_results if res])
-        except Exception as e:
-            print(f"Parallel update upload error: {e}")
+            kept_raw = json.loads(keptAttachments)
+            kept_ids = []
+            for item in kept_raw:
+                if isinstance(item, dict):
+                    kept_ids.append(item.get('id'))
+                else:
+                    kept_ids.append(item)
+        except:
+            kept_ids = []
 
-    update_data["attachments"] = final_attachments
+        current_attachments = existing_expense.get("attachments", [])
+        removed = [
+            att for att in current_attachments
+            if (att['id'] if isinstance(att, dict) else att) not in kept_ids
+        ]
 
-    expenses_collection.update_one(
-        {"_id": ObjectId(expense_id)},
-        {"$set": update_data, "$currentDate": {"updatedAt": True}}
-    )
+        # 3. Upload new files concurrently
+        uploaded = []
+        if newAttachments:
+            results = await asyncio.gather(
+                *(upload_file_to_drive(file) for file in newAttachments), return_exceptions=True
+            )
+            for res in results:
+                if isinstance(res, BaseException):
+                    print(f"Parallel update upload error: {res}")
+                elif res:
+                    uploaded.append(res)
+
+        # 4. Commit only if nobody changed the expense since it was read
+        version_filter = {"version": current_version} if current_version else {"version": {"$exists": False}}
+        update = {"$inc": {"version": 1}, "$currentDate": {"updatedAt": True}}
+        if update_data:
+            update["$set"] = update_data
+        if removed and uploaded:
+            # $pull and $push cannot target the same array in one update; a pipeline can do both
+            update = [
+                {"$set": {
+                    **{field: {"$literal": value} for field, value in update_data.items()},
+                    "attachments": {"$concatArrays": [
+                        {"$filter": {
+                            "input": {"$ifNull": ["$attachments", []]},
+                            "cond": {"$not": {"$in": ["$$this", {"$literal": removed}]}}
+                        }},
+                        {"$literal": uploaded}
+                    ]},
+                    "version": {"$add": [{"$ifNull": ["$version", 0]}, 1]},
+                    "updatedAt": "$$NOW"
+                }}
+            ]
+        elif removed:
+            update["$pull"] = {"attachments": {"$in": removed}}
+        elif uploaded:
+            update["$push"] = {"attachments": {"$each": uploaded}}
+
+        def write(session):
+            updated = expenses_collection.find_one_and_update(
+                {"_id": ObjectId(expense_id), **version_filter},
+                update,
+                return_document=ReturnDocument.AFTER,
+                session=session
+            )
+            if updated is not None:
+                apply_summary_change(existing_expense, updated, session=session)
+            return updated
+
+        updated_expense = run_in_transaction(write)
+        if updated_expense is None:
+            # Lost the race: drop our uploads in the background and answer right away
+            if uploaded:
+                asyncio.get_running_loop().run_in_executor(None, _delete_attachments, uploaded)
+            raise HTTPException(
+                status_code=409,
+                detail="Expense was changed by someone else, reload it and try again"
+            )
+
+        # 5. Removed files leave Drive only once the new state is committed
+        if removed:
+            await asyncio.gather(*(asyncio.to_thread(delete_attachment_files, att) for att in removed))
+
+        record_storage_change(existing_expense, updated_expense)
+        possible_duplicates = check_expense_safely(updated_expense)
+        publish_change("expenses", "update", expense_id, updated_expense, update_data,
+                       user_email=updated_expense.get("userEmail"))
+
+        return {
+            "message": "Expense updated successfully",
+            "version": updated_expense["version"],
+            "possibleDuplicates": possible_duplicates
+        }
 
-    return {"message": "Expense updated successfully"}
+    return await run_idempotent("expense.update", idempotencyKey, fingerprint, work)
 
 # ---------------- DELETE EXPENSE ----------------
 @router.delete("/delete")
@@ -212,10 +529,26 @@ def delete_expenses(payload: ExpenseDeleteRequest):
         # Delete all attachments in Drive
         attachments = expense.get("attachments", [])
         for att in attachments:
-            att_id = att['id'] if isinstance(att, dict) else att
-            delete_file_from_drive(att_id)
+            delete_attachment_files(att)
 
-        expenses_collection.delete_one({"_id": ObjectId(expense_id)})
+        def write(session):
+            result = expenses_collection.delete_one({"_id": expense["_id"]}, session=session)
+            if result.deleted_count:
+                expense_tombstones_collection.insert_one({
+                    "expenseId": expense["_id"],
+                    "userEmail": expense.get("userEmail"),
+                    "deletedAt": datetime.datetime.utcnow()
+                }, session=session)
+                apply_summary_change(expense, None, session=session)
+            return result.deleted_count
+
+        if not run_in_transaction(write):
+            # Deleted by a concurrent request
+            not_found_expenses.append(expense_id)
+            continue
+        record_storage_change(expense, None)
+        forget_expense(expense["_id"])
+        publish_change("expenses", "delete", expense_id, user_email=expense.get("userEmail"))
         deleted_expenses.append(expense_id)
 
     return {
@@ -226,20 +559,31 @@ def delete_expenses(payload: ExpenseDeleteRequest):
     }
 
 # ---------------- DOWNLOAD ATTACHMENT ----------------
+def _stored_attachment(file_id: str):
+    """ The attachment entry for a Drive id (indexed), None for legacy plain-id attachments """
+    projection = {"attachments": {"$elemMatch": {"id": file_id}}}
+    for expense in find_across_tiers({"attachments.id": file_id}, projection):
+        return expense["attachments"][0]
+    return None
+
 @router.get("/attachment/{file_id}")
 def download_attachment(file_id: str):
     # 🟢 UPDATED: Use the streaming generator
     # This prevents the server from loading the full file into RAM
     # and starts the download immediately for the user.
-    iterfile, filename, mime_type = stream_file_content(file_id)
+    # Name, type and size come from the stored attachment: no metadata call to Drive.
+    iterfile, filename, mime_type, size = stream_file_content(file_id, _stored_attachment(file_id))
     
     if iterfile is None:
         raise HTTPException(status_code=404, detail="File not found in Drive")
 
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    if size is not None:
+        headers["Content-Length"] = str(size)
     return StreamingResponse(
         iterfile(),
         media_type=mime_type,
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+        headers=headers
     )
 
 # ---------------- DELETE SPECIFIC ATTACHMENT ----------------
@@ -248,18 +592,39 @@ def remove_attachment(expense_id: str, file_id: str):
     if not ObjectId.is_valid(expense_id):
         raise HTTPException(status_code=400, detail="Invalid ID format")
 
-    # 1. Delete from Drive
-    delete_file_from_drive(file_id)
+    expense = expenses_collection.find_one({"_id": ObjectId(expense_id)})
+    if not expense:
+        if find_archived(ObjectId(expense_id)):
+            raise HTTPException(status_code=409, detail="Archived expenses are read-only")
+        raise HTTPException(status_code=404, detail="Expense not found")
 
-    # 2. Pull from DB
-    expenses_collection.update_one(
-        {"_id": ObjectId(expense_id)},
-        {"$pull": {"attachments": {"id": file_id}}}
+    removed = next(
+        (att for att in expense.get("attachments", [])
+         if (att["id"] if isinstance(att, dict) else att) == file_id),
+        None
     )
-    # Legacy support
+    if removed is None:
+        raise HTTPException(status_code=404, detail="Attachment not found on this expense")
+
+    # 1. Delete from Drive (with the kept original, if any)
+    delete_attachment_files(removed)
+
+    # 2. Pull from DB (the stored element, so legacy plain ids match too)
     expenses_collection.update_one(
         {"_id": ObjectId(expense_id)},
-        {"$pull": {"attachments": file_id}}
+        {
+            "$pull": {"attachments": removed},
+            "$inc": {"version": 1},
+            "$currentDate": {"updatedAt": True}
+        }
     )
 
+    remaining = [
+        att for att in expense.get("attachments", [])
+        if (att["id"] if isinstance(att, dict) else att) != file_id
+    ]
+    record_storage_change(expense, {**expense, "attachments": remaining})
+    publish_change("expenses", "update", expense_id, {**expense, "attachments": remaining},
+                   {"attachments": remaining}, user_email=expense.get("userEmail"))
+
     return {"message": "Attachment removed successfully"}
\ No newline at end of file
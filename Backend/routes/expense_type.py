@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from models import ExpenseTypeCreate, ExpenseTypeUpdate
 from db import expense_type_collection, employee_collection
+from events import publish_change
 from datetime import datetime
 from bson import ObjectId
 
@@ -22,12 +23,14 @@ def add_expense_type(expense_type: ExpenseTypeCreate):
             detail="Expense type already exists"
         )
 
-    expense_type_collection.insert_one({
+    new_type = {
         "ExpenseTypeName": expense_type.ExpenseTypeName,
         "Description": expense_type.Description,
         "IsActive": expense_type.IsActive,
         "CreatedAt": datetime.now()
-    })
+    }
+    result = expense_type_collection.insert_one(new_type)
+    publish_change("expenseTypes", "insert", result.inserted_id, new_type)
 
     return {"message": "Expense type created successfully"}
 
@@ -70,6 +73,7 @@ def update_expense_type(
             status_code=404,
             detail="Expense type not found"
         )
+    publish_change("expenseTypes", "update", expense_type_id, changes=update_data)
 
     return {
         "message": "Expense type updated successfully",
@@ -96,6 +100,7 @@ def remove_expense_type(expense_type_id: str):
             status_code=404,
             detail="Expense type not found"
         )
+    publish_change("expenseTypes", "delete", expense_type_id)
 
     return {"message": "Expense type removed successfully"}
 # 📌 Get all expense types
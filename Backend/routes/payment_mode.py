@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException
 from bson import ObjectId
 from datetime import datetime
 from db import payment_mode_collection, employee_collection
+from events import publish_change
 from models import PaymentModeCreate, PaymentModeUpdate
 
 router = APIRouter(
@@ -29,6 +30,7 @@ def create_payment_mode(payload: PaymentModeCreate):
     }
 
     result = payment_mode_collection.insert_one(data)
+    publish_change("paymentModes", "insert", result.inserted_id, data)
     return {
         "message": "Payment mode created successfully",
         "paymentModeId": str(result.inserted_id)
@@ -103,6 +105,7 @@ def update_payment_mode(
             status_code=404,
             detail="Payment mode not found"
         )
+    publish_change("paymentModes", "update", payment_mode_id, changes=update_data)
 
     return {"message": "Payment mode updated successfully"}
 
@@ -121,6 +124,7 @@ def remove_payment_mode(payment_mode_id: str):
             status_code=404,
             detail="Payment mode not found"
         )
+    publish_change("paymentModes", "delete", payment_mode_id)
 
     return {"message": "Payment mode removed successfully"}
 
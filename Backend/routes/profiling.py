@@ -0,0 +1,26 @@
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import FileResponse
+from profiler import PROFILE_ADMIN_TOKEN, PROFILE_ROUTES_PREFIX, list_profiles, profile_path
+
+router = APIRouter(
+    prefix=PROFILE_ROUTES_PREFIX,
+    tags=["Profiling"]
+)
+
+def _check_admin(token):
+    if not PROFILE_ADMIN_TOKEN or token != PROFILE_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@router.get("")
+def get_profiles(x_profile: str = Header(None)):
+    _check_admin(x_profile)
+    return {"profiles": list_profiles()}
+
+# Folded stacks: open in speedscope or pipe into flamegraph.pl
+@router.get("/{profile_id}")
+def download_profile(profile_id: str, x_profile: str = Header(None)):
+    _check_admin(x_profile)
+    path = profile_path(profile_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=f"{profile_id}.folded")
@@ -0,0 +1,236 @@
+import os
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse, JSONResponse
+from pymongo.errors import DuplicateKeyError
+from bson import ObjectId
+import gridfs
+from gridfs.errors import NoFile
+
+from db import get_db, report_jobs_collection
+from report_utils import (
+    GROUP_BY_FIELDS,
+    MONTH_PATTERN,
+    data_version,
+    report_cache_key,
+    build_monthly_report
+)
+from report_render import render_report_files
+
+router = APIRouter(
+    prefix="/reports",
+    tags=["Reports"]
+)
+
+def _report_files():
+    """ Rendered artifacts live in GridFS so every worker can serve them """
+    return gridfs.GridFSBucket(get_db(), bucket_name="ReportArtifacts")
+
+REPORT_FORMATS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "pdf": "application/pdf",
+}
+
+# A job stuck in "queued" / "running" longer than this (worker crashed) is started again
+STALE_JOB_AFTER = timedelta(minutes=15)
+
+# Threads stream + aggregate from Mongo, the process pool does the CPU-heavy rendering
+_job_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="report-job")
+_render_pool = None
+_render_pool_pid = None
+
+def _get_render_pool():
+    global _render_pool, _render_pool_pid
+    if _render_pool is None or _render_pool_pid != os.getpid():
+        _render_pool = ProcessPoolExecutor(max_workers=int(os.getenv("REPORT_RENDER_WORKERS", "1")))
+        _render_pool_pid = os.getpid()
+    return _render_pool
+
+def shutdown_render_pool():
+    """ From the app lifespan """
+    global _render_pool
+    if _render_pool is not None and _render_pool_pid == os.getpid():
+        _render_pool.shutdown(wait=False, cancel_futures=True)
+    _render_pool = None
+
+def _drop_superseded(job: dict):
+    """
+    Every data change gives a report a new cache key; once the newer report is
+    done, the earlier finished ones for the same month / grouping and their
+    GridFS files are deleted.
+    """
+    superseded = list(report_jobs_collection.find({
+        "month": job["month"],
+        "groupBy": job["groupBy"],
+        "_id": {"$lt": job["_id"]},
+        "status": {"$in": ["done", "failed"]},
+    }))
+    if not superseded:
+        return
+    report_jobs_collection.delete_many({"_id": {"$in": [old["_id"] for old in superseded]}})
+    for old in superseded:
+        for artifact in (old.get("artifacts") or {}).values():
+            try:
+                _report_files().delete(artifact["fileId"])
+            except NoFile:
+                pass
+
+def _run_report_job(job_id: ObjectId):
+    job = report_jobs_collection.find_one_and_update(
+        {"_id": job_id, "status": "queued"},
+        {"$set": {"status": "running", "startedAt": datetime.now()}}
+    )
+    if not job:
+        return
+
+    try:
+        report = build_monthly_report(job["month"], job["groupBy"])
+        files = _get_render_pool().submit(render_report_files, report).result()
+
+        artifacts = {}
+        for fmt, content in files.items():
+            filename = f"expense-report-{job['month']}-{job['groupBy']}.{fmt}"
+            file_id = _report_files().upload_from_stream(
+                filename, content, metadata={"jobId": job_id, "contentType": REPORT_FORMATS[fmt]}
+            )
+            artifacts[fmt] = {"fileId": file_id, "filename": filename, "size": len(content)}
+
+        report_jobs_collection.update_one(
+            {"_id": job_id},
+            {"$set": {
+                "status": "done",
+                "artifacts": artifacts,
+                "summary": {"expenseCount": report["expenseCount"], "grandTotal": report["grandTotal"]},
+                "finishedAt": datetime.now()
+            }}
+        )
+        _drop_superseded(job)
+    except Exception as e:
+        print(f"Report job {job_id} failed: {e}")
+        report_jobs_collection.update_one(
+            {"_id": job_id},
+            {"$set": {"status": "failed", "error": str(e), "finishedAt": datetime.now()}}
+        )
+
+def _enqueue(job_id: ObjectId):
+    _job_executor.submit(_run_report_job, job_id)
+
+def _job_response(job: dict) -> dict:
+    response = {
+        "jobId": str(job["_id"]),
+        "status": job["status"],
+        "month": job["month"],
+        "groupBy": job["groupBy"],
+        "requestedAt": job.get("requestedAt"),
+        "finishedAt": job.get("finishedAt"),
+    }
+    if job["status"] == "done":
+        response["summary"] = job.get("summary")
+        response["downloads"] = {
+            fmt: f"/reports/jobs/{job['_id']}/download?format={fmt}"
+            for fmt in job.get("artifacts", {})
+        }
+    if job["status"] == "failed":
+        response["error"] = job.get("error")
+    return response
+
+# ---------------- REQUEST MONTHLY REPORT ----------------
+@router.get("/monthly")
+def request_monthly_report(
+    month: str = Query(..., description="YYYY-MM"),
+    groupBy: str = Query("employee", description="employee | expenseType | paymentMode")
+):
+    if not MONTH_PATTERN.match(month):
+        raise HTTPException(status_code=400, detail="month must be in YYYY-MM format")
+    if groupBy not in GROUP_BY_FIELDS:
+        raise HTTPException(status_code=400, detail=f"groupBy must be one of {', '.join(GROUP_BY_FIELDS)}")
+
+    cache_key = report_cache_key(month, groupBy, data_version(month))
+
+    job = report_jobs_collection.find_one({"cacheKey": cache_key})
+    if job:
+        # When the job entered its current state: "queued" since requestedAt, "running" since startedAt
+        since_field = {"queued": "requestedAt", "running": "startedAt"}.get(job["status"])
+        abandoned = since_field and job.get(since_field) and datetime.now() - job[since_field] > STALE_JOB_AFTER
+        if job["status"] == "failed" or abandoned:
+            # Retry failed / abandoned jobs under the same key; only the request that flips it enqueues
+            retry_filter = {"_id": job["_id"], "status": job["status"]}
+            if since_field:
+                retry_filter[since_field] = job[since_field]
+            retried = report_jobs_collection.update_one(
+                retry_filter,
+                {"$set": {"status": "queued", "requestedAt": datetime.now()}, "$unset": {"error": "", "startedAt": ""}}
+            )
+            if retried.matched_count == 1:
+                _enqueue(job["_id"])
+            job = report_jobs_collection.find_one({"_id": job["_id"]})
+
+        status_code = 200 if job["status"] == "done" else 202
+        return JSONResponse(status_code=status_code, content=_serialize(_job_response(job)))
+
+    job = {
+        "cacheKey": cache_key,
+        "month": month,
+        "groupBy": groupBy,
+        "status": "queued",
+        "requestedAt": datetime.now()
+    }
+    try:
+        job["_id"] = report_jobs_collection.insert_one(job).inserted_id
+    except DuplicateKeyError:
+        # Same report requested concurrently by another worker
+        job = report_jobs_collection.find_one({"cacheKey": cache_key})
+        return JSONResponse(status_code=202, content=_serialize(_job_response(job)))
+
+    _enqueue(job["_id"])
+    return JSONResponse(status_code=202, content=_serialize(_job_response(job)))
+
+# ---------------- JOB STATUS ----------------
+@router.get("/jobs/{job_id}")
+def get_report_job(job_id: str):
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=400, detail="Invalid job ID")
+
+    job = report_jobs_collection.find_one({"_id": ObjectId(job_id)})
+    if not job:
+        raise HTTPException(status_code=404, detail="Report job not found")
+
+    return _job_response(job)
+
+# ---------------- DOWNLOAD ARTIFACT ----------------
+@router.get("/jobs/{job_id}/download")
+def download_report(job_id: str, format: str = Query("xlsx")):
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=400, detail="Invalid job ID")
+    if format not in REPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be xlsx or pdf")
+
+    job = report_jobs_collection.find_one({"_id": ObjectId(job_id)})
+    if not job:
+        raise HTTPException(status_code=404, detail="Report job not found")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Report is {job['status']}")
+
+    artifact = job["artifacts"][format]
+    stream = _report_files().open_download_stream(artifact["fileId"])
+
+    def iterfile():
+        while True:
+            chunk = stream.read(65536)
+            if not chunk:
+                break
+            yield chunk
+
+    return StreamingResponse(
+        iterfile(),
+        media_type=REPORT_FORMATS[format],
+        headers={
+            "Content-Disposition": f"attachment; filename={artifact['filename']}",
+            "Content-Length": str(artifact["size"])
+        }
+    )
+
+def _serialize(data: dict) -> dict:
+    """ JSONResponse does not know datetimes """
+    return {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in data.items()}
@@ -0,0 +1,20 @@
+from fastapi import APIRouter, HTTPException, Query
+from scheduler import JOBS, get_job_status, run_job_if_due
+
+router = APIRouter(
+    prefix="/scheduler",
+    tags=["Scheduler"]
+)
+
+@router.get("/jobs")
+def list_jobs(history: int = Query(10, ge=0, le=100)):
+    return {"jobs": get_job_status(history)}
+
+# Runs the job now (force) or if due, unless another worker holds its lease
+@router.post("/jobs/{job_name}/run")
+def run_job(job_name: str, force: bool = Query(True)):
+    if job_name not in JOBS:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    ran = run_job_if_due(job_name, force=force)
+    return {"job": job_name, "ran": ran}
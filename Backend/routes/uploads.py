@@ -0,0 +1,155 @@
+from datetime import datetime, timedelta
+from fastapi import APIRouter, HTTPException, Header, Request, Response
+from fastapi.responses import JSONResponse
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from db import expenses_collection, upload_sessions_collection
+from models import UploadAttach
+from storage_accounting import record_storage_change
+from duplicates import check_expense_safely
+from events import publish_change
+from archive import find_archived
+from scheduler import register_job
+from resumable_uploads import (
+    TUS_VERSION,
+    MAX_UPLOAD_BYTES,
+    LEASE,
+    parse_metadata,
+    session_offset,
+    create_session,
+    get_session,
+    receive_chunks,
+    terminate_session,
+    attachment_metadata,
+    expire_upload_sessions
+)
+
+router = APIRouter(
+    prefix="/uploads",
+    tags=["Uploads"]
+)
+
+TUS_HEADERS = {"Tus-Resumable": TUS_VERSION}
+
+# ---------------- CREATE ----------------
+# Upload-Metadata keys: filename, filetype, userEmail
+@router.post("", status_code=201)
+def create_upload(
+    request: Request,
+    uploadLength: int = Header(..., alias="Upload-Length"),
+    uploadMetadata: str = Header("", alias="Upload-Metadata")
+):
+    session = create_session(uploadLength, parse_metadata(uploadMetadata))
+    return JSONResponse(
+        status_code=201,
+        content={"uploadId": session["_id"], "length": session["length"], "expiresAt": session["expiresAt"].isoformat()},
+        headers={
+            "Location": str(request.url_for("get_upload_offset", upload_id=session["_id"])),
+            "Upload-Offset": "0",
+            "Tus-Max-Size": str(MAX_UPLOAD_BYTES),
+            **TUS_HEADERS
+        }
+    )
+
+# ---------------- OFFSET ----------------
+@router.head("/{upload_id}")
+def get_upload_offset(upload_id: str):
+    session = get_session(upload_id)
+    return Response(status_code=200, headers={
+        "Upload-Offset": str(session_offset(session)),
+        "Upload-Length": str(session["length"]),
+        "Cache-Control": "no-store",
+        **TUS_HEADERS
+    })
+
+# ---------------- APPEND ----------------
+# The body is read as a stream, never parsed as a form
+@router.patch("/{upload_id}", status_code=204)
+async def append_upload(
+    upload_id: str,
+    request: Request,
+    uploadOffset: int = Header(..., alias="Upload-Offset"),
+    contentType: str = Header(None, alias="Content-Type")
+):
+    if contentType != "application/offset+octet-stream":
+        raise HTTPException(status_code=415, detail="Content-Type must be application/offset+octet-stream")
+
+    result = await receive_chunks(upload_id, uploadOffset, request.stream())
+    headers = {"Upload-Offset": str(result["offset"]), **TUS_HEADERS}
+    if result["complete"]:
+        headers["Upload-Complete"] = "1"
+    return Response(status_code=204, headers=headers)
+
+# ---------------- CANCEL ----------------
+@router.delete("/{upload_id}", status_code=204)
+def delete_upload(upload_id: str):
+    terminate_session(upload_id)
+    return Response(status_code=204, headers=TUS_HEADERS)
+
+# ---------------- ATTACH TO EXPENSE ----------------
+@router.post("/{upload_id}/attach")
+def attach_upload(upload_id: str, payload: UploadAttach):
+    if not ObjectId.is_valid(payload.expenseId):
+        raise HTTPException(status_code=400, detail="Invalid expense ID")
+    expense_id = ObjectId(payload.expenseId)
+
+    session = get_session(upload_id)
+    if not session["file"]:
+        raise HTTPException(
+            status_code=409,
+            detail="Upload is not complete",
+            headers={"Upload-Offset": str(session_offset(session))}
+        )
+    if session["attachedTo"] is not None:
+        if session["attachedTo"] == expense_id:
+            # Retried request: already done
+            return {"message": "Attachment added", "attachment": session["attachment"]}
+        raise HTTPException(status_code=409, detail="Upload is already attached to another expense")
+
+    existing_expense = expenses_collection.find_one({"_id": expense_id})
+    if not existing_expense:
+        if find_archived(expense_id):
+            raise HTTPException(status_code=409, detail="Archived expenses are read-only")
+        raise HTTPException(status_code=404, detail="Expense not found")
+    current_version = existing_expense.get("version", 0)
+    if payload.version is not None and payload.version != current_version:
+        raise HTTPException(status_code=409, detail=f"Expense is at version {current_version}, not {payload.version}")
+
+    # Claim the upload, then add it to the expense; undo the claim if the expense moved on.
+    # The claim keeps the session for at least LEASE so the cleanup job cannot expire it in between.
+    attachment = attachment_metadata(session)
+    now = datetime.utcnow()
+    claimed = upload_sessions_collection.update_one(
+        {"_id": upload_id, "attachedTo": None, "expiresAt": {"$gt": now}},
+        {"$set": {"attachedTo": expense_id, "attachment": attachment}, "$max": {"expiresAt": now + LEASE}}
+    )
+    if claimed.modified_count == 0:
+        raise HTTPException(status_code=409, detail="Upload was attached or cancelled by another request")
+
+    version_filter = {"version": current_version} if current_version else {"version": {"$exists": False}}
+    updated_expense = expenses_collection.find_one_and_update(
+        {"_id": expense_id, **version_filter},
+        {"$push": {"attachments": attachment}, "$inc": {"version": 1}, "$currentDate": {"updatedAt": True}},
+        return_document=ReturnDocument.AFTER
+    )
+    if updated_expense is None:
+        upload_sessions_collection.update_one(
+            {"_id": upload_id, "attachedTo": expense_id},
+            {"$set": {"attachedTo": None, "attachment": None}}
+        )
+        raise HTTPException(status_code=409, detail="Expense was changed by someone else, reload it and try again")
+
+    record_storage_change(existing_expense, updated_expense)
+    possible_duplicates = check_expense_safely(updated_expense)
+    publish_change("expenses", "update", payload.expenseId, updated_expense,
+                   {"attachments": updated_expense["attachments"]}, user_email=updated_expense.get("userEmail"))
+
+    return {
+        "message": "Attachment added",
+        "attachment": attachment,
+        "version": updated_expense["version"],
+        "possibleDuplicates": possible_duplicates
+    }
+
+register_job("upload_session_cleanup", expire_upload_sessions, timedelta(hours=1))
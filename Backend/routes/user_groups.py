@@ -1,5 +1,6 @@
 from fastapi import APIRouter, HTTPException
-from db import user_groups_collection, employee_collection
+from db import user_groups_collection, user_groups_read_collection, employee_collection
+from events import publish_change
 from models import UserGroupCreate, UserGroupUpdate
 from datetime import datetime
 from bson import ObjectId
@@ -41,7 +42,8 @@ def create_user_group(data: UserGroupCreate):
         "updatedAt": datetime.utcnow()
     }
 
-    user_groups_collection.insert_one(group_data)
+    result = user_groups_collection.insert_one(group_data)
+    publish_change("userGroups", "insert", result.inserted_id, group_data)
 
     return {
         "message": "User group created successfully",
@@ -51,7 +53,7 @@ def create_user_group(data: UserGroupCreate):
 @router.get("/all")
 def get_all_groups():
 
-    groups = list(user_groups_collection.find())
+    groups = list(user_groups_read_collection.find())
 
     for g in groups:
         g["_id"] = str(g["_id"])
@@ -89,22 +91,25 @@ def update_user_group(group_id: str, data: UserGroupUpdate):
                     detail=f"EmployeeID {emp_id} does not exist"
                 )
 
-    result = user_groups_collection.update_one(
+    group = user_groups_collection.find_one_and_update(
         {"groupId": group_id},
-        {"$set": update_data, "$currentDate": {"updatedAt": True}}
+        {"$set": update_data, "$currentDate": {"updatedAt": True}},
+        projection={"_id": 1}
     )
 
-    if result.matched_count == 0:
+    if not group:
         raise HTTPException(status_code=404, detail="Group not found")
+    publish_change("userGroups", "update", group["_id"], changes=update_data)
 
     return {"message": "User group updated successfully"}
 
 @router.delete("/delete/{group_id}")
 def delete_user_group(group_id: str):
 
-    result = user_groups_collection.delete_one({"groupId": group_id})
+    group = user_groups_collection.find_one_and_delete({"groupId": group_id}, {"_id": 1})
 
-    if result.deleted_count == 0:
+    if not group:
         raise HTTPException(status_code=404, detail="Group not found")
+    publish_change("userGroups", "delete", group["_id"])
 
     return {"message": "User group deleted successfully"}
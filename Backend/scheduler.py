@@ -0,0 +1,180 @@
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+
+from db import scheduler_locks_collection, job_runs_collection
+
+# Every worker process ticks every registered job; a Mongo lease decides which
+# one actually runs it, and nextRunAt (stored with the lease) keeps the cadence
+# shared across workers and restarts.
+
+_worker_id = None
+_worker_pid = None
+
+def worker_id() -> str:
+    """ Lease owner name; recomputed after fork so preloaded workers differ """
+    global _worker_id, _worker_pid
+    if _worker_pid != os.getpid():
+        _worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        _worker_pid = os.getpid()
+    return _worker_id
+
+TICK_SECONDS = int(os.getenv("SCHEDULER_TICK_SECONDS", "60"))
+DEFAULT_LEASE = timedelta(minutes=5)
+
+JOBS = {}
+
+_scheduler = None
+_registered = set()
+
+def register_job(name: str, func, interval: timedelta, lease: timedelta = DEFAULT_LEASE, run_on_first_start: bool = True):
+    """
+    Registers periodic work. Call at import time; nothing runs until start_scheduler().
+    run_on_first_start: run as soon as the job is first seen (no lock document yet),
+    otherwise wait one interval.
+    """
+    JOBS[name] = {
+        "func": func,
+        "interval": interval,
+        "lease": lease,
+        "run_on_first_start": run_on_first_start,
+    }
+
+def _ensure_lock_doc(name: str, job: dict):
+    now = datetime.utcnow()
+    first_run = now if job["run_on_first_start"] else now + job["interval"]
+    scheduler_locks_collection.update_one(
+        {"_id": name},
+        {"$setOnInsert": {"nextRunAt": first_run, "leaseUntil": None, "owner": None}},
+        upsert=True
+    )
+
+def _acquire(name: str, job: dict):
+    """ Takes the lease only if the job is due and nobody holds a live lease """
+    now = datetime.utcnow()
+    return scheduler_locks_collection.find_one_and_update(
+        {
+            "_id": name,
+            "nextRunAt": {"$lte": now},
+            "$or": [{"leaseUntil": None}, {"leaseUntil": {"$lte": now}}]
+        },
+        {"$set": {"owner": worker_id(), "leaseUntil": now + job["lease"], "lastStartedAt": now}},
+        return_document=ReturnDocument.AFTER
+    )
+
+def _heartbeat(name: str, job: dict, stop: threading.Event):
+    """ Renews the lease while the job runs so long jobs are not taken over """
+    interval = job["lease"].total_seconds() / 3
+    while not stop.wait(interval):
+        result = scheduler_locks_collection.update_one(
+            {"_id": name, "owner": worker_id()},
+            {"$set": {"leaseUntil": datetime.utcnow() + job["lease"]}}
+        )
+        if result.matched_count == 0:
+            print(f"[scheduler] Lost lease for {name} on {worker_id()}")
+            return
+
+def _release(name: str, job: dict, status: str):
+    # Next run is measured from now: missed runs are skipped, not replayed
+    now = datetime.utcnow()
+    scheduler_locks_collection.update_one(
+        {"_id": name, "owner": worker_id()},
+        {"$set": {
+            "leaseUntil": None,
+            "owner": None,
+            "lastRunAt": now,
+            "lastStatus": status,
+            "nextRunAt": now + job["interval"]
+        }}
+    )
+
+def run_job_if_due(name: str, force: bool = False):
+    job = JOBS[name]
+    try:
+        if name not in _registered:
+            _ensure_lock_doc(name, job)
+            _registered.add(name)
+        if force:
+            scheduler_locks_collection.update_one({"_id": name}, {"$set": {"nextRunAt": datetime.utcnow()}})
+        if not _acquire(name, job):
+            return False
+    except Exception as e:
+        print(f"[scheduler] Could not check lease for {name}: {e}")
+        return False
+
+    started = datetime.utcnow()
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(name, job, stop), daemon=True).start()
+
+    status, error = "success", None
+    try:
+        job["func"]()
+    except Exception as e:
+        status, error = "failed", str(e)
+        print(f"[scheduler] Job {name} failed: {e}")
+    finally:
+        stop.set()
+
+    finished = datetime.utcnow()
+    try:
+        _release(name, job, status)
+        job_runs_collection.insert_one({
+            "job": name,
+            "owner": worker_id(),
+            "startedAt": started,
+            "finishedAt": finished,
+            "durationMs": int((finished - started).total_seconds() * 1000),
+            "status": status,
+            "error": error
+        })
+    except Exception as e:
+        print(f"[scheduler] Could not record run of {name}: {e}")
+    return True
+
+def start_scheduler():
+    """ Called from the app lifespan, once per worker process """
+    global _scheduler
+    if _scheduler is not None:
+        return
+
+    from apscheduler.schedulers.background import BackgroundScheduler
+
+    _scheduler = BackgroundScheduler(job_defaults={
+        "coalesce": True,          # collapse missed ticks into one
+        "max_instances": 1,
+        "misfire_grace_time": TICK_SECONDS
+    })
+    # Lock documents are created on the first tick, so startup never waits on Mongo
+    for name in JOBS:
+        _scheduler.add_job(run_job_if_due, "interval", seconds=TICK_SECONDS, args=[name], id=name,
+                           next_run_time=datetime.now())
+    _scheduler.start()
+    print(f"[scheduler] Started on {worker_id()} with jobs: {', '.join(JOBS) or 'none'}")
+
+def shutdown_scheduler():
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.shutdown(wait=False)
+        _scheduler = None
+
+def get_job_status(history: int = 10) -> list:
+    jobs = []
+    for name, job in JOBS.items():
+        lock = scheduler_locks_collection.find_one({"_id": name}) or {}
+        runs = list(
+            job_runs_collection.find({"job": name}, {"_id": 0}).sort("startedAt", -1).limit(history)
+        )
+        jobs.append({
+            "name": name,
+            "intervalSeconds": job["interval"].total_seconds(),
+            "owner": lock.get("owner"),
+            "leaseUntil": lock.get("leaseUntil"),
+            "nextRunAt": lock.get("nextRunAt"),
+            "lastRunAt": lock.get("lastRunAt"),
+            "lastStatus": lock.get("lastStatus"),
+            "recentRuns": runs
+        })
+    return jobs
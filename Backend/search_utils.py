@@ -0,0 +1,70 @@
+import re
+
+# Fields covered by the expense text index, with their relevance weights
+TEXT_SEARCH_WEIGHTS = {
+    "title": 10,
+    "carNumber": 8,
+    "equipmentName": 5,
+    "location": 3,
+    "equipmentType": 3,
+    "description": 1,
+}
+
+GRAM_SIZE = 3
+
+def normalize_car_number(car_number: str) -> str:
+    """ 'ka-01 ab 1234' -> 'KA01AB1234' """
+    if not car_number:
+        return ""
+    return re.sub(r"[^A-Z0-9]", "", car_number.upper())
+
+def car_number_grams(normalized: str):
+    """ Overlapping trigrams used to find fuzzy candidates through an index """
+    if not normalized:
+        return []
+    if len(normalized) <= GRAM_SIZE:
+        return [normalized]
+    return sorted({normalized[i:i + GRAM_SIZE] for i in range(len(normalized) - GRAM_SIZE + 1)})
+
+def search_fields(car_number: str) -> dict:
+    """ Derived fields stored next to carNumber so lookups stay indexed """
+    normalized = normalize_car_number(car_number)
+    return {
+        "carNumberNorm": normalized,
+        "carNumberGrams": car_number_grams(normalized),
+    }
+
+def edit_distance(a: str, b: str) -> int:
+    """ Plain Levenshtein distance (car numbers are short) """
+    if a == b:
+        return 0
+    if not a:
+        return len(b)
+    if not b:
+        return len(a)
+
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != cb)
+            ))
+        previous = current
+    return previous[-1]
+
+def car_number_distance(query: str, candidate: str) -> int:
+    """
+    Distance between a (possibly partial) car number and a stored one.
+    A query is compared against the candidate's prefix of the same length too,
+    so 'KA01AB' still matches 'KA01AB1234' with distance 0.
+    """
+    full = edit_distance(query, candidate)
+    if len(candidate) > len(query):
+        return min(full, edit_distance(query, candidate[:len(query)]))
+    return full
+
+def max_car_number_distance(query: str) -> int:
+    return max(1, len(query) // 4)
@@ -0,0 +1,70 @@
+"""
+Production entry point.
+
+    python serve.py --workers 4 --bind 0.0.0.0:8000
+
+Uses gunicorn with uvicorn workers where available (Linux), otherwise
+uvicorn's own process manager. For development keep using `python main.py`.
+"""
+import argparse
+import multiprocessing
+import os
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the expense API with multiple workers")
+    parser.add_argument("--workers", type=int,
+                        default=int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1)))
+    parser.add_argument("--bind", default=os.getenv("BIND", "0.0.0.0:8000"))
+    parser.add_argument("--keepalive", type=int, default=int(os.getenv("KEEPALIVE", "5")))
+    parser.add_argument("--timeout", type=int, default=int(os.getenv("TIMEOUT", "120")))
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("GRACEFUL_TIMEOUT", "30")))
+    parser.add_argument("--no-preload", action="store_true", help="Import the app in each worker instead of the master")
+    return parser.parse_args()
+
+def run_gunicorn(args):
+    from gunicorn.app.base import Application
+
+    class ExpenseApplication(Application):
+        def init(self, parser, opts, args):
+            return None
+
+        def load_config(self):
+            # gunicorn.conf.py first, command line wins
+            self.load_config_from_file("gunicorn.conf.py")
+            self.cfg.set("workers", args.workers)
+            self.cfg.set("bind", [args.bind])
+            self.cfg.set("keepalive", args.keepalive)
+            self.cfg.set("timeout", args.timeout)
+            self.cfg.set("graceful_timeout", args.graceful_timeout)
+            self.cfg.set("preload_app", not args.no_preload)
+
+        def load(self):
+            from main import app
+            return app
+
+    ExpenseApplication().run()
+
+def run_uvicorn(args):
+    import uvicorn
+
+    host, _, port = args.bind.rpartition(":")
+    uvicorn.run(
+        "main:app",
+        host=host or "0.0.0.0",
+        port=int(port),
+        workers=args.workers,
+        timeout_keep_alive=args.keepalive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        proxy_headers=True
+    )
+
+if __name__ == "__main__":
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    args = parse_args()
+    try:
+        import gunicorn  # noqa: F401 (not available on Windows)
+    except ImportError:
+        run_uvicorn(args)
+    else:
+        # Outside the try: an ImportError while loading the app must not fall back to one process
+        run_gunicorn(args)
@@ -0,0 +1,210 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pymongo import UpdateOne, ReplaceOne, DESCENDING
+
+from db import db, storage_usage_collection, storage_snapshots_collection
+from metrics import drive_call
+
+MONGO_LIMIT_BYTES = 500 * 1024 * 1024             # 500 MB Atlas cap
+DRIVE_DEFAULT_LIMIT_BYTES = 15 * 1024 * 1024 * 1024  # 15 GB if Drive does not report one
+
+# ---------------- RUNNING TOTALS ----------------
+def _usage_keys(expense: dict, att) -> list:
+    """ Buckets an attachment counts towards: overall, owner, expense type and upload month """
+    uploaded_at = att.get("uploadedAt") if isinstance(att, dict) else None
+    if not isinstance(uploaded_at, datetime):
+        uploaded_at = expense.get("createdAt") if isinstance(expense.get("createdAt"), datetime) else None
+    month = uploaded_at.strftime("%Y-%m") if uploaded_at else "unknown"
+
+    return [
+        ("total", "all"),
+        ("user", expense.get("userEmail") or "unknown"),
+        ("expenseType", expense.get("expenseTypeId") or "unknown"),
+        ("month", month),
+    ]
+
+def _tally(expense: dict, sign: int, deltas: dict):
+    if not expense:
+        return
+    for att in expense.get("attachments") or []:
+        size = att.get("size", 0) + (att.get("original") or {}).get("size", 0) if isinstance(att, dict) else 0
+        for key in _usage_keys(expense, att):
+            deltas[key][0] += sign * size
+            deltas[key][1] += sign
+
+def record_storage_change(before: dict = None, after: dict = None):
+    """
+    Applies the attachment difference between two versions of an expense
+    to the running totals with $inc.
+    create: (None, new) / delete: (old, None) / update: (old, new)
+    Owner or expense type changes move the bytes between buckets.
+    """
+    deltas = defaultdict(lambda: [0, 0])
+    _tally(before, -1, deltas)
+    _tally(after, 1, deltas)
+
+    now = datetime.now()
+    ops = [
+        UpdateOne(
+            {"_id": f"{scope}:{key}"},
+            {
+                "$inc": {"bytes": size, "count": count},
+                "$set": {"scope": scope, "key": key, "updatedAt": now}
+            },
+            upsert=True
+        )
+        for (scope, key), (size, count) in deltas.items()
+        if size or count
+    ]
+    if not ops:
+        return
+
+    try:
+        storage_usage_collection.bulk_write(ops, ordered=False)
+    except Exception as e:
+        # Accounting must never fail the user's request; rebuild_storage_usage repairs drift
+        print(f"Storage accounting error: {e}")
+
+def rebuild_storage_usage():
+    """ Recomputes all running totals from the expenses (repairs drift) """
+    from archive import find_across_tiers
+
+    deltas = defaultdict(lambda: [0, 0])
+    # Archived expenses keep their attachments on Drive
+    expenses = find_across_tiers(
+        {"attachments.0": {"$exists": True}},
+        {"attachments": 1, "userEmail": 1, "expenseTypeId": 1, "createdAt": 1}
+    )
+    for exp in expenses:
+        _tally(exp, 1, deltas)
+
+    # Replaced bucket by bucket, never emptied: readers always see totals and
+    # $inc from record_storage_change keeps landing on existing documents
+    now = datetime.now()
+    totals = {f"{scope}:{key}": (scope, key, size, count) for (scope, key), (size, count) in deltas.items()}
+    if totals:
+        storage_usage_collection.bulk_write([
+            ReplaceOne(
+                {"_id": bucket_id},
+                {"scope": scope, "key": key, "bytes": size, "count": count, "updatedAt": now},
+                upsert=True
+            )
+            for bucket_id, (scope, key, size, count) in totals.items()
+        ], ordered=False)
+    # Buckets nothing counts towards any more, unless a change touched them meanwhile
+    storage_usage_collection.delete_many({"_id": {"$nin": list(totals)}, "updatedAt": {"$lt": now}})
+
+def get_usage(scope: str, limit: int = 10) -> list:
+    return list(
+        storage_usage_collection.find({"scope": scope}, {"_id": 0, "scope": 0})
+        .sort("bytes", DESCENDING)
+        .limit(limit)
+    )
+
+# ---------------- DAILY SNAPSHOTS ----------------
+def take_storage_snapshot():
+    """
+    The only place that calls dbstats and the Drive about() API.
+    Runs once a day; reports and projections read the stored snapshots.
+    """
+    from db import get_drive_service, drive_http
+
+    drive_service = get_drive_service()
+    db_stats = db.command("dbstats")
+    snapshot = {
+        "ts": datetime.utcnow(),
+        "source": "daily",
+        "mongo": {
+            "storageBytes": db_stats["storageSize"],
+            "limitBytes": MONGO_LIMIT_BYTES,
+            "objects": db_stats["objects"],
+            "collections": db_stats["collections"],
+        },
+        "drive": None,
+        "tracked": {"bytes": 0, "count": 0},
+    }
+
+    if drive_service:
+        try:
+            with drive_call("about.get"):
+                about = drive_service.about().get(fields="storageQuota").execute(http=drive_http())
+            quota = about.get("storageQuota", {})
+            snapshot["drive"] = {
+                "usedBytes": int(quota.get("usage", 0)),
+                "limitBytes": int(quota.get("limit", DRIVE_DEFAULT_LIMIT_BYTES)),
+            }
+        except Exception as e:
+            print(f"Failed to fetch Drive stats: {e}")
+
+    total = storage_usage_collection.find_one({"_id": "total:all"})
+    if total:
+        snapshot["tracked"] = {"bytes": total.get("bytes", 0), "count": total.get("count", 0)}
+
+    storage_snapshots_collection.insert_one(snapshot)
+    return snapshot
+
+def latest_snapshot(max_age: timedelta = timedelta(days=1)) -> dict:
+    snapshot = storage_snapshots_collection.find_one({}, sort=[("ts", DESCENDING)])
+    if not snapshot or datetime.utcnow() - snapshot["ts"] > max_age:
+        snapshot = take_storage_snapshot()
+    return snapshot
+
+def _daily_growth(points: list) -> float:
+    """ Least-squares slope in bytes/day over (datetime, bytes) points """
+    if len(points) < 2:
+        return 0.0
+    t0 = points[0][0]
+    xs = [(ts - t0).total_seconds() / 86400 for ts, _ in points]
+    ys = [value for _, value in points]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    denom = sum((x - mean_x) ** 2 for x in xs)
+    if denom == 0:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / denom
+
+def _projection(points: list, used: int, limit: int) -> dict:
+    growth = _daily_growth(points)
+    days_to_quota = None
+    if growth > 0 and limit:
+        days_to_quota = max(0, int((limit - used) / growth))
+    return {
+        "used": used,
+        "limit": limit,
+        "percent": (used / limit) * 100 if limit else 0,
+        "growthBytesPerDay": growth,
+        "daysToQuota": days_to_quota,
+    }
+
+def storage_trends(days: int = 30) -> dict:
+    """ Usage, growth and time-to-quota projections from the stored snapshots """
+    current = latest_snapshot()
+    since = datetime.utcnow() - timedelta(days=days)
+    history = list(
+        storage_snapshots_collection.find({"ts": {"$gte": since}}).sort("ts", 1)
+    )
+
+    mongo_points = [(s["ts"], s["mongo"]["storageBytes"]) for s in history]
+    drive_points = [(s["ts"], s["drive"]["usedBytes"]) for s in history if s.get("drive")]
+
+    trends = {
+        "snapshotAt": current["ts"],
+        "mongo": _projection(mongo_points, current["mongo"]["storageBytes"], current["mongo"]["limitBytes"]),
+        "drive": None,
+        "tracked": current.get("tracked", {}),
+        "history": [
+            {
+                "ts": s["ts"],
+                "mongoBytes": s["mongo"]["storageBytes"],
+                "driveBytes": s["drive"]["usedBytes"] if s.get("drive") else None,
+            }
+            for s in history
+        ],
+    }
+    trends["mongo"]["collections"] = current["mongo"]["collections"]
+    trends["mongo"]["objects"] = current["mongo"]["objects"]
+
+    if current.get("drive"):
+        trends["drive"] = _projection(drive_points, current["drive"]["usedBytes"], current["drive"]["limitBytes"])
+
+    return trends
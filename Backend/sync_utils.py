@@ -0,0 +1,51 @@
+import json
+import base64
+from datetime import datetime, timedelta
+from bson import ObjectId
+
+# Delta sync tokens for /expense/changes. A token is an opaque cursor over two
+# orderings: expenses by (updatedAt, _id) and tombstones by (deletedAt, _id).
+# Writes with a timestamp just before "now" may still be committing, so a
+# finished sync does not move the cursor past now - SETTLE; those documents
+# are sent again next time, which clients handle as plain upserts.
+
+SETTLE = timedelta(seconds=5)
+
+class InvalidSyncToken(ValueError):
+    pass
+
+def encode_token(expenses_cursor, tombstones_cursor) -> str:
+    """ Each cursor is (timestamp, last _id or None) """
+    payload = {
+        "v": 1,
+        "e": [expenses_cursor[0].isoformat(), str(expenses_cursor[1]) if expenses_cursor[1] else None],
+        "t": [tombstones_cursor[0].isoformat(), str(tombstones_cursor[1]) if tombstones_cursor[1] else None],
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+def decode_token(token: str):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        cursors = []
+        for key in ("e", "t"):
+            at, last_id = payload[key]
+            cursors.append((datetime.fromisoformat(at), ObjectId(last_id) if last_id else None))
+        return cursors[0], cursors[1]
+    except Exception:
+        raise InvalidSyncToken("Invalid sync token")
+
+def after_cursor(field: str, cursor) -> dict:
+    """ Documents strictly after the cursor in (field, _id) order """
+    at, last_id = cursor
+    if last_id is None:
+        return {field: {"$gte": at}}
+    return {"$or": [{field: {"$gt": at}}, {field: at, "_id": {"$gt": last_id}}]}
+
+def next_cursor(field: str, cursor, page: list, full_page: bool, now: datetime):
+    """ Cursor after this page; a final page stops short of the settle window """
+    if not page:
+        return cursor
+    last = page[-1]
+    if full_page or last[field] <= now - SETTLE:
+        return (last[field], last["_id"])
+    return (now - SETTLE, None)
@@ -0,0 +1,78 @@
+import os
+import sys
+import uuid
+
+import mongomock
+import pymongo
+import pytest
+
+# The app against an in-memory MongoDB: must be patched before anything imports db
+os.environ["MONGO_DB_NAME"] = "ExpenseDB_test"
+os.environ.setdefault("MAILEROO_API_KEY", "test")
+pymongo.MongoClient = mongomock.MongoClient
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, BACKEND_DIR)
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from db import get_client, MONGO_DB_NAME  # noqa: E402
+
+def _bson_max(doc, field_name, value):
+    """ mongomock's $max calls max() and cannot order embedded documents; BSON compares them field by field """
+    if not isinstance(doc, dict):
+        return
+    current = doc.get(field_name)
+    if current is None:
+        doc[field_name] = value
+    elif isinstance(value, dict) and isinstance(current, dict):
+        if tuple(value.values()) > tuple(current.values()):
+            doc[field_name] = value
+    else:
+        doc[field_name] = max(current, value)
+
+@pytest.fixture(autouse=True)
+def bson_max(monkeypatch):
+    import mongomock.collection
+
+    monkeypatch.setitem(mongomock.collection._updaters, "$max", _bson_max)
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    get_client().drop_database(MONGO_DB_NAME)
+    yield
+
+@pytest.fixture
+def client():
+    # No `with`: the lifespan (schedulers, Drive, mail) is not started
+    return TestClient(main.app)
+
+class FakeDrive:
+    """ Stands in for the Drive upload / delete helpers the expense routes call """
+    def __init__(self):
+        self.files = {}
+        self.deleted = []
+        self.on_upload = None
+
+    async def upload_file_to_drive(self, file):
+        content = await file.read()
+        file_id = uuid.uuid4().hex
+        self.files[file_id] = content
+        if self.on_upload:
+            self.on_upload()
+        return {"id": file_id, "filename": file.filename, "size": len(content), "mimeType": file.content_type}
+
+    def delete_attachment_files(self, att) -> bool:
+        file_id = att["id"] if isinstance(att, dict) else att
+        self.deleted.append(file_id)
+        return self.files.pop(file_id, None) is not None
+
+@pytest.fixture
+def drive(monkeypatch):
+    import routes.expense as expense_routes
+
+    fake = FakeDrive()
+    monkeypatch.setattr(expense_routes, "upload_file_to_drive", fake.upload_file_to_drive)
+    monkeypatch.setattr(expense_routes, "delete_attachment_files", fake.delete_attachment_files)
+    return fake
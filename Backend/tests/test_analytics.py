@@ -0,0 +1,42 @@
+import pytest
+from bson import ObjectId
+
+from analytics import expense_columns
+from db import expenses_collection
+
+def seed(*expenses):
+    expenses_collection.insert_many([
+        {"_id": ObjectId(), "userEmail": email, "amount": amount, "date": "2025-06-10T10:00",
+         "expenseTypeId": "fuel", "paymentMode": "Cash", "billAvailable": True}
+        for email, amount in expenses
+    ])
+    expense_columns.refresh(full=True)
+
+def query(client, **body):
+    return client.post("/analytics/query", json={"groupBy": ["userEmail"], **body})
+
+@pytest.fixture(autouse=True)
+def fresh_columns():
+    # The column store is per process: drop what this test loaded
+    yield
+    expense_columns.refresh(full=True)
+
+@pytest.mark.parametrize("order_by, expected", [
+    ("-sum", ["b@x.com", "c@x.com", "a@x.com"]),
+    ("sum", ["a@x.com", "c@x.com", "b@x.com"]),
+    ("-userEmail", ["c@x.com", "b@x.com", "a@x.com"]),
+])
+def test_order_by_accepts_a_descending_prefix(client, order_by, expected):
+    seed(("a@x.com", 10), ("b@x.com", 300), ("c@x.com", 40), ("c@x.com", 5))
+
+    response = query(client, orderBy=order_by)
+
+    assert response.status_code == 200
+    assert [row["userEmail"] for row in response.json()["rows"]] == expected
+
+def test_order_by_must_name_a_requested_column(client):
+    assert query(client, orderBy="-p95").status_code == 400
+
+@pytest.mark.parametrize("limit", [0, -1, 10001])
+def test_limit_is_bounded(client, limit):
+    assert query(client, limit=limit).status_code == 422
@@ -0,0 +1,95 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+import archive
+from archive import archive_collection, archive_old_expenses, find_across_tiers, read_tiers
+from db import expenses_collection
+
+ALICE = "alice@rataagroup.com"
+TODAY = datetime.utcnow().strftime("%Y-%m-%dT10:00")
+
+def seed(date, title="Fuel", collection=None, **fields):
+    expense = {"_id": ObjectId(), "title": title, "date": date, "amount": 10.0, "userEmail": ALICE,
+               "updatedAt": datetime.utcnow(), **fields}
+    (collection or expenses_collection).insert_one(expense)
+    return expense["_id"]
+
+@pytest.fixture(autouse=True)
+def no_archive_years_cache():
+    archive.archive_years(refresh=True)
+
+def titles(response):
+    assert response.status_code == 200, response.text
+    return sorted(exp["title"] for exp in response.json())
+
+# ---------------- ARCHIVAL ----------------
+def test_old_expenses_move_to_their_year(client):
+    old_2020 = seed("2020-03-01T10:00", "2020")
+    old_2021 = seed("2021-11-30T10:00", "2021")
+    hot = seed(TODAY, "hot")
+
+    result = archive_old_expenses()
+
+    assert result["archived"] == 2
+    assert result["years"] == [2020, 2021]
+    assert [doc["_id"] for doc in expenses_collection.find()] == [hot]
+    assert archive_collection(2020).find_one({"_id": old_2020})["title"] == "2020"
+    assert archive_collection(2021).find_one({"_id": old_2021})["title"] == "2021"
+    # Re-running finds nothing left to move
+    assert archive_old_expenses()["archived"] == 0
+
+# ---------------- READS ACROSS TIERS ----------------
+def test_reads_without_a_range_cover_every_tier(client):
+    seed("2020-03-01T10:00", "2020")
+    seed("2021-11-30T10:00", "2021")
+    seed(TODAY, "hot")
+    archive_old_expenses()
+
+    assert titles(client.get("/expense/all")) == ["2020", "2021", "hot"]
+    assert titles(client.get(f"/expense/user/{ALICE}")) == ["2020", "2021", "hot"]
+
+def test_a_date_range_only_reads_the_years_it_reaches(client):
+    seed("2020-03-01T10:00", "2020")
+    seed("2021-11-30T10:00", "2021")
+    archive_old_expenses()
+
+    assert [tier.name for tier in read_tiers("2021-01-01", "2021-12-31")][1:] == ["ExpensesArchive_2021"]
+    assert titles(client.get("/expense/all", params={"dateFrom": "2021-01-01"})) == ["2021"]
+    assert titles(client.get("/expense/all", params={"dateTo": "2020-12-31"})) == ["2020"]
+
+def test_an_expense_caught_mid_move_is_read_once_from_the_hot_tier():
+    expense_id = seed("2020-03-01T10:00", "hot copy")
+    archive_collection(2020).insert_one({"_id": expense_id, "title": "archived copy", "date": "2020-03-01T10:00",
+                                         "userEmail": ALICE})
+    archive.archive_years(refresh=True)
+
+    found = list(find_across_tiers({"userEmail": ALICE}))
+
+    assert [doc["title"] for doc in found] == ["hot copy"]
+
+def test_expense_edited_during_the_move_stays_hot(monkeypatch):
+    expense_id = seed("2020-03-01T10:00", "before")
+    real_collection = archive.archive_collection
+
+    def edit_while_copying(year, for_reads=False):
+        # The edit lands after the copy was read but before the hot copy is deleted
+        expenses_collection.update_one({"_id": expense_id}, {"$set": {"title": "after", "updatedAt": datetime(2030, 1, 1)}})
+        return real_collection(year, for_reads)
+    monkeypatch.setattr(archive, "archive_collection", edit_while_copying)
+
+    result = archive_old_expenses()
+
+    assert result["archived"] == 0
+    assert expenses_collection.find_one({"_id": expense_id})["title"] == "after"
+    assert real_collection(2020).find_one({"_id": expense_id}) is None
+
+def test_archived_expenses_are_read_only(client, drive):
+    expense_id = seed("2020-03-01T10:00")
+    archive_old_expenses()
+
+    response = client.put(f"/expense/update/{expense_id}", data={"title": "Edited"})
+
+    assert response.status_code == 409
+    assert archive_collection(2020).find_one({"_id": expense_id})["title"] == "Fuel"
@@ -0,0 +1,50 @@
+import io
+
+import pytest
+from PIL import Image
+
+from attachment_processing import process_attachment
+
+def image_bytes(format, frames=1, size=(1200, 900), **save):
+    pages = [Image.new("RGB", size, (40 * i, 120, 200)) for i in range(frames)]
+    out = io.BytesIO()
+    pages[0].save(out, format, save_all=frames > 1, append_images=pages[1:], **save)
+    return out.getvalue()
+
+def test_multi_page_tiff_is_stored_unchanged():
+    content = image_bytes("TIFF", frames=3)
+
+    result = process_attachment(content, "image/tiff", "scan.tiff")
+
+    assert result["action"] == "unchanged"
+    assert result["content"] == content
+    assert result["filename"] == "scan.tiff"
+    with Image.open(io.BytesIO(result["content"])) as image:
+        assert image.n_frames == 3
+
+def test_single_page_image_is_compacted_to_jpeg_without_exif():
+    exif = Image.Exif()
+    exif[0x010F] = "PhoneMaker"  # Make
+    content = image_bytes("TIFF", exif=exif)
+
+    result = process_attachment(content, "image/tiff", "photo.tiff")
+
+    assert result["action"] == "compacted"
+    assert result["filename"] == "photo.jpg"
+    assert result["contentType"] == "image/jpeg"
+    with Image.open(io.BytesIO(result["content"])) as image:
+        assert dict(image.getexif()) == {}
+
+def test_pdf_metadata_is_removed():
+    pikepdf = pytest.importorskip("pikepdf")
+    pdf = pikepdf.new()
+    pdf.add_blank_page()
+    with pdf.open_metadata() as meta:
+        meta["dc:creator"] = ["Jane Employee"]
+    pdf.docinfo["/Author"] = "Jane Employee"
+    out = io.BytesIO()
+    pdf.save(out)
+
+    result = process_attachment(out.getvalue(), "application/pdf", "bill.pdf")
+
+    assert b"Jane Employee" not in result["content"]
@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from db import expenses_collection, expense_tombstones_collection, TOMBSTONE_RETENTION
+from sync_utils import SETTLE, encode_token
+
+ALICE = "alice@rataagroup.com"
+
+def seed_expense(updated_ago=timedelta(minutes=1), email=ALICE, **fields):
+    expense = {"_id": ObjectId(), "title": "Fuel", "userEmail": email, "amount": 10.0,
+               "updatedAt": datetime.utcnow() - updated_ago, **fields}
+    expenses_collection.insert_one(expense)
+    return str(expense["_id"])
+
+def seed_tombstone(deleted_ago=timedelta(minutes=1), email=ALICE):
+    expense_id = ObjectId()
+    expense_tombstones_collection.insert_one({"expenseId": expense_id, "userEmail": email,
+                                              "deletedAt": datetime.utcnow() - deleted_ago})
+    return str(expense_id)
+
+def changes(client, since=None, **params):
+    response = client.get("/expense/changes", params={**params, **({"since": since} if since else {})})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def changed_ids(page):
+    return [exp["_id"] for exp in page["changed"]]
+
+# ---------------- CURSORS ----------------
+def test_full_sync_pages_through_everything_once(client):
+    ids = [seed_expense(updated_ago=timedelta(minutes=10 - i)) for i in range(5)]
+
+    seen, token = [], None
+    while True:
+        page = changes(client, token, limit=2)
+        seen += changed_ids(page)
+        token = page["nextToken"]
+        if not page["hasMore"]:
+            break
+
+    assert seen == ids
+    assert changed_ids(changes(client, token)) == []
+
+def test_same_timestamp_is_split_across_pages_by_id(client):
+    at = datetime.utcnow() - timedelta(minutes=1)
+    ids = sorted(seed_expense(updatedAt=at) for _ in range(3))
+
+    first = changes(client, limit=2)
+    second = changes(client, first["nextToken"], limit=2)
+
+    assert changed_ids(first) + changed_ids(second) == ids
+
+def test_only_later_changes_and_deletes_follow_a_token(client):
+    seed_expense()
+    token = changes(client)["nextToken"]
+
+    edited = seed_expense(updated_ago=timedelta(0))
+    deleted = seed_tombstone(deleted_ago=timedelta(0))
+    page = changes(client, token)
+
+    assert changed_ids(page) == [edited]
+    assert [d["expenseId"] for d in page["deleted"]] == [deleted]
+
+def test_recent_writes_are_sent_again_until_they_settle(client):
+    seed_expense(updated_ago=SETTLE * 2)
+    recent = seed_expense(updated_ago=timedelta(0))
+
+    first = changes(client)
+    second = changes(client, first["nextToken"])
+
+    # A write committing just before now could be missed, so the cursor stops short
+    assert recent in changed_ids(first)
+    assert changed_ids(second) == [recent]
+
+def test_changes_filter_by_user(client):
+    mine = seed_expense(email=ALICE)
+    seed_expense(email="bob@rataagroup.com")
+    seed_tombstone(email="bob@rataagroup.com")
+
+    page = changes(client, userEmail=ALICE)
+
+    assert changed_ids(page) == [mine]
+
+def test_delete_route_leaves_a_tombstone(client, drive):
+    expense_id = seed_expense()
+    token = changes(client)["nextToken"]
+
+    client.request("DELETE", "/expense/delete", json={"expenseIds": [expense_id]})
+
+    assert [d["expenseId"] for d in changes(client, token)["deleted"]] == [expense_id]
+
+# ---------------- INVALID / EXPIRED TOKENS ----------------
+def test_token_older_than_the_tombstone_retention_is_gone(client):
+    old = datetime.utcnow() - TOMBSTONE_RETENTION - timedelta(hours=1)
+
+    response = client.get("/expense/changes", params={"since": encode_token((old, None), (old, None))})
+
+    assert response.status_code == 410
+
+def test_garbage_token_is_rejected(client):
+    assert client.get("/expense/changes", params={"since": "not-a-token"}).status_code == 400
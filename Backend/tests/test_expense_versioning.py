@@ -0,0 +1,168 @@
+import json
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from db import expenses_collection, upload_sessions_collection
+
+def seed_expense(drive, attachment_names=("a.jpg", "b.jpg"), version=1):
+    """ An expense whose attachments exist on the fake Drive; version=None is a legacy document """
+    attachments = []
+    for name in attachment_names:
+        file_id = str(ObjectId())
+        drive.files[file_id] = name.encode()
+        attachments.append({"id": file_id, "filename": name, "size": len(name)})
+    expense = {
+        "title": "Fuel",
+        "date": "2025-06-15T10:00",
+        "amount": 100.0,
+        "userEmail": "user@rataagroup.com",
+        "billAvailable": True,
+        "attachments": attachments,
+        "createdAt": datetime.now(),
+    }
+    if version is not None:
+        expense["version"] = version
+    return expenses_collection.insert_one(expense).inserted_id
+
+def update(client, expense_id, kept, version=None, new_files=(), **fields):
+    data = {"keptAttachments": json.dumps(kept), **fields}
+    if version is not None:
+        data["version"] = str(version)
+    files = [("newAttachments", (name, name.encode(), "image/jpeg")) for name in new_files]
+    return client.put(f"/expense/update/{expense_id}", data=data, files=files or None)
+
+def attachment_ids(expense_id):
+    attachments = expenses_collection.find_one({"_id": expense_id})["attachments"]
+    return [att["id"] if isinstance(att, dict) else att for att in attachments]
+
+# ---------------- VERSION CHECK ----------------
+def test_stale_version_is_rejected_before_any_upload(client, drive):
+    expense_id = seed_expense(drive, version=3)
+    before = expenses_collection.find_one({"_id": expense_id})
+
+    response = update(client, expense_id, attachment_ids(expense_id), version=2, new_files=["c.jpg"], title="New")
+
+    assert response.status_code == 409
+    assert expenses_collection.find_one({"_id": expense_id}) == before
+    assert len(drive.files) == 2
+    assert drive.deleted == []
+
+def test_current_version_is_applied_and_bumped(client, drive):
+    expense_id = seed_expense(drive, version=3)
+
+    response = update(client, expense_id, attachment_ids(expense_id), version=3, title="New")
+
+    assert response.status_code == 200
+    assert response.json()["version"] == 4
+    assert expenses_collection.find_one({"_id": expense_id})["title"] == "New"
+
+def test_lost_race_returns_409_and_drops_new_uploads(client, drive):
+    expense_id = seed_expense(drive, version=1)
+    kept = attachment_ids(expense_id)[:1]
+    # Someone else saves while our files are uploading
+    drive.on_upload = lambda: expenses_collection.update_one({"_id": expense_id}, {"$inc": {"version": 1}})
+
+    response = update(client, expense_id, kept, version=1, new_files=["c.jpg"])
+
+    assert response.status_code == 409
+    doc = expenses_collection.find_one({"_id": expense_id})
+    assert doc["version"] == 2
+    assert len(doc["attachments"]) == 2
+    # The upload is deleted in the background; the removed attachment stays on Drive
+    deadline = time.time() + 5
+    while len(drive.files) > 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert sorted(drive.files) == sorted(att["id"] for att in doc["attachments"])
+
+# ---------------- ATTACHMENT EDITS ----------------
+def test_remove_and_add_attachments_in_one_request(client, drive):
+    expense_id = seed_expense(drive, ["a.jpg", "b.jpg", "c.jpg"], version=1)
+    a, b, c = attachment_ids(expense_id)
+
+    response = update(client, expense_id, [a, c], version=1, new_files=["d.jpg", "e.jpg"])
+
+    assert response.status_code == 200
+    doc = expenses_collection.find_one({"_id": expense_id})
+    assert [att["filename"] for att in doc["attachments"]] == ["a.jpg", "c.jpg", "d.jpg", "e.jpg"]
+    assert doc["version"] == 2
+    assert drive.deleted == [b]
+    assert b not in drive.files and len(drive.files) == 4
+
+def test_kept_attachments_accept_objects_and_legacy_ids(client, drive):
+    expense_id = seed_expense(drive, ["a.jpg"], version=1)
+    expenses_collection.update_one({"_id": expense_id}, {"$push": {"attachments": "legacy-id"}})
+    a = attachment_ids(expense_id)[0]
+
+    response = update(client, expense_id, [{"id": a}], version=1, new_files=["b.jpg"])
+
+    assert response.status_code == 200
+    assert attachment_ids(expense_id)[0] == a
+    assert "legacy-id" not in attachment_ids(expense_id)
+    assert drive.deleted == ["legacy-id"]
+
+# ---------------- LEGACY DOCUMENTS ----------------
+@pytest.mark.parametrize("keep, new_files", [
+    ("all", []),                     # $set only
+    ("all", ["c.jpg"]),              # $push
+    ("first", []),                   # $pull
+    ("first", ["c.jpg"]),            # pipeline update
+])
+def test_document_without_version_starts_at_one(client, drive, keep, new_files):
+    expense_id = seed_expense(drive, version=None)
+    ids = attachment_ids(expense_id)
+    kept = ids if keep == "all" else ids[:1]
+
+    response = update(client, expense_id, kept, new_files=new_files, title="Edited")
+
+    assert response.status_code == 200
+    doc = expenses_collection.find_one({"_id": expense_id})
+    assert doc["version"] == 1
+    assert doc["title"] == "Edited"
+    assert len(doc["attachments"]) == len(kept) + len(new_files)
+
+def test_document_without_version_rejects_a_versioned_client(client, drive):
+    expense_id = seed_expense(drive, version=None)
+
+    response = update(client, expense_id, attachment_ids(expense_id), version=1, title="Edited")
+
+    assert response.status_code == 409
+    assert "version" not in expenses_collection.find_one({"_id": expense_id})
+
+# ---------------- RESUMABLE UPLOAD ATTACH ----------------
+def seed_finished_upload():
+    now = datetime.utcnow()
+    return upload_sessions_collection.insert_one({
+        "_id": "upload-1",
+        "filename": "scan.pdf",
+        "mimeType": "application/pdf",
+        "length": 3,
+        "file": {"id": "drive-file", "name": "scan.pdf", "md5Checksum": "x"},
+        "attachedTo": None,
+        "lockedUntil": None,
+        "createdAt": now,
+        "expiresAt": now + timedelta(hours=1),
+    }).inserted_id
+
+def test_attach_with_stale_version_leaves_the_upload_unclaimed(client, drive):
+    expense_id = seed_expense(drive, version=2)
+    upload_id = seed_finished_upload()
+
+    response = client.post(f"/uploads/{upload_id}/attach", json={"expenseId": str(expense_id), "version": 1})
+
+    assert response.status_code == 409
+    assert upload_sessions_collection.find_one({"_id": upload_id})["attachedTo"] is None
+    assert len(attachment_ids(expense_id)) == 2
+
+def test_attach_bumps_the_version(client, drive):
+    expense_id = seed_expense(drive, version=None)
+    upload_id = seed_finished_upload()
+
+    response = client.post(f"/uploads/{upload_id}/attach", json={"expenseId": str(expense_id)})
+
+    assert response.status_code == 200
+    assert response.json()["version"] == 1
+    assert attachment_ids(expense_id)[-1] == "drive-file"
+    assert upload_sessions_collection.find_one({"_id": upload_id})["attachedTo"] == expense_id
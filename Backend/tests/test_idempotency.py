@@ -0,0 +1,100 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+import idempotency
+from db import expenses_collection, expense_type_collection, idempotency_keys_collection
+from idempotency import run_idempotent
+
+def expense_form(**changes):
+    type_id = str(expense_type_collection.insert_one({"ExpenseTypeName": "Fuel"}).inserted_id)
+    return {"expenseTypeId": type_id, "title": "Fuel", "date": "2025-06-15T10:00", "amount": "30",
+            "paymentMode": "Cash", "billAvailable": "true", "userEmail": "user@rataagroup.com", **changes}
+
+def create(client, form, key, files=()):
+    return client.post("/expense/create", data=form, headers={"Idempotency-Key": key},
+                       files=[("attachments", (name, name.encode(), "image/jpeg")) for name in files] or None)
+
+# ---------------- REPLAY ----------------
+def test_retry_replays_the_first_result(client, drive):
+    form = expense_form()
+
+    first = create(client, form, "key-1", files=["bill.jpg"])
+    retry = create(client, form, "key-1", files=["bill.jpg"])
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert expenses_collection.count_documents({}) == 1
+    assert len(drive.files) == 1
+
+def test_a_new_key_creates_again(client, drive):
+    form = expense_form()
+
+    create(client, form, "key-1")
+    create(client, form, "key-2")
+
+    assert expenses_collection.count_documents({}) == 2
+
+def test_key_reused_for_a_different_request_is_rejected(client, drive):
+    form = expense_form()
+    create(client, form, "key-1")
+
+    response = create(client, {**form, "amount": "31"}, "key-1")
+
+    assert response.status_code == 422
+    assert expenses_collection.count_documents({}) == 1
+
+def test_client_errors_are_replayed(client, drive):
+    form = expense_form(expenseTypeId="not-an-id")
+
+    first = create(client, form, "key-1")
+    retry = create(client, form, "key-1")
+
+    assert first.status_code == retry.status_code == 400
+    assert retry.json() == first.json()
+    assert idempotency_keys_collection.find_one({"_id": "expense.create:key-1"})["response"]["status_code"] == 400
+
+# ---------------- FAILURES AND CONCURRENT RETRIES ----------------
+def test_server_errors_free_the_key():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        if len(calls) == 1:
+            raise HTTPException(status_code=502, detail="Drive is down")
+        return {"ok": True}
+
+    with pytest.raises(HTTPException):
+        asyncio.run(run_idempotent("test", "key-1", "fp", work))
+    assert asyncio.run(run_idempotent("test", "key-1", "fp", work)) == {"ok": True}
+    assert len(calls) == 2
+
+def test_retry_during_the_first_request_waits_for_its_result(monkeypatch):
+    monkeypatch.setattr(idempotency, "POLL_SECONDS", 0.01)
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"n": len(calls)}
+
+    async def both():
+        return await asyncio.gather(run_idempotent("test", "key-1", "fp", work),
+                                    run_idempotent("test", "key-1", "fp", work))
+
+    assert asyncio.run(both()) == [{"n": 1}, {"n": 1}]
+    assert len(calls) == 1
+
+def test_abandoned_claim_is_taken_over():
+    now = datetime.utcnow()
+    idempotency_keys_collection.insert_one({"_id": "test:key-1", "fingerprint": "fp", "status": "in_progress",
+                                            "leaseUntil": now - timedelta(seconds=1), "createdAt": now,
+                                            "expiresAt": now + timedelta(hours=1)})
+
+    async def work():
+        return {"ok": True}
+
+    assert asyncio.run(run_idempotent("test", "key-1", "fp", work)) == {"ok": True}
+    assert idempotency_keys_collection.find_one({"_id": "test:key-1"})["status"] == "done"
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from mail_utils import MailerooSession, email_address, sender_address
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.text = body if isinstance(body, str) else json.dumps(body)
+
+    def json(self):
+        return json.loads(self.text)
+
+@pytest.fixture
+def sent(monkeypatch):
+    """ Requests posted by the client; the next response is set with sent.reply """
+    class Sent(list):
+        reply = FakeResponse(200, {"success": True, "data": {"reference_id": "ab" * 12}})
+    posts = Sent()
+
+    def post(self, url, json=None, timeout=None):
+        posts.append({"url": url, "json": json, "headers": dict(self.headers)})
+        return posts.reply
+    import requests
+    monkeypatch.setattr(requests.Session, "post", post)
+    return posts
+
+def message(**changes):
+    return {"from": sender_address(), "to": [email_address("user@rataagroup.com")], "subject": "OTP",
+            "plain": "1234", "reference_id": "ab" * 12, **changes}
+
+def test_sends_the_message_over_the_pooled_session(sent):
+    client = MailerooSession("key")
+
+    assert client.send_basic_email(message()) == "ab" * 12
+    assert client.send_basic_email(message()) == "ab" * 12
+
+    assert len(sent) == 2
+    assert sent[0]["url"].endswith("/api/v2/emails")
+    assert sent[0]["headers"]["Authorization"] == "Bearer key"
+    assert sent[0]["json"]["to"] == [{"address": "user@rataagroup.com"}]
+    assert sent[0]["json"]["from"]["display_name"] == "Rataa Group"
+    assert sent[0]["json"]["reference_id"] == "ab" * 12
+
+@pytest.mark.parametrize("changes", [{"subject": ""}, {"plain": None}, {"to": []}])
+def test_invalid_messages_raise_value_error(sent, changes):
+    with pytest.raises(ValueError):
+        MailerooSession("key").send_basic_email(message(**changes))
+    assert sent == []
+
+@pytest.mark.parametrize("reply", [
+    FakeResponse(400, {"success": False, "message": "Invalid sender"}),
+    FakeResponse(502, "<html>Bad gateway</html>"),
+])
+def test_api_failures_raise_runtime_error(sent, reply):
+    sent.reply = reply
+
+    with pytest.raises(RuntimeError):
+        MailerooSession("key").send_basic_email(message())
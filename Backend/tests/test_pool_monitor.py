@@ -0,0 +1,18 @@
+import pytest
+from pymongo import monitoring
+
+from pool_monitor import PoolMonitor
+
+ADDRESS = ("localhost", 27017)
+
+@pytest.mark.parametrize("options, expected", [
+    ({}, 100),                        # the driver default is left out of the event
+    ({"maxPoolSize": 50}, 50),
+    ({"maxPoolSize": None}, None),    # unbounded
+])
+def test_max_pool_size_falls_back_to_the_driver_default(options, expected):
+    monitor = PoolMonitor()
+
+    monitor.pool_created(monitoring.PoolCreatedEvent(ADDRESS, options))
+
+    assert monitor.snapshot()["servers"]["localhost:27017"]["maxPoolSize"] == expected
@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import profiler
+
+def offloaded_work():
+    deadline = time.perf_counter() + 0.2
+    while time.perf_counter() < deadline:
+        pass
+
+def unrelated_work(stop):
+    while not stop.is_set():
+        time.sleep(0.001)
+
+@pytest.fixture
+def profiled_app(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiler, "PROFILE_ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(profiler, "PROFILE_DIR", str(tmp_path))
+    app = FastAPI()
+
+    @app.get("/offload")
+    async def offload():
+        await asyncio.to_thread(offloaded_work)
+        return {}
+
+    app.add_middleware(profiler.ProfilingMiddleware)
+    return TestClient(app)
+
+def folded(tmp_path, response):
+    return (tmp_path / f"{response.headers['x-profile-id']}.folded").read_text()
+
+def test_work_offloaded_to_a_thread_is_sampled(profiled_app, tmp_path):
+    response = profiled_app.get("/offload", headers={"X-Profile": "secret"})
+
+    assert response.status_code == 200
+    stacks = folded(tmp_path, response)
+    assert "offloaded_work (test_profiler.py" in stacks
+
+def test_other_threads_in_the_pool_are_not_sampled(profiled_app, tmp_path):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pool.submit(unrelated_work, stop)
+        response = profiled_app.get("/offload", headers={"X-Profile": "secret"})
+        stop.set()
+
+    assert "unrelated_work" not in folded(tmp_path, response)
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from gridfs.errors import NoFile
+
+import routes.reports as reports
+from db import report_jobs_collection
+from report_utils import data_version, report_cache_key
+
+MONTH = "2025-06"
+
+class FakeArtifacts:
+    """ Stands in for the ReportArtifacts GridFS bucket """
+    def __init__(self):
+        self.deleted = []
+
+    def delete(self, file_id):
+        if file_id == "missing":
+            raise NoFile(file_id)
+        self.deleted.append(file_id)
+
+@pytest.fixture
+def artifacts(monkeypatch):
+    fake = FakeArtifacts()
+    monkeypatch.setattr(reports, "_report_files", lambda: fake)
+    return fake
+
+@pytest.fixture
+def enqueued(monkeypatch):
+    jobs = []
+    monkeypatch.setattr(reports, "_enqueue", jobs.append)
+    return jobs
+
+def seed_job(status, cache_key=None, group_by="employee", **fields):
+    job = {"cacheKey": cache_key or report_cache_key(MONTH, group_by, data_version(MONTH)),
+           "month": MONTH, "groupBy": group_by, "status": status, "requestedAt": datetime.now(), **fields}
+    return report_jobs_collection.insert_one(job).inserted_id
+
+# ---------------- RETRIES ----------------
+@pytest.mark.parametrize("status, since_field", [("queued", "requestedAt"), ("running", "startedAt")])
+def test_abandoned_job_is_queued_again_once(client, enqueued, status, since_field):
+    job_id = seed_job(status, **{since_field: datetime.now() - reports.STALE_JOB_AFTER - timedelta(minutes=1)})
+
+    first = client.get("/reports/monthly", params={"month": MONTH})
+    second = client.get("/reports/monthly", params={"month": MONTH})
+
+    assert first.status_code == second.status_code == 202
+    assert enqueued == [job_id]
+    assert report_jobs_collection.find_one({"_id": job_id})["status"] == "queued"
+
+def test_recent_queued_job_is_left_alone(client, enqueued):
+    seed_job("queued")
+
+    response = client.get("/reports/monthly", params={"month": MONTH})
+
+    assert response.status_code == 202
+    assert enqueued == []
+
+def test_retry_lost_to_another_request_does_not_enqueue(client, enqueued, monkeypatch):
+    job_id = seed_job("failed", error="boom")
+    real_find_one = report_jobs_collection.find_one
+
+    def find_one(*args, **kwargs):
+        job = real_find_one(*args, **kwargs)
+        # Another worker retries the job between our read and our update
+        report_jobs_collection.update_one({"_id": job_id}, {"$set": {"status": "queued"}})
+        return job
+    monkeypatch.setattr(reports.report_jobs_collection, "find_one", find_one)
+
+    client.get("/reports/monthly", params={"month": MONTH})
+
+    assert enqueued == []
+
+# ---------------- SUPERSEDED REPORTS ----------------
+def test_finished_report_drops_older_ones_for_the_same_month(artifacts):
+    old = seed_job("done", cache_key="old", artifacts={"xlsx": {"fileId": "old-xlsx"}, "pdf": {"fileId": "missing"}})
+    failed = seed_job("failed", cache_key="older-failed")
+    other_grouping = seed_job("done", cache_key="other", group_by="expenseType",
+                              artifacts={"xlsx": {"fileId": "other-xlsx"}})
+    current = seed_job("done", cache_key="current")
+    newer = seed_job("queued", cache_key="newer")
+
+    reports._drop_superseded(report_jobs_collection.find_one({"_id": current}))
+
+    remaining = {job["_id"] for job in report_jobs_collection.find()}
+    assert remaining == {other_grouping, current, newer}
+    assert old not in remaining and failed not in remaining
+    assert artifacts.deleted == ["old-xlsx"]
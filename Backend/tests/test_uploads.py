@@ -0,0 +1,226 @@
+import base64
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+import resumable_uploads
+from db import expenses_collection, upload_sessions_collection, get_db
+from resumable_uploads import DRIVE_ALIGNMENT, DriveUploadError, expire_upload_sessions
+
+KIB = 1024
+
+class FakeResumableDrive:
+    """ Drive resumable sessions: keeps what was PUT, can acknowledge less or fail """
+    def __init__(self):
+        self.uploads = {}
+        self.cancelled = []
+        self.max_ack = None     # acknowledge at most this many bytes of the next PUT
+        self.fail_next = False
+
+    def start_drive_session(self, filename, mime_type, length):
+        url = f"https://drive/session-{len(self.uploads)}"
+        self.uploads[url] = bytearray()
+        return url
+
+    def send_to_drive(self, url, start, data, total):
+        stored = self.uploads[url]
+        assert start == len(stored), "Drive only accepts the bytes after what it has"
+        if self.fail_next:
+            self.fail_next = False
+            raise DriveUploadError("Drive is down")
+        if self.max_ack is not None:
+            data, self.max_ack = data[:self.max_ack], None
+        stored.extend(data)
+        if len(stored) == total:
+            return total, {"id": "drive-" + url.rsplit("-", 1)[1], "name": "scan.pdf", "md5Checksum": "x"}
+        return len(stored), None
+
+@pytest.fixture
+def resumable_drive(monkeypatch):
+    fake = FakeResumableDrive()
+    monkeypatch.setattr(resumable_uploads, "start_drive_session", fake.start_drive_session)
+    monkeypatch.setattr(resumable_uploads, "send_to_drive", fake.send_to_drive)
+    monkeypatch.setattr(resumable_uploads, "cancel_drive_session", fake.cancelled.append)
+    return fake
+
+@pytest.fixture
+def drive_cleanup(monkeypatch):
+    """ Drive files / resumable sessions the cleanup removed """
+    removed = []
+    monkeypatch.setattr(resumable_uploads, "delete_file_from_drive", removed.append)
+    monkeypatch.setattr(resumable_uploads, "cancel_drive_session", removed.append)
+    return removed
+
+def seed_session(upload_id="upload-1", file_id="drive-file", attached_to=None, expired=False, **fields):
+    now = datetime.utcnow()
+    upload_sessions_collection.insert_one({
+        "_id": upload_id,
+        "filename": "scan.pdf",
+        "mimeType": "application/pdf",
+        "length": 3,
+        "driveUrl": f"https://drive/{upload_id}",
+        "file": {"id": file_id, "name": "scan.pdf"} if file_id else None,
+        "attachedTo": attached_to,
+        "lockedUntil": None,
+        "createdAt": now,
+        "expiresAt": now + (timedelta(minutes=-1) if expired else timedelta(hours=1)),
+        **fields,
+    })
+    return upload_id
+
+def seed_expense(attachments=(), collection=None):
+    expense = {"_id": ObjectId(), "title": "Fuel", "date": "2025-06-15T10:00", "amount": 10.0,
+               "userEmail": "user@rataagroup.com", "attachments": list(attachments)}
+    (collection or expenses_collection).insert_one(expense)
+    return expense["_id"]
+
+# ---------------- CLEANUP ----------------
+def test_expired_unattached_sessions_drop_their_drive_file_or_session(drive_cleanup):
+    seed_session("finished", file_id="finished-file", expired=True)
+    seed_session("partial", file_id=None, expired=True)
+    seed_session("live", file_id="live-file")
+
+    assert expire_upload_sessions() == {"removed": 2}
+
+    assert sorted(drive_cleanup) == ["finished-file", "https://drive/partial"]
+    assert upload_sessions_collection.find_one({"_id": "live"}) is not None
+
+def test_attached_files_the_expense_holds_are_kept(drive_cleanup):
+    import archive
+
+    hot = seed_expense([{"id": "hot-file"}])
+    legacy = seed_expense(["legacy-file"])
+    archived = seed_expense([{"id": "archived-file"}], collection=get_db()["ExpensesArchive_2023"])
+    archive.archive_years(refresh=True)
+    seed_session("hot", file_id="hot-file", attached_to=hot, expired=True)
+    seed_session("legacy", file_id="legacy-file", attached_to=legacy, expired=True)
+    seed_session("archived", file_id="archived-file", attached_to=archived, expired=True)
+
+    assert expire_upload_sessions() == {"removed": 3}
+
+    assert drive_cleanup == []
+
+def test_claimed_file_that_never_reached_the_expense_is_deleted(drive_cleanup):
+    # The attach request claimed the session and crashed before adding the file
+    expense_id = seed_expense([{"id": "other-file"}])
+    seed_session(file_id="orphan-file", attached_to=expense_id, expired=True)
+
+    expire_upload_sessions()
+
+    assert drive_cleanup == ["orphan-file"]
+
+def test_attach_claim_outlives_the_session_expiry(client):
+    expense_id = seed_expense()
+    seed_session(expiresAt=datetime.utcnow() + timedelta(seconds=1))
+
+    response = client.post("/uploads/upload-1/attach", json={"expenseId": str(expense_id)})
+
+    assert response.status_code == 200
+    session = upload_sessions_collection.find_one({"_id": "upload-1"})
+    assert session["expiresAt"] >= datetime.utcnow() + resumable_uploads.LEASE - timedelta(seconds=5)
+
+# ---------------- TUS OFFSET / RESUME ----------------
+def content_of(size):
+    return bytes(i % 251 for i in range(size))
+
+def start_upload(client, length):
+    metadata = f"filename {base64.b64encode(b'scan.pdf').decode()},filetype {base64.b64encode(b'application/pdf').decode()}"
+    response = client.post("/uploads", headers={"Upload-Length": str(length), "Upload-Metadata": metadata})
+    assert response.status_code == 201
+    assert response.headers["Upload-Offset"] == "0"
+    return response.json()["uploadId"]
+
+def patch(client, upload_id, offset, body):
+    return client.patch(f"/uploads/{upload_id}", content=body, headers={
+        "Upload-Offset": str(offset), "Content-Type": "application/offset+octet-stream"
+    })
+
+def offset(client, upload_id):
+    response = client.head(f"/uploads/{upload_id}")
+    assert response.status_code == 200
+    return int(response.headers["Upload-Offset"])
+
+def test_upload_resumes_from_the_reported_offset(client, resumable_drive):
+    content = content_of(600 * KIB)
+    upload_id = start_upload(client, len(content))
+
+    first = patch(client, upload_id, 0, content[:300 * KIB])
+
+    assert first.status_code == 204
+    assert first.headers["Upload-Offset"] == str(300 * KIB)
+    assert "Upload-Complete" not in first.headers
+    # Drive only takes whole 256 KiB units; the rest waits in the session
+    assert len(resumable_drive.uploads["https://drive/session-0"]) == DRIVE_ALIGNMENT
+    assert offset(client, upload_id) == 300 * KIB
+
+    last = patch(client, upload_id, 300 * KIB, content[300 * KIB:])
+
+    assert last.headers["Upload-Complete"] == "1"
+    assert bytes(resumable_drive.uploads["https://drive/session-0"]) == content
+    assert upload_sessions_collection.find_one({"_id": upload_id})["file"]["id"] == "drive-0"
+
+def test_patch_at_the_wrong_offset_is_refused_with_the_right_one(client, resumable_drive):
+    content = content_of(300 * KIB)
+    upload_id = start_upload(client, len(content))
+    patch(client, upload_id, 0, content[:100 * KIB])
+
+    response = patch(client, upload_id, 0, content)
+
+    assert response.status_code == 409
+    assert response.headers["Upload-Offset"] == str(100 * KIB)
+    assert offset(client, upload_id) == 100 * KIB
+
+def test_bytes_drive_did_not_acknowledge_are_sent_again(client, resumable_drive):
+    content = content_of(600 * KIB)
+    upload_id = start_upload(client, len(content))
+    resumable_drive.max_ack = 100 * KIB
+
+    response = patch(client, upload_id, 0, content[:2 * DRIVE_ALIGNMENT])
+
+    # Drive kept 100 KiB; one alignment unit more is held, the rest must be resent
+    resume_at = 100 * KIB + DRIVE_ALIGNMENT
+    assert response.headers["Upload-Offset"] == str(resume_at)
+    assert offset(client, upload_id) == resume_at
+
+    done = patch(client, upload_id, resume_at, content[resume_at:])
+
+    assert done.headers["Upload-Complete"] == "1"
+    assert bytes(resumable_drive.uploads["https://drive/session-0"]) == content
+
+def test_drive_failure_keeps_what_arrived_up_to_one_unit(client, resumable_drive):
+    content = content_of(600 * KIB)
+    upload_id = start_upload(client, len(content))
+    patch(client, upload_id, 0, content[:300 * KIB])
+    resumable_drive.fail_next = True
+
+    failed = patch(client, upload_id, 300 * KIB, content[300 * KIB:])
+
+    assert failed.status_code == 502
+    # What Drive confirmed plus at most one unit held back
+    resume_at = offset(client, upload_id)
+    assert resume_at == 2 * DRIVE_ALIGNMENT
+    assert patch(client, upload_id, resume_at, content[resume_at:]).headers["Upload-Complete"] == "1"
+    assert bytes(resumable_drive.uploads["https://drive/session-0"]) == content
+
+def test_session_being_written_is_locked(client, resumable_drive):
+    upload_id = start_upload(client, 10)
+    upload_sessions_collection.update_one({"_id": upload_id}, {"$set": {
+        "lock": "other", "lockedUntil": datetime.utcnow() + timedelta(minutes=1)
+    }})
+
+    assert patch(client, upload_id, 0, b"0123456789").status_code == 423
+
+def test_body_past_the_upload_length_is_refused(client, resumable_drive):
+    upload_id = start_upload(client, 10)
+
+    assert patch(client, upload_id, 0, b"x" * 11).status_code == 400
+    assert offset(client, upload_id) == 0
+
+def test_cancelled_upload_drops_the_drive_session(client, resumable_drive):
+    upload_id = start_upload(client, 10)
+
+    assert client.delete(f"/uploads/{upload_id}").status_code == 204
+
+    assert resumable_drive.cancelled == ["https://drive/session-0"]
+    assert client.head(f"/uploads/{upload_id}").status_code == 404
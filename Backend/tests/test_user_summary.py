@@ -0,0 +1,237 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+import user_summary
+from db import expenses_collection, user_summaries_collection, get_db
+from user_summary import (
+    apply_summary_change,
+    rebuild_user_summary,
+    get_user_summary,
+    check_user_summaries,
+)
+
+ALICE = "alice@rataagroup.com"
+BOB = "bob@rataagroup.com"
+
+def insert_expense(email=ALICE, date="2025-06-10T10:00", amount=100.0, type_id="fuel", bill=True, **extra):
+    """ Writes the expense and applies it to the summary, like the create route """
+    expense = {
+        "_id": ObjectId(), "userEmail": email, "date": date, "amount": amount,
+        "expenseTypeId": type_id, "billAvailable": bill, "title": extra.pop("title", "Expense"), **extra
+    }
+    expenses_collection.insert_one(expense)
+    apply_summary_change(None, expense)
+    return expense
+
+def edit_expense(expense, **changes):
+    after = {**expense, **changes}
+    expenses_collection.replace_one({"_id": expense["_id"]}, after)
+    apply_summary_change(expense, after)
+    return after
+
+def delete_expense(expense):
+    expenses_collection.delete_one({"_id": expense["_id"]})
+    apply_summary_change(expense, None)
+
+def stored(email=ALICE):
+    return user_summaries_collection.find_one({"_id": email})
+
+def matches_rebuild(email=ALICE):
+    """ The incrementally maintained summary equals one computed from scratch """
+    incremental = stored(email)
+    user_summaries_collection.delete_one({"_id": email})
+    fresh = rebuild_user_summary(email)
+    return user_summary._same(incremental or user_summary._empty_summary(email), fresh)
+
+# ---------------- INCREMENTAL ----------------
+def test_missing_summary_is_not_created_partially_but_rebuilt_on_read():
+    insert_expense(amount=40)
+    expenses_collection.insert_one({"_id": ObjectId(), "userEmail": ALICE, "date": "2025-01-01T09:00",
+                                    "amount": 60.0, "expenseTypeId": "food", "billAvailable": False})
+    insert_expense(amount=5)
+
+    # No upsert from the deltas: a summary holding only the later creates would be wrong
+    assert stored() is None
+
+    summary = get_user_summary(ALICE)
+    assert summary["expenseCount"] == 3
+    assert summary["totalClaimed"] == 105
+    assert summary["pendingBills"] == 1
+    assert stored()["expenseCount"] == 3
+
+def test_deltas_follow_creates_edits_and_deletes():
+    first = insert_expense(amount=100, type_id="fuel")
+    rebuild_user_summary(ALICE)
+
+    second = insert_expense(date="2025-06-20T10:00", amount=50, type_id="food", bill=False, title="Lunch")
+    first = edit_expense(first, amount=120, billAvailable=False)
+    summary = stored()
+    assert summary["expenseCount"] == 2
+    assert summary["totalClaimed"] == 170
+    assert summary["pendingBills"] == 2
+    assert summary["byType"]["fuel"] == {"count": 1, "amount": 120}
+    assert summary["byType"]["food"] == {"count": 1, "amount": 50}
+    assert summary["lastExpense"]["expenseId"] == second["_id"]
+
+    second = edit_expense(second, expenseTypeId="fuel")
+    assert stored()["byType"]["food"]["count"] == 0
+    assert stored()["byType"]["fuel"] == {"count": 2, "amount": 170}
+
+    delete_expense(first)
+    assert stored()["expenseCount"] == 1
+    assert stored()["totalClaimed"] == 50
+    assert matches_rebuild()
+
+def test_latest_expense_moved_earlier_is_looked_up_again():
+    older = insert_expense(date="2025-06-01T10:00", title="Older")
+    rebuild_user_summary(ALICE)
+    latest = insert_expense(date="2025-06-30T10:00", title="Latest")
+    assert stored()["lastExpense"]["expenseId"] == latest["_id"]
+
+    # $max alone would keep the old date
+    edit_expense(latest, date="2025-05-01T10:00")
+    assert stored()["lastExpense"]["expenseId"] == older["_id"]
+    assert matches_rebuild()
+
+def test_renaming_the_latest_expense_updates_it():
+    latest = insert_expense(title="Taxi")
+    rebuild_user_summary(ALICE)
+
+    edit_expense(latest, title="Taxi to site")
+
+    assert stored()["lastExpense"]["title"] == "Taxi to site"
+
+def test_deleting_the_latest_expense_falls_back_to_the_archive():
+    import archive
+
+    archived = {"_id": ObjectId(), "userEmail": ALICE, "date": "2023-03-01T10:00", "amount": 10.0,
+                "expenseTypeId": "fuel", "billAvailable": True, "title": "Archived"}
+    get_db()["ExpensesArchive_2023"].insert_one(archived)
+    archive.archive_years(refresh=True)
+    only = insert_expense(title="Only hot one")
+    rebuild_user_summary(ALICE)
+
+    delete_expense(only)
+
+    assert stored()["lastExpense"]["expenseId"] == archived["_id"]
+
+def test_deleting_the_only_expense_clears_the_latest():
+    only = insert_expense()
+    rebuild_user_summary(ALICE)
+
+    delete_expense(only)
+
+    assert stored()["expenseCount"] == 0
+    assert stored()["lastExpense"] is None
+
+def test_owner_change_moves_the_expense_between_summaries():
+    expense = insert_expense(email=ALICE, amount=80, date="2025-06-20T10:00")
+    rebuild_user_summary(ALICE)
+    insert_expense(email=BOB, amount=20, date="2025-06-01T10:00")
+    rebuild_user_summary(BOB)
+
+    edit_expense(expense, userEmail=BOB)
+
+    assert stored(ALICE)["expenseCount"] == 0
+    assert stored(ALICE)["lastExpense"] is None
+    assert stored(BOB)["expenseCount"] == 2
+    assert stored(BOB)["totalClaimed"] == 100
+    assert stored(BOB)["lastExpense"]["expenseId"] == expense["_id"]
+
+def test_errors_abort_a_transaction_but_not_a_plain_write(monkeypatch):
+    def broken(before, after, session):
+        raise RuntimeError("summary write failed")
+    monkeypatch.setattr(user_summary, "_apply", broken)
+
+    apply_summary_change(None, {"_id": ObjectId(), "userEmail": ALICE})
+    with pytest.raises(RuntimeError):
+        apply_summary_change(None, {"_id": ObjectId(), "userEmail": ALICE}, session=object())
+
+def test_routes_keep_the_summary_in_step(client, drive):
+    from db import expense_type_collection
+
+    type_id = str(expense_type_collection.insert_one({"ExpenseTypeName": "Fuel"}).inserted_id)
+    form = {"expenseTypeId": type_id, "title": "Fuel", "date": "2025-06-15T10:00", "amount": "30",
+            "paymentMode": "Cash", "billAvailable": "false", "userEmail": ALICE}
+    first = client.post("/expense/create", data=form).json()["expense_id"]
+    assert client.get(f"/expense/user/{ALICE}/summary").json()["expenseCount"] == 1
+    second = client.post("/expense/create", data={**form, "amount": "70", "date": "2025-06-16T10:00"}).json()["expense_id"]
+
+    client.put(f"/expense/update/{first}", data={"amount": "50", "billAvailable": "true", "version": "1"})
+    client.request("DELETE", "/expense/delete", json={"expenseIds": [second]})
+
+    summary = client.get(f"/expense/user/{ALICE}/summary").json()
+    assert summary["expenseCount"] == 1
+    assert summary["totalClaimed"] == 50
+    assert summary["pendingBills"] == 0
+    assert summary["lastExpense"]["expenseId"] == first
+
+# ---------------- CONSISTENCY CHECK ----------------
+def test_check_repairs_drift_and_missing_summaries():
+    insert_expense(amount=10)
+    rebuild_user_summary(ALICE)
+    user_summaries_collection.update_one({"_id": ALICE}, {"$inc": {"totalClaimed": 999}})
+    expenses_collection.insert_one({"_id": ObjectId(), "userEmail": BOB, "date": "2025-06-01T10:00",
+                                    "amount": 5.0, "expenseTypeId": "fuel", "billAvailable": True})
+    user_summaries_collection.insert_one({"_id": "gone@rataagroup.com", "expenseCount": 2, "updatedAt": datetime.utcnow()})
+
+    result = check_user_summaries()
+
+    assert sorted(result["users"]) == sorted([ALICE, BOB, "gone@rataagroup.com"])
+    assert result["repaired"] == 3
+    assert stored(ALICE)["totalClaimed"] == 10
+    assert stored(BOB)["expenseCount"] == 1
+    assert stored("gone@rataagroup.com") is None
+    assert check_user_summaries()["drifted"] == 0
+
+def test_check_without_repair_only_reports():
+    insert_expense(amount=10)
+    rebuild_user_summary(ALICE)
+    user_summaries_collection.update_one({"_id": ALICE}, {"$inc": {"expenseCount": 1}})
+
+    result = check_user_summaries(repair=False)
+
+    assert result == {"drifted": 1, "repaired": 0, "users": [ALICE]}
+    assert stored()["expenseCount"] == 2
+
+def scan_with_write_midway(monkeypatch, write):
+    """ Runs `write` after the check has read the first expense """
+    import archive
+
+    real = archive.find_across_tiers
+    pending = [write]
+
+    def scan(*args, **kwargs):
+        for doc in real(*args, **kwargs):
+            yield doc
+            if pending:
+                pending.pop()()
+    monkeypatch.setattr(archive, "find_across_tiers", scan)
+
+def test_check_does_not_overwrite_a_summary_written_during_the_scan(monkeypatch):
+    insert_expense(amount=10)
+    insert_expense(amount=20, date="2025-06-11T10:00")
+    rebuild_user_summary(ALICE)
+    # An expense created after the scan passed its place: the scan's totals miss it
+    scan_with_write_midway(monkeypatch, lambda: insert_expense(amount=500, date="2025-06-12T10:00"))
+
+    check_user_summaries()
+
+    assert stored()["expenseCount"] == 3
+    assert stored()["totalClaimed"] == 530
+
+def test_check_does_not_replace_a_summary_rebuilt_during_the_scan(monkeypatch):
+    insert_expense(amount=10)
+    insert_expense(amount=20, date="2025-06-11T10:00")
+    # First read of the dashboard lands mid-scan and builds the summary, then a new expense follows
+    def first_visit_and_create():
+        rebuild_user_summary(ALICE)
+        insert_expense(amount=500, date="2025-06-12T10:00")
+    scan_with_write_midway(monkeypatch, first_visit_and_create)
+
+    check_user_summaries()
+
+    assert stored()["expenseCount"] == 3
+    assert stored()["totalClaimed"] == 530
@@ -0,0 +1,248 @@
+from collections import defaultdict
+from datetime import datetime
+from pymongo import ReturnDocument, ReplaceOne, DeleteOne, UpdateOne
+
+from db import user_summaries_collection, expenses_collection, expense_type_collection
+
+# Per-user dashboard summary, one UserExpenseSummaries document per email:
+# total claimed, count and amount per expense type, expenses still waiting for
+# a bill and the latest expense. The expense write paths apply the difference
+# between the old and the new version of an expense with $inc / $max, in the
+# same transaction as the expense write where the deployment supports them
+# (db.run_in_transaction). check_user_summaries recomputes every summary from
+# the expenses and repairs drift. Every write increments `revision`, which
+# tells the check whether a summary changed while it was scanning.
+
+AMOUNT_TOLERANCE = 0.005
+
+def _date_key(value) -> str:
+    """ Expense dates are 'YYYY-MM-DDTHH:MM' strings; older ones may be datetimes """
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%dT%H:%M")
+    return str(value or "")
+
+def _last_expense(expense: dict) -> dict:
+    # Field order matters: $max compares embedded documents field by field, date first
+    return {
+        "date": _date_key(expense.get("date")),
+        "expenseId": expense["_id"],
+        "title": expense.get("title"),
+        "amount": float(expense.get("amount") or 0),
+    }
+
+def _contribution(expense: dict) -> dict:
+    """ What one expense adds to its owner's summary, as $inc paths """
+    amount = float(expense.get("amount") or 0)
+    type_id = str(expense.get("expenseTypeId") or "unknown")
+    return {
+        "expenseCount": 1,
+        "totalClaimed": amount,
+        "pendingBills": 0 if expense.get("billAvailable") else 1,
+        f"byType.{type_id}.count": 1,
+        f"byType.{type_id}.amount": amount,
+    }
+
+# ---------------- INCREMENTAL ----------------
+def apply_summary_change(before: dict = None, after: dict = None, session=None):
+    """
+    create: (None, new) / delete: (old, None) / update: (old, new)
+    An owner change moves the expense between two summaries.
+    Inside a transaction a failure aborts the expense write too; without one
+    it is logged and left to check_user_summaries.
+    """
+    try:
+        _apply(before, after, session)
+    except Exception as e:
+        if session is not None:
+            raise
+        print(f"User summary error: {e}")
+
+def _apply(before, after, session):
+    deltas = defaultdict(lambda: defaultdict(int))
+    for expense, sign in ((before, -1), (after, 1)):
+        if expense and expense.get("userEmail"):
+            for path, value in _contribution(expense).items():
+                deltas[expense["userEmail"]][path] += sign * value
+
+    now = datetime.utcnow()
+    for email, inc in deltas.items():
+        inc = {path: value for path, value in inc.items() if value}
+        owns_after = bool(after) and after.get("userEmail") == email
+        owned_before = bool(before) and before.get("userEmail") == email
+        if not inc and owns_after and owned_before and _last_expense(before) == _last_expense(after):
+            continue
+
+        update = {"$set": {"userEmail": email, "updatedAt": now}, "$inc": {"revision": 1}}
+        if inc:
+            update["$inc"].update(inc)
+        if owns_after:
+            update["$max"] = {"lastExpense": _last_expense(after)}
+        # No upsert: a missing summary is built whole from the expenses on first read
+        summary = user_summaries_collection.find_one_and_update(
+            {"_id": email}, update, return_document=ReturnDocument.AFTER, session=session
+        )
+        if summary is None:
+            continue
+
+        # $max cannot go back: if the latest expense was moved earlier, renamed or removed, look it up again
+        last = summary.get("lastExpense") or {}
+        if owned_before and last.get("expenseId") == before["_id"]:
+            if not owns_after or last != _last_expense(after):
+                _refresh_last_expense(email, session)
+
+def _refresh_last_expense(email: str, session=None):
+    from archive import archive_years, archive_collection
+
+    sort = [("date", -1), ("_id", -1)]
+    latest = expenses_collection.find_one({"userEmail": email}, sort=sort, session=session)
+    if latest is None:
+        # Archives only hold older expenses, newest year first
+        for year in reversed(archive_years()):
+            latest = archive_collection(year).find_one({"userEmail": email}, sort=sort, session=session)
+            if latest:
+                break
+    user_summaries_collection.update_one(
+        {"_id": email},
+        {
+            "$set": {"lastExpense": _last_expense(latest) if latest else None, "updatedAt": datetime.utcnow()},
+            "$inc": {"revision": 1}
+        },
+        session=session
+    )
+
+# ---------------- READ ----------------
+def _empty_summary(email: str) -> dict:
+    return {
+        "_id": email,
+        "userEmail": email,
+        "expenseCount": 0,
+        "totalClaimed": 0.0,
+        "pendingBills": 0,
+        "byType": {},
+        "lastExpense": None,
+    }
+
+def _add(summary: dict, expense: dict):
+    for path, value in _contribution(expense).items():
+        target = summary
+        *parents, leaf = path.split(".")
+        for key in parents:
+            target = target.setdefault(key, {})
+        target[leaf] = target.get(leaf, 0) + value
+    last = _last_expense(expense)
+    current = summary["lastExpense"]
+    if current is None or (last["date"], last["expenseId"]) > (current["date"], current["expenseId"]):
+        summary["lastExpense"] = last
+
+_PROJECTION = {"userEmail": 1, "amount": 1, "expenseTypeId": 1, "billAvailable": 1, "date": 1, "title": 1}
+
+def rebuild_user_summary(email: str) -> dict:
+    """ Computes one user's summary from their expenses and stores it """
+    from archive import find_across_tiers
+
+    summary = _empty_summary(email)
+    for expense in find_across_tiers({"userEmail": email}, _PROJECTION):
+        _add(summary, expense)
+    if summary["expenseCount"]:
+        summary["updatedAt"] = datetime.utcnow()
+        fields = {key: value for key, value in summary.items() if key != "_id"}
+        user_summaries_collection.update_one({"_id": email}, {"$set": fields, "$inc": {"revision": 1}}, upsert=True)
+    return summary
+
+def get_user_summary(email: str) -> dict:
+    summary = user_summaries_collection.for_reads().find_one({"_id": email})
+    if summary is None:
+        # First visit (or a user created before summaries existed)
+        summary = rebuild_user_summary(email)
+
+    type_names = {
+        str(t["_id"]): t.get("ExpenseTypeName")
+        for t in expense_type_collection.find({}, {"ExpenseTypeName": 1})
+    }
+    by_type = [
+        {
+            "expenseTypeId": type_id,
+            "expenseTypeName": type_names.get(type_id),
+            "count": totals.get("count", 0),
+            "amount": round(totals.get("amount", 0), 2),
+        }
+        for type_id, totals in (summary.get("byType") or {}).items()
+        if totals.get("count")
+    ]
+    by_type.sort(key=lambda t: t["amount"], reverse=True)
+
+    last = summary.get("lastExpense")
+    return {
+        "userEmail": email,
+        "expenseCount": summary.get("expenseCount", 0),
+        "totalClaimed": round(summary.get("totalClaimed", 0), 2),
+        "pendingBills": summary.get("pendingBills", 0),
+        "byType": by_type,
+        "lastExpense": {**last, "expenseId": str(last["expenseId"])} if last else None,
+        "updatedAt": summary.get("updatedAt"),
+    }
+
+# ---------------- CONSISTENCY CHECK ----------------
+def _same(stored: dict, expected: dict) -> bool:
+    def types(summary):
+        return {
+            type_id: (totals.get("count", 0), round(totals.get("amount", 0), 2))
+            for type_id, totals in (summary.get("byType") or {}).items()
+            if totals.get("count") or abs(totals.get("amount", 0)) > AMOUNT_TOLERANCE
+        }
+
+    return (
+        stored.get("expenseCount") == expected["expenseCount"]
+        and stored.get("pendingBills") == expected["pendingBills"]
+        and abs(stored.get("totalClaimed", 0) - expected["totalClaimed"]) <= AMOUNT_TOLERANCE
+        and types(stored) == types(expected)
+        and stored.get("lastExpense") == expected["lastExpense"]
+    )
+
+def check_user_summaries(repair: bool = True) -> dict:
+    """
+    Recomputes every summary from the expenses (all tiers) and compares.
+    Repairs only summaries that did not change while the check ran; the next
+    run picks up the rest.
+    """
+    from archive import find_across_tiers
+
+    # Taken before the scan: a summary whose revision moved since then saw a
+    # write the scan may have missed, so its recomputed totals can be stale
+    snapshot = {s["_id"]: s.get("revision") for s in user_summaries_collection.find({}, {"revision": 1})}
+
+    expected = {}
+    for expense in find_across_tiers({}, _PROJECTION):
+        email = expense.get("userEmail")
+        if email:
+            _add(expected.setdefault(email, _empty_summary(email)), expense)
+
+    drifted, ops = [], []
+    now = datetime.utcnow()
+    for stored in user_summaries_collection.find({}):
+        email = stored["_id"]
+        summary = expected.pop(email, None)
+        if email not in snapshot:
+            # Created while the check ran (rebuild_user_summary), complete by construction
+            continue
+        unchanged = {"_id": email, "revision": snapshot[email]}
+        if summary is None:
+            if stored.get("expenseCount") or stored.get("lastExpense"):
+                drifted.append(email)
+                ops.append(DeleteOne(unchanged))
+        elif not _same(stored, summary):
+            drifted.append(email)
+            ops.append(ReplaceOne(unchanged, {**summary, "updatedAt": now, "revision": (snapshot[email] or 0) + 1}))
+    # Users with expenses but no summary yet; never replaces one created meanwhile
+    for email, summary in expected.items():
+        drifted.append(email)
+        fields = {key: value for key, value in summary.items() if key != "_id"}
+        ops.append(UpdateOne({"_id": email}, {"$setOnInsert": {**fields, "updatedAt": now, "revision": 1}}, upsert=True))
+
+    repaired = 0
+    if repair and ops:
+        result = user_summaries_collection.bulk_write(ops, ordered=False)
+        repaired = result.modified_count + result.deleted_count + result.upserted_count
+    result = {"drifted": len(drifted), "repaired": repaired, "users": drifted[:50]}
+    print(f"[user summaries] {result}")
+    return result